@@ -5,7 +5,7 @@ from api.models import (
     Attribute, ShippingNote,
     ProductAttribute, Order,
     OrderShop, Cart, CartProduct,
-    OrderProduct,
+    OrderProduct, OutboxEvent, ProductImport, ProductTombstone,
 )
 
 
@@ -62,3 +62,18 @@ class OrderShopAdmin(admin.ModelAdmin):
 @admin.register(OrderProduct)
 class OrderProductAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    pass
+
+
+@admin.register(ProductImport)
+class ProductImportAdmin(admin.ModelAdmin):
+    pass
+
+
+@admin.register(ProductTombstone)
+class ProductTombstoneAdmin(admin.ModelAdmin):
+    pass
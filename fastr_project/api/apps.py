@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        import api.signals  # pylint: disable=import-outside-toplevel,unused-import
+        import api.metrics  # pylint: disable=import-outside-toplevel,unused-import
+        import api.databases  # pylint: disable=import-outside-toplevel,unused-import
@@ -0,0 +1,105 @@
+"""
+Async variants of the public catalog reads, served by the ASGI application.
+
+Under ASGI Django runs sync views on one thread shared by the whole process,
+because they are thread sensitive, so concurrent requests queue up behind each
+other's queries. The views here run the same DRF views on the thread pool of
+the event loop instead, so catalog reads wait on the database side by side.
+Django 4.0 has no async ORM, the queries themselves stay synchronous.
+"""
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from django.urls import URLPattern, URLResolver
+
+from api.metrics import counting_queries
+
+# Routes served by async views under ASGI
+ASYNC_ROUTES = frozenset({
+    'api:categories-list',
+    'api:categories-detail',
+    'api:shops-list',
+    'api:shops-detail',
+    'api:products-list',
+    'api:products-detail',
+})
+
+
+def _respond(view, request, *args, **kwargs):
+    # Pool threads hold their own connections, closed as Django closes them for request threads
+    close_old_connections()
+    try:
+        with counting_queries():
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """
+    Async view running the sync view and rendering its response on the thread pool.
+    """
+    respond = sync_to_async(functools.partial(_respond, view), thread_sensitive=False)
+
+    @functools.wraps(view)
+    async def handle(request, *args, **kwargs):
+        return await respond(request, *args, **kwargs)
+
+    return handle
+
+
+def async_urlpatterns(patterns, routes=ASYNC_ROUTES, namespace=''):
+    """
+    Copy of URL patterns with views of given routes replaced by async views.
+    Route names and namespaces are kept, so URLs reverse the same way.
+    """
+    result = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            pattern = URLResolver(
+                pattern.pattern,
+                async_urlpatterns(
+                    pattern.url_patterns,
+                    routes,
+                    f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace,
+                ),
+                pattern.default_kwargs,
+                pattern.app_name,
+                pattern.namespace,
+            )
+        elif f'{namespace}{pattern.name}' in routes:
+            pattern = URLPattern(
+                pattern.pattern, async_view(pattern.callback), pattern.default_args, pattern.name,
+            )
+        result.append(pattern)
+    return result
+
+
+class AsyncCatalogHandler(ASGIHandler):
+    """
+    ASGI handler resolving requests with fastr.asgi_urls, which serves catalog
+    reads with async views. Queries of sync views are counted on the thread they run on.
+    """
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = 'fastr.asgi_urls'
+        return request, error_response
+
+    def make_view_atomic(self, view):
+        view = super().make_view_atomic(view)
+        if asyncio.iscoroutinefunction(view):
+            return view
+
+        @functools.wraps(view)
+        def counted(*args, **kwargs):
+            with counting_queries():
+                return view(*args, **kwargs)
+
+        return counted
@@ -0,0 +1,109 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+IDENTITY_KEY = 'api:identity:{}'
+
+# User fields authentication needs, the only ones kept in the cache
+IDENTITY_FIELDS = ('id', 'is_active', 'type')
+
+Identity = namedtuple('Identity', ('user', 'shop_id', 'cart_id'))
+
+
+def _identity_user(values):
+    """
+    User with IDENTITY_FIELDS loaded from the given values and the other fields deferred.
+    """
+    user_model = get_user_model()
+    values = dict(zip(IDENTITY_FIELDS, values))
+    # Loaded values are passed in the order of model fields
+    return user_model.from_db(DEFAULT_DB_ALIAS, IDENTITY_FIELDS, [
+        values[field.attname]
+        for field in user_model._meta.concrete_fields
+        if field.attname in values
+    ])
+
+
+def load_identity(user_id):
+    """
+    User with ids of their shop and cart, from the shared cache or with one
+    joined query. Returns None if there is no such user. The user has only
+    IDENTITY_FIELDS loaded, other fields are read from the primary on first access.
+    """
+    key = IDENTITY_KEY.format(user_id)
+    values = cache.get(key)
+    if values is None:
+        values = (
+            get_user_model().objects.filter(id=user_id)
+            .values_list(*IDENTITY_FIELDS, 'shop__id', 'cart__id')
+            .first()
+        )
+        if values is None:
+            return None
+        cache.set(key, values, settings.IDENTITY_CACHE_TIMEOUT)
+
+    *user_values, shop_id, cart_id = values
+    return Identity(_identity_user(user_values), shop_id, cart_id)
+
+
+def get_identity(request):
+    """
+    Identity of the request user, resolved once per request.
+    """
+    identity = getattr(request, '_identity', None)
+    if identity is None:
+        if request.user.is_authenticated:
+            identity = load_identity(request.user.id)
+        if identity is None:
+            identity = Identity(request.user, None, None)
+        request._identity = identity
+    return identity
+
+
+def invalidate_identity(user_id):
+    """
+    Drops the cached identity now, for the rest of the current transaction,
+    and again on commit, in case a concurrent request cached it in between.
+    """
+    key = IDENTITY_KEY.format(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication loading the token user through the identity cache,
+    so authenticated requests do not query the user, shop and cart each time.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.identity = None
+
+    def authenticate(self, request):
+        self.identity = None
+        result = super().authenticate(request)
+        if result is not None:
+            request._identity = self.identity
+        return result
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as error:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from error
+
+        self.identity = load_identity(user_id)
+        if self.identity is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not self.identity.user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return self.identity.user
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+VERSION_KEY = 'api:cache:version:{}'
+INSTANCE_VERSION_KEY = 'api:cache:version:{}:{}'
+RESPONSE_KEY = 'api:cache:response:{}'
+STATS_KEYS = {'hits': 'api:cache:hits', 'misses': 'api:cache:misses'}
+
+
+def _version_key(model):
+    return VERSION_KEY.format(model._meta.label_lower)
+
+
+def get_versions(models):
+    """
+    Current cache versions of given models. Missing versions are initialized
+    with the current time, so a version evicted from the cache never comes
+    back with a value that older responses were stored under.
+    """
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*models):
+    """
+    Bumps cache versions of given models once the current transaction commits,
+    so responses cached in between can not outlive the change.
+    """
+    def bump():
+        for model in models:
+            key = _version_key(model)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def _instance_version_keys(model, pks):
+    return {pk: INSTANCE_VERSION_KEY.format(model._meta.label_lower, pk) for pk in pks}
+
+
+def get_instance_versions(model, pks):
+    """
+    Current cache versions of given instances, 0 for instances not changed
+    within CATALOG_CACHE_TIMEOUT.
+    """
+    keys = _instance_version_keys(model, pks)
+    versions = cache.get_many(keys.values())
+    return {pk: versions.get(key, 0) for pk, key in keys.items()}
+
+
+def invalidate_instances(model, pks):
+    """
+    Bumps cache versions of given instances once the current transaction commits,
+    for changes limited to a few instances, such as stock reservations. Versions
+    outlive the responses cached before the change, so they expire with them.
+    """
+    keys = _instance_version_keys(model, pks)
+
+    def bump():
+        version = time.time_ns()
+        cache.set_many(
+            {key: version for key in keys.values()}, timeout=settings.CATALOG_CACHE_TIMEOUT,
+        )
+
+    transaction.on_commit(bump)
+
+
+def _count(stat):
+    key = STATS_KEYS[stat]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_stats():
+    stats = cache.get_many(STATS_KEYS.values())
+    return {stat: stats.get(key, 0) for stat, key in STATS_KEYS.items()}
+
+
+def _etag(data):
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True).encode()
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+class CachedResponseMixin:
+    """
+    Caches serialized list and retrieve responses by absolute URL. Keys carry
+    versions of cache_models, which are bumped by api.signals on every change.
+    Responses also keep versions of the cache_instance_model instances they
+    contain and are refreshed once any of them changes.
+    """
+    cache_models = ()
+    cache_instance_model = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        versions = ':'.join(str(version) for version in get_versions(self.cache_models))
+        url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        key = RESPONSE_KEY.format(f'{versions}:{url}')
+
+        cached = cache.get(key)
+        if cached and cached[2]:
+            if get_instance_versions(self.cache_instance_model, cached[2]) != cached[2]:
+                cached = None
+
+        if cached:
+            _count('hits')
+            etag, data, _ = cached
+        else:
+            _count('misses')
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+            etag, data = _etag(response.data), response.data
+            instance_versions = self._instance_versions(data)
+            cache.set(key, (etag, data, instance_versions), timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+
+        response['ETag'] = etag
+        response['X-Cache'] = 'HIT' if cached else 'MISS'
+        return response
+
+    def _instance_versions(self, data):
+        if self.cache_instance_model is None or not isinstance(data, dict):
+            return {}
+        instances = data.get('results', [data])
+        pks = [
+            instance['id'] for instance in instances
+            if isinstance(instance, dict) and 'id' in instance
+        ]
+        return get_instance_versions(self.cache_instance_model, pks)
@@ -0,0 +1,107 @@
+import base64
+import binascii
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from rest_framework import serializers
+
+from api.eager_loading import get_eager_loading_plan
+from api.models import ProductTombstone
+
+
+def encode_token(changed_at, product_id):
+    return base64.urlsafe_b64encode(f'{changed_at.isoformat()}|{product_id}'.encode()).decode()
+
+
+def decode_token(token):
+    """
+    Returns the change time and product id the token points at.
+    """
+    try:
+        changed_at, product_id = base64.urlsafe_b64decode(token.encode()).decode().split('|')
+        changed_at, product_id = datetime.fromisoformat(changed_at), int(product_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise serializers.ValidationError('Invalid token.') from error
+    if timezone.is_naive(changed_at):
+        raise serializers.ValidationError('Invalid token.')
+    return changed_at, product_id
+
+
+class ProductChangesParamsSerializer(serializers.Serializer):
+    since = serializers.CharField(required=False)
+    shop = serializers.IntegerField(required=False)
+    page_size = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.MAX_PAGE_SIZE,
+        default=settings.REST_FRAMEWORK['PAGE_SIZE'],
+    )
+
+    @staticmethod
+    def validate_since(since):
+        return decode_token(since)
+
+
+def _after(queryset, time_field, id_field, since):
+    if since is None:
+        return queryset
+    changed_at, product_id = since
+    return queryset.filter(
+        Q(**{f'{time_field}__gt': changed_at}) |
+        Q(**{time_field: changed_at, f'{id_field}__gt': product_id})
+    )
+
+
+def get_product_changes(
+    products, serializer_class, context=None, since=None, shop=None, page_size=None,
+):
+    """
+    Products changed and deleted after the token position, ordered by change
+    time and product id. Changes younger than CHANGES_SETTLE_LAG are held back,
+    so that transactions committing late can not slip behind a returned token.
+    """
+    page_size = page_size or settings.REST_FRAMEWORK['PAGE_SIZE']
+    settled = timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_LAG)
+
+    tombstones = ProductTombstone.objects.filter(deleted_at__lte=settled)
+    products = products.filter(updated_at__lte=settled)
+    if shop is not None:
+        products = products.filter(shop=shop)
+        tombstones = tombstones.filter(shop_id=shop)
+
+    products = list(
+        get_eager_loading_plan(serializer_class).apply(_after(products, 'updated_at', 'id', since))
+        .order_by('updated_at', 'id')[:page_size]
+    )
+    tombstones = list(
+        _after(tombstones, 'deleted_at', 'product_id', since)
+        .order_by('deleted_at', 'product_id')[:page_size]
+    )
+
+    serialized = serializer_class(products, many=True, context=context).data
+    changes = sorted(
+        [(product.updated_at, product.id, data) for product, data in zip(products, serialized)] +
+        [(tombstone.deleted_at, tombstone.product_id, None) for tombstone in tombstones],
+        key=lambda change: change[:2],
+    )[:page_size]
+
+    if changes:
+        next_token = encode_token(*changes[-1][:2])
+    else:
+        next_token = encode_token(*since) if since else None
+
+    return {
+        'results': [
+            {
+                'id': product_id,
+                'deleted': data is None,
+                'changed_at': changed_at,
+                'product': data,
+            }
+            for changed_at, product_id, data in changes
+        ],
+        'next': next_token,
+        'has_more': len(products) == page_size or len(tombstones) == page_size,
+    }
@@ -0,0 +1,135 @@
+"""
+Database routing and connection upkeep.
+
+Reads of the public catalog views and of read-only Celery tasks go to the
+REPLICA_DATABASE alias, if one is configured; everything else uses the primary.
+Users who have just written keep reading from the primary for
+READ_YOUR_WRITES_TIMEOUT seconds, so their own changes never disappear behind
+replication lag. Persistent connections are checked before reuse.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.dispatch import receiver
+
+from celery.signals import task_prerun, task_postrun
+
+from rest_framework.permissions import SAFE_METHODS
+
+STICKY_KEY = 'api:databases:sticky:{}'
+
+_read_database = ContextVar('read_database', default=None)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the database chosen for the current context, writes and
+    migrations to the primary.
+    """
+    @staticmethod
+    def db_for_read(model, **hints):
+        return _read_database.get()
+
+    @staticmethod
+    def db_for_write(model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    @staticmethod
+    def allow_relation(obj1, obj2, **hints):
+        return True
+
+    @staticmethod
+    def allow_migrate(db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def stick_to_primary(user):
+    if settings.REPLICA_DATABASE and user.is_authenticated:
+        cache.set(STICKY_KEY.format(user.id), True, settings.READ_YOUR_WRITES_TIMEOUT)
+
+
+def is_sticky(user):
+    return user.is_authenticated and cache.get(STICKY_KEY.format(user.id), False)
+
+
+def get_or_primary(queryset, **lookups):
+    """
+    Object from the routed database, or from the primary if replication has not caught up yet.
+    """
+    try:
+        return queryset.get(**lookups)
+    except queryset.model.DoesNotExist:
+        return queryset.using(DEFAULT_DB_ALIAS).get(**lookups)
+
+
+def list_or_primary(queryset):
+    """
+    Objects from the routed database, or from the primary if replication has not caught up yet.
+    """
+    return list(queryset) or list(queryset.using(DEFAULT_DB_ALIAS))
+
+
+class ReadReplicaMixin:
+    """
+    Reads safe requests from the replica, unless the user wrote recently.
+    """
+    _replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            settings.REPLICA_DATABASE and request.method in SAFE_METHODS
+            and not is_sticky(request.user)
+        ):
+            self._replica_token = _read_database.set(settings.REPLICA_DATABASE)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._replica_token is not None:
+            _read_database.reset(self._replica_token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReadYourWritesMixin:
+    """
+    Keeps the user reading from the primary for a while after a successful write.
+    """
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            stick_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+_task_tokens = {}
+
+
+@task_prerun.connect
+def task_reads_replica(task_id=None, task=None, **kwargs):
+    if getattr(task, 'reads_replica', False):
+        _task_tokens[task_id] = _read_database.set(settings.REPLICA_DATABASE)
+
+
+@task_postrun.connect
+def task_finished(task_id=None, **kwargs):
+    token = _task_tokens.pop(task_id, None)
+    if token is not None:
+        _read_database.reset(token)
+
+
+@receiver(request_started)
+@task_prerun.connect
+def check_connections(**kwargs):
+    """
+    Closes persistent connections which stopped working since their last use,
+    so they are reopened on the first query instead of failing it.
+    """
+    if not settings.DATABASE_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if not connection.is_usable():
+            connection.close()
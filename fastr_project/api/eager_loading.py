@@ -0,0 +1,112 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+class EagerLoadingPlan:
+    """
+    Relations a serializer reads from its instances: to-one relations are joined
+    with select_related, to-many relations are fetched with one Prefetch each,
+    whose queryset carries the plan of the nested serializer.
+    """
+    def __init__(self, select_related=(), prefetch_related=()):
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+
+    def apply(self, queryset):
+        """
+        Prefetches already declared on the queryset take precedence over the plan.
+        """
+        declared = {
+            lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+            for lookup in queryset._prefetch_related_lookups  # pylint: disable=protected-access
+        }
+        prefetch_related = [
+            lookup for lookup in self.prefetch_related
+            if lookup.prefetch_to not in declared
+        ]
+
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+@lru_cache(maxsize=None)
+def get_eager_loading_plan(serializer_class):
+    serializer = serializer_class()
+    select_related, prefetch_related = [], []
+    _collect(serializer, serializer.Meta.model, '', select_related, prefetch_related)
+    return EagerLoadingPlan(select_related, prefetch_related)
+
+
+def _collect(serializer, model, prefix, select_related, prefetch_related):
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        if field.source == '*':
+            if isinstance(field, BaseSerializer):
+                _collect(field, model, prefix, select_related, prefetch_related)
+            continue
+
+        current_model, path = model, []
+        for position, attr in enumerate(field.source_attrs, start=1):
+            try:
+                model_field = current_model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                break
+            if not model_field.is_relation:
+                break
+
+            is_last = position == len(field.source_attrs)
+            lookup = prefix + '__'.join(path + [attr])
+
+            if model_field.one_to_many or model_field.many_to_many:
+                related_model = model_field.related_model
+                queryset = related_model._default_manager.all()
+                if is_last and isinstance(field, ListSerializer):
+                    queryset = get_eager_loading_plan(type(field.child)).apply(queryset)
+                prefetch_related.append(Prefetch(lookup, queryset=queryset))
+                path = []
+                break
+
+            if is_last and _reads_pk_only(field, model_field):
+                break
+
+            path.append(attr)
+            current_model = model_field.related_model
+
+            if is_last and isinstance(field, BaseSerializer):
+                select_related.append(lookup)
+                _collect(field, current_model, lookup + '__', select_related, prefetch_related)
+                path = []
+
+        if path:
+            select_related.append(prefix + '__'.join(path))
+
+
+def _reads_pk_only(field, model_field):
+    """
+    Primary key related fields read the foreign key column of the instance itself.
+    """
+    return (
+        model_field.concrete and
+        isinstance(field, RelatedField) and
+        not isinstance(field, ManyRelatedField) and
+        field.use_pk_only_optimization()
+    )
+
+
+class EagerLoadingMixin:
+    """
+    Loads everything the view serializer reads along with the view queryset.
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return get_eager_loading_plan(self.get_serializer_class()).apply(queryset)
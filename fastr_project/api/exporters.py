@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from rest_framework.decorators import action
+
+from api.models import Attribute, ProductAttribute
+from api.renderers import CSVRenderer, NDJSONRenderer
+
+
+# Columns of exported products, attribute columns follow them in CSV exports
+EXPORT_FIELDS = ('id', 'shop', 'sku', 'name', 'description', 'category', 'price', 'stock_quantity')
+
+
+def iter_products(queryset):
+    """
+    Yields products with their attribute values by name. Products and attributes
+    are read with two server-side cursors ordered by product, merged as they go.
+    """
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    products = (
+        queryset.prefetch_related(None)
+        .select_related('shop', 'category')
+        .order_by('id')
+        .iterator(chunk_size=chunk_size)
+    )
+    attributes = (
+        ProductAttribute.objects.filter(product__in=queryset.values('id'))
+        .order_by('product_id')
+        .values_list('product_id', 'attribute__name', 'value')
+        .iterator(chunk_size=chunk_size)
+    )
+
+    attribute = next(attributes, None)
+    for product in products:
+        product_attributes = {}
+        while attribute is not None and attribute[0] <= product.id:
+            if attribute[0] == product.id:
+                product_attributes[attribute[1]] = attribute[2]
+            attribute = next(attributes, None)
+
+        yield {
+            'id': product.id,
+            'shop': product.shop.name,
+            'sku': product.sku,
+            'name': product.name,
+            'description': product.description,
+            'category': product.category.name,
+            'price': str(product.price),
+            'stock_quantity': product.stock_quantity,
+            'attributes': product_attributes,
+        }
+
+
+def _flatten(row):
+    attributes = row.pop('attributes')
+    return {**row, **attributes}
+
+
+class ProductExportMixin:
+    """
+    Streams filtered products of the view as NDJSON or CSV, chosen by the format query parameter.
+    """
+    @action(detail=False, renderer_classes=(NDJSONRenderer, CSVRenderer))
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        renderer = request.accepted_renderer
+        rows = iter_products(queryset)
+
+        if isinstance(renderer, CSVRenderer):
+            attribute_names = list(
+                Attribute.objects.filter(product_attributes__product__in=queryset.values('id'))
+                .distinct()
+                .order_by('name')
+                .values_list('name', flat=True)
+            )
+            header = list(EXPORT_FIELDS) + attribute_names
+            rows = (_flatten(row) for row in rows)
+        else:
+            header = None
+
+        response = StreamingHttpResponse(
+            renderer.stream(rows, header),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{renderer.format}"'
+        return response
@@ -0,0 +1,246 @@
+import re
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Count, DecimalField, Exists, OuterRef, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+from api.models import ORDER_STATUS_CHOICES, Product, ProductAttribute
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Full-text search over the product search vector, ranked by relevance.
+    Every search word matches as a prefix. Databases other than PostgreSQL
+    fall back to the default lookups over search_fields.
+
+    The float rank is rounded to a fixed scale numeric, so the rank of the
+    last result round-trips exactly through the pagination cursor.
+    """
+    rank_field = DecimalField(max_digits=12, decimal_places=6)
+
+    def filter_queryset(self, request, queryset, view):
+        words = self.get_search_words(request)
+        if not words or not self.uses_search_vector(queryset):
+            return super().filter_queryset(request, queryset, view)
+
+        query = SearchQuery(
+            ' & '.join(f'{word}:*' for word in words),
+            search_type='raw',
+            config=settings.SEARCH_CONFIG,
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), self.rank_field),
+        )
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Cursor pagination pages ranked results by rank instead of its own ordering,
+        results of the same rank are paged by id.
+        """
+        if self.get_search_words(request) and self.uses_search_vector(queryset):
+            return ('-rank', 'id')
+        return view.pagination_class.ordering
+
+    def get_search_words(self, request):
+        return [
+            word for term in self.get_search_terms(request)
+            for word in re.findall(r'\w+', term)
+        ]
+
+    @staticmethod
+    def uses_search_vector(queryset):
+        return connections[queryset.db].vendor == 'postgresql'
+
+
+class AttributeValueField(serializers.CharField):
+    """
+    Attribute predicate in the form of <attribute id>:<value>.
+    """
+    def to_internal_value(self, data):
+        attribute, separator, value = super().to_internal_value(data).partition(':')
+        if not separator or not attribute.isdigit() or not value:
+            raise serializers.ValidationError('Must be in the form of <attribute id>:<value>.')
+        return int(attribute), value
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    category = serializers.ListField(child=serializers.IntegerField(), required=False)
+    shop = serializers.ListField(child=serializers.IntegerField(), required=False)
+    price_min = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    price_max = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    attribute = serializers.ListField(child=AttributeValueField(), required=False)
+
+
+class ProductFilter(BaseFilterBackend):
+    """
+    Filters products by categories, shops, price range and attribute values.
+    Repeated category or shop parameters match any of the given ids. Repeated
+    attribute parameters match any value of the same attribute and all of
+    the different attributes.
+    """
+    def filter_queryset(self, request, queryset, view):
+        params = ProductFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        if params.get('category'):
+            queryset = queryset.filter(category__in=params['category'])
+        if params.get('shop'):
+            queryset = queryset.filter(shop__in=params['shop'])
+        if params.get('price_min') is not None:
+            queryset = queryset.filter(price__gte=params['price_min'])
+        if params.get('price_max') is not None:
+            queryset = queryset.filter(price__lte=params['price_max'])
+
+        attribute_values = defaultdict(list)
+        for attribute, value in params.get('attribute', ()):
+            attribute_values[attribute].append(value)
+
+        for attribute, values in attribute_values.items():
+            queryset = queryset.filter(Exists(
+                ProductAttribute.objects.filter(
+                    product=OuterRef('pk'), attribute=attribute, value__in=values,
+                )
+            ))
+
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': name,
+                'required': False,
+                'in': 'query',
+                'description': description,
+                'schema': schema,
+            }
+            for name, description, schema in (
+                ('category', 'Category id, repeatable',
+                 {'type': 'array', 'items': {'type': 'integer'}}),
+                ('shop', 'Shop id, repeatable', {'type': 'array', 'items': {'type': 'integer'}}),
+                ('price_min', 'Lowest price', {'type': 'number'}),
+                ('price_max', 'Highest price', {'type': 'number'}),
+                ('attribute', '<attribute id>:<value>, repeatable',
+                 {'type': 'array', 'items': {'type': 'string'}}),
+            )
+        ]
+
+
+class OrderShopFilterSerializer(serializers.Serializer):
+    status = serializers.ListField(
+        child=serializers.ChoiceField(ORDER_STATUS_CHOICES), required=False,
+    )
+    created_after = serializers.DateField(required=False)
+    created_before = serializers.DateField(required=False)
+
+
+class OrderShopFilter(BaseFilterBackend):
+    """
+    Filters shop orders by statuses and by order creation dates, both dates
+    are included. Repeated status parameters match any of the given statuses.
+    """
+    def filter_queryset(self, request, queryset, view):
+        params = OrderShopFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        if params.get('status'):
+            queryset = queryset.filter(status__in=params['status'])
+        if params.get('created_after'):
+            queryset = queryset.filter(
+                order__created_at__gte=self._day_start(params['created_after'])
+            )
+        if params.get('created_before'):
+            queryset = queryset.filter(
+                order__created_at__lt=self._day_start(params['created_before'] + timedelta(days=1))
+            )
+
+        return queryset
+
+    @staticmethod
+    def _day_start(date):
+        return timezone.make_aware(datetime.combine(date, time.min))
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': name,
+                'required': False,
+                'in': 'query',
+                'description': description,
+                'schema': schema,
+            }
+            for name, description, schema in (
+                ('status', 'Order status, repeatable', {
+                    'type': 'array',
+                    'items': {'type': 'string', 'enum': [key for key, _ in ORDER_STATUS_CHOICES]},
+                }),
+                ('created_after', 'Orders created on or after the date',
+                 {'type': 'string', 'format': 'date'}),
+                ('created_before', 'Orders created on or before the date',
+                 {'type': 'string', 'format': 'date'}),
+            )
+        ]
+
+
+def get_product_facets(products):
+    """
+    Counts given products per category and per attribute value in one query.
+    """
+    product_ids = products.values('id')
+    facet_fields = ('facet', 'facet_id', 'facet_name', 'facet_value')
+
+    category_facets = (
+        Product.objects.filter(id__in=product_ids)
+        .annotate(
+            facet=Value('category'),
+            facet_id=F('category_id'),
+            facet_name=F('category__name'),
+            facet_value=Value(''),
+        )
+        .values(*facet_fields)
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    attribute_facets = (
+        ProductAttribute.objects.filter(product__in=product_ids)
+        .annotate(
+            facet=Value('attribute'),
+            facet_id=F('attribute_id'),
+            facet_name=F('attribute__name'),
+            facet_value=F('value'),
+        )
+        .values(*facet_fields)
+        .annotate(count=Count('product_id'))
+        .order_by()
+    )
+
+    categories, attributes = [], {}
+    for row in category_facets.union(attribute_facets, all=True):
+        if row['facet'] == 'category':
+            categories.append(
+                {'id': row['facet_id'], 'name': row['facet_name'], 'count': row['count']},
+            )
+        else:
+            attribute = attributes.setdefault(
+                row['facet_id'], {'id': row['facet_id'], 'name': row['facet_name'], 'values': []},
+            )
+            attribute['values'].append({'value': row['facet_value'], 'count': row['count']})
+
+    for attribute in attributes.values():
+        attribute['values'].sort(key=lambda value: (-value['count'], value['value']))
+
+    return {
+        'categories': sorted(
+            categories, key=lambda category: (-category['count'], category['name']),
+        ),
+        'attributes': sorted(attributes.values(), key=lambda attribute: attribute['name']),
+    }
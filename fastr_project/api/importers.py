@@ -0,0 +1,329 @@
+import csv
+import io
+import json
+from itertools import chain, islice
+
+import ijson
+import yaml
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from rest_framework import serializers
+
+from api import cache
+from api.models import Attribute, Category, Product, ProductAttribute, ProductImport
+
+
+# File extensions of supported price list formats
+FORMAT_EXTENSIONS = {
+    'csv': 'csv',
+    'json': 'json',
+    'ndjson': 'ndjson',
+    'jsonl': 'ndjson',
+    'yaml': 'yaml',
+    'yml': 'yaml',
+}
+
+PRODUCT_FIELDS = ('sku', 'name', 'description', 'category', 'price', 'stock_quantity')
+
+# Columns of catalog exports that are not imported
+IGNORED_COLUMNS = ('id', 'shop')
+
+# Row errors kept on the import, the rest are only counted as processed
+MAX_ERRORS = 100
+
+
+class PriceListError(Exception):
+    """
+    Price list file can not be read at all.
+    """
+
+
+# Readers take the binary price list file and yield its rows as they read it,
+# so the file is never loaded into memory as a whole.
+
+def read_csv(file):
+    """
+    Product fields are read from their columns, any other column is an attribute.
+    """
+    rows = csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+    for row in rows:
+        yield {
+            **{field: row[field] for field in PRODUCT_FIELDS if field in row},
+            'attributes': {
+                name: value for name, value in row.items()
+                if name and name not in PRODUCT_FIELDS + IGNORED_COLUMNS and value
+            },
+        }
+
+
+def read_ndjson(file):
+    for line in file:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def read_json(file):
+    """
+    Products are parsed one at a time from the top level array. Numbers are
+    parsed as decimals, which the row serializer takes as they are.
+    """
+    events = ijson.parse(file)
+    try:
+        first = next(events, (None, None, None))
+        if first[1] != 'start_array':
+            # Syntax errors are reported first, as for files read at once
+            for _ in events:
+                pass
+            raise PriceListError('JSON price list must be an array of products.')
+        yield from ijson.items(chain([first], events), 'item')
+    except ijson.JSONError as error:
+        raise PriceListError(f'Invalid JSON: {error}') from error
+
+
+def read_yaml(file):
+    """
+    Products are composed one node at a time from the top level sequence.
+    """
+    loader = yaml.SafeLoader(file)
+    try:
+        loader.get_event()
+        if loader.check_event(yaml.StreamEndEvent):
+            raise PriceListError('YAML price list must be a sequence of products.')
+        loader.get_event()
+        if not loader.check_event(yaml.SequenceStartEvent):
+            raise PriceListError('YAML price list must be a sequence of products.')
+        loader.get_event()
+        while not loader.check_event(yaml.SequenceEndEvent):
+            yield loader.construct_document(loader.compose_node(None, None))
+        loader.get_event()
+        loader.get_event()
+        if not loader.check_event(yaml.StreamEndEvent):
+            raise PriceListError('YAML price list must be a single document.')
+    except yaml.YAMLError as error:
+        raise PriceListError(f'Invalid YAML: {error}') from error
+    finally:
+        loader.dispose()
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'ndjson': read_ndjson,
+    'yaml': read_yaml,
+}
+
+
+class ProductImportRowSerializer(serializers.ModelSerializer):
+    category = serializers.CharField()
+    attributes = serializers.DictField(child=serializers.CharField(max_length=100), required=False)
+
+    class Meta:
+        model = Product
+        fields = ('sku', 'name', 'description', 'category', 'price', 'stock_quantity', 'attributes')
+
+    def validate_category(self, name):
+        category_id = self.context['categories'].get(name)
+        if category_id is None:
+            raise serializers.ValidationError(
+                f'Failed! Category with name: {name}, does not exist!'
+            )
+        return category_id
+
+    @staticmethod
+    def validate_attributes(attributes):
+        max_length = Attribute._meta.get_field('name').max_length
+        for name in attributes:
+            if len(name) > max_length:
+                raise serializers.ValidationError(
+                    f'Failed! Attribute name: {name}, is longer than {max_length} characters!'
+                )
+        return attributes
+
+
+class ProductImporter:
+    """
+    Upserts products of the price list by (shop, sku) in chunks, one transaction each.
+    Categories and attributes are resolved by name, unknown attributes are created.
+    Chunks are read as they are imported, a file turning out to be malformed keeps
+    the chunks imported before.
+    """
+    product_fields = ('name', 'description', 'category', 'price', 'stock_quantity', 'updated_at')
+
+    def __init__(self, product_import):
+        self.product_import = product_import
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.attributes = dict(Attribute.objects.values_list('name', 'id'))
+        self.errors = []
+
+    def run(self):
+        try:
+            with self.product_import.file.open('rb') as file:
+                rows = enumerate(READERS[self.product_import.format](file), start=1)
+                while True:
+                    chunk = list(islice(rows, settings.PRODUCT_IMPORT_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    self.import_chunk(chunk)
+        finally:
+            cache.invalidate(Product, ProductAttribute, Attribute)
+
+    def import_chunk(self, chunk):
+        rows = {}
+        for number, row in chunk:
+            serializer = ProductImportRowSerializer(
+                data=row, context={'categories': self.categories},
+            )
+            if not serializer.is_valid():
+                self.add_error(number, serializer.errors)
+                continue
+
+            sku = serializer.validated_data['sku']
+            if sku in rows:
+                self.add_error(number, {'sku': [
+                    f'Failed! Product with that SKU is already in row {rows[sku][0]}!'
+                ]})
+            else:
+                rows[sku] = (number, serializer.validated_data)
+
+        with transaction.atomic():
+            rows = self.exclude_taken_names(rows)
+            products = self.upsert_products(rows)
+            self.upsert_attributes(products, rows)
+            Product.objects.update_search_vector([product.id for product in products])
+
+            created = sum(1 for product in products if product.created)
+            ProductImport.objects.filter(id=self.product_import.id).update(
+                processed=F('processed') + len(chunk),
+                created=F('created') + created,
+                updated=F('updated') + len(products) - created,
+                errors=self.errors,
+            )
+
+    def add_error(self, number, errors):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'row': number, 'errors': errors})
+
+    def exclude_taken_names(self, rows):
+        """
+        Product names are unique per shop, rows taking the name of another product are rejected.
+        """
+        shop_id = self.product_import.shop_id
+        taken = set(
+            Product.objects.filter(shop=shop_id, name__in=[row['name'] for _, row in rows.values()])
+            .exclude(sku__in=rows)
+            .values_list('name', flat=True)
+        )
+
+        result = {}
+        for sku, (number, row) in rows.items():
+            if row['name'] in taken:
+                self.add_error(
+                    number, {'name': ['Failed! Shop already have product with that name!']},
+                )
+            else:
+                taken.add(row['name'])
+                result[sku] = (number, row)
+        return result
+
+    def upsert_products(self, rows):
+        shop_id = self.product_import.shop_id
+        existing = dict(
+            Product.objects.select_for_update()
+            .filter(shop=shop_id, sku__in=rows)
+            .values_list('sku', 'id')
+        )
+
+        now = timezone.now()
+        products = []
+        for sku, (_, row) in rows.items():
+            product = Product(
+                id=existing.get(sku),
+                shop_id=shop_id,
+                sku=sku,
+                name=row['name'],
+                description=row['description'],
+                category_id=row['category'],
+                price=row['price'],
+                stock_quantity=row['stock_quantity'],
+                updated_at=now,
+            )
+            product.created = product.id is None
+            products.append(product)
+
+        Product.objects.bulk_create([product for product in products if product.created])
+        Product.objects.bulk_update(
+            [product for product in products if not product.created], self.product_fields,
+        )
+        return products
+
+    def upsert_attributes(self, products, rows):
+        """
+        Sets attribute values given for the products, other attributes are kept.
+        """
+        self.create_attributes(
+            {name for _, row in rows.values() for name in row.get('attributes', {})}
+        )
+
+        existing = {
+            (product_attribute.product_id, product_attribute.attribute_id): product_attribute
+            for product_attribute in ProductAttribute.objects.filter(
+                product__in=[product.id for product in products if not product.created]
+            )
+        }
+
+        created, updated = [], []
+        for product in products:
+            for name, value in rows[product.sku][1].get('attributes', {}).items():
+                product_attribute = existing.get((product.id, self.attributes[name]))
+                if product_attribute is None:
+                    created.append(ProductAttribute(
+                        product_id=product.id, attribute_id=self.attributes[name], value=value,
+                    ))
+                elif product_attribute.value != value:
+                    product_attribute.value = value
+                    updated.append(product_attribute)
+
+        ProductAttribute.objects.bulk_create(created)
+        ProductAttribute.objects.bulk_update(updated, ['value'])
+
+    def create_attributes(self, names):
+        missing = names - set(self.attributes)
+        if missing:
+            Attribute.objects.bulk_create(
+                [Attribute(name=name) for name in missing], ignore_conflicts=True,
+            )
+            self.attributes.update(
+                Attribute.objects.filter(name__in=missing).values_list('name', 'id')
+            )
+
+
+def import_price_list(product_import_id):
+    """
+    Imports a pending price list. Returns False when the import was already taken.
+    """
+    imports = ProductImport.objects.filter(id=product_import_id)
+    if not imports.filter(status='pending').update(status='processing'):
+        return False
+
+    product_import = ProductImport.objects.get(id=product_import_id)
+    try:
+        ProductImporter(product_import).run()
+    except PriceListError as error:
+        imports.update(
+            status='failed', errors=[{'row': None, 'errors': str(error)}],
+            finished_at=timezone.now(),
+        )
+    except Exception:
+        imports.update(status='failed', finished_at=timezone.now())
+        raise
+    else:
+        product_import.file.delete(save=False)
+        imports.update(status='done', file='', finished_at=timezone.now())
+    return True
@@ -0,0 +1,427 @@
+import io
+import random
+import time
+import uuid
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from api import cache
+from api.models import (
+    Attribute, Cart, CartProduct, Category, Order, OrderProduct, OrderShop,
+    Product, ProductAttribute, ShippingNote, Shop,
+)
+from users.models import User
+
+
+ADJECTIVES = (
+    'Compact', 'Heavy', 'Smart', 'Classic', 'Wireless', 'Steel', 'Mini', 'Pro', 'Eco', 'Ultra',
+)
+NOUNS = (
+    'Lamp', 'Drill', 'Kettle', 'Router', 'Chair', 'Cable', 'Monitor', 'Valve', 'Pump', 'Sensor',
+)
+CITIES = ('Moscow', 'Kazan', 'Samara', 'Omsk', 'Tver', 'Perm', 'Ufa', 'Tula')
+
+# Shop statuses of orders younger and older than RECENT_DAYS, with weights
+RECENT_DAYS = 14
+RECENT_STATUSES = (
+    ('new', 4), ('confirmed', 3), ('assembled', 2), ('sent', 2), ('delivered', 1), ('canceled', 1),
+)
+PAST_STATUSES = (('delivered', 18), ('canceled', 2))
+
+
+class BulkWriter:
+    """
+    Inserts model instances in batches, primary keys included: COPY on PostgreSQL,
+    batched INSERTs elsewhere. Model save logic, auto_now fields and signals are bypassed.
+    """
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.buffers = defaultdict(list)
+        self.counts = defaultdict(int)
+
+    def add(self, obj):
+        buffer = self.buffers[type(obj)]
+        buffer.append(obj)
+        if len(buffer) >= self.batch_size:
+            self.flush(type(obj))
+
+    def flush(self, model=None):
+        for buffer_model in [model] if model else list(self.buffers):
+            buffer = self.buffers[buffer_model]
+            if buffer:
+                self._insert(buffer_model, buffer)
+                self.counts[buffer_model] += len(buffer)
+                buffer.clear()
+
+    def _insert(self, model, objs):
+        fields = model._meta.concrete_fields
+        rows = [
+            [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+            for obj in objs
+        ]
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                data = io.StringIO(''.join('\t'.join(map(_copy_value, row)) + '\n' for row in rows))
+                cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN', data)
+            else:
+                placeholders = ', '.join(['%s'] * len(fields))
+                cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+
+
+def _copy_value(value):
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+class SkewedChoice:
+    """
+    Picks indexes below n with Zipf-like weights: the item of rank r is
+    picked r ** skew times less often than the first one. Ranks are
+    shuffled over indexes, so hot items are spread over the range.
+    """
+    def __init__(self, rng, n, skew):
+        self.rng = rng
+        self.indexes = list(range(n))
+        rng.shuffle(self.indexes)
+        self.cum_weights = list(accumulate(rank ** -skew for rank in range(1, n + 1)))
+
+    def pick(self):
+        return self.rng.choices(self.indexes, cum_weights=self.cum_weights)[0]
+
+    def pick_distinct(self, k):
+        picked = set()
+        for _ in range(k * 4):
+            picked.add(self.pick())
+            if len(picked) == k:
+                break
+        return picked
+
+
+class DatasetSeeder:
+    """
+    Writes the dataset of one seed: the catalog first, then buyers and orders
+    picking from its shops and products.
+    """
+    def __init__(self, options, stdout):
+        self.options = options
+        self.stdout = stdout
+        self.rng = random.Random(options['seed'])
+        self.tag = f'seed{options["seed"]}'
+        self.now = timezone.now()
+        self.writer = BulkWriter(options['batch_size'])
+        self.password = None
+
+        # Generated by seed_catalog
+        self.category_ids = self.attribute_ids = self.shop_ids = self.product_ids = range(0)
+        self.shop_names = {}
+        self.prices = array('q')
+
+        # Generated by seed_buyers
+        self.shop_choice = self.product_choice = None
+        self.buyer_ids = []
+        self.shipping_note_ids = range(0)
+
+    def run(self):
+        with transaction.atomic():
+            self.seed_catalog()
+            self.seed_buyers()
+            self.seed_orders()
+            self.writer.flush()
+            self.finish()
+        return self.writer.counts
+
+    @staticmethod
+    def first_id(model):
+        """
+        Primary keys of generated rows follow the existing ones, every model is generated at once.
+        """
+        return (model.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+
+    def make_user(self, user_type, number):
+        return User(
+            id=uuid.UUID(int=self.rng.getrandbits(128), version=4),
+            email=f'{self.tag}-{user_type}{number}@example.com',
+            password=self.password,
+            first_name=f'{user_type.capitalize()} {number}',
+            type=user_type,
+        )
+
+    def created_at(self, days):
+        return self.now - timedelta(seconds=self.rng.random() * days * 86400)
+
+    def seed_catalog(self):
+        options, rng = self.options, self.rng
+        shops, per_shop = options['shops'], options['products_per_shop']
+        self.password = make_password(options['password'])
+
+        first_category = self.first_id(Category)
+        self.category_ids = range(first_category, first_category + options['categories'])
+        for number, category_id in enumerate(self.category_ids):
+            self.writer.add(Category(id=category_id, name=f'{self.tag} category {number}'))
+
+        first_attribute = self.first_id(Attribute)
+        self.attribute_ids = range(first_attribute, first_attribute + options['attributes'])
+        for number, attribute_id in enumerate(self.attribute_ids):
+            self.writer.add(Attribute(id=attribute_id, name=f'{self.tag} attribute {number}'))
+
+        first_shop = self.first_id(Shop)
+        first_product = self.first_id(Product)
+        self.shop_ids = range(first_shop, first_shop + shops)
+        self.product_ids = range(first_product, first_product + shops * per_shop)
+
+        shop_category_id = self.first_id(Shop.categories.through)
+        product_attribute_id = self.first_id(ProductAttribute)
+        for shop_number, shop_id in enumerate(self.shop_ids):
+            seller = self.make_user('seller', shop_number)
+            self.writer.add(seller)
+            self.shop_names[shop_id] = f'{self.tag} shop {shop_number}'
+            self.writer.add(Shop(
+                id=shop_id, user_id=seller.id, name=self.shop_names[shop_id], is_open=True,
+            ))
+
+            categories = rng.sample(
+                self.category_ids, min(rng.randint(1, 5), len(self.category_ids)),
+            )
+            for category_id in categories:
+                self.writer.add(Shop.categories.through(
+                    id=shop_category_id, shop_id=shop_id, category_id=category_id,
+                ))
+                shop_category_id += 1
+
+            for number in range(per_shop):
+                product_id = first_product + shop_number * per_shop + number
+                created_at = self.created_at(options['days'])
+                price = min(max(round(rng.lognormvariate(7, 1.3)), 100), 9999999999)
+                self.prices.append(price)
+                self.writer.add(Product(
+                    id=product_id,
+                    shop_id=shop_id,
+                    category_id=rng.choice(categories),
+                    sku=f'{self.tag}-{shop_number}-{number}',
+                    name=f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}',
+                    description=(
+                        f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS).lower()} for everyday use'
+                    ),
+                    stock_quantity=rng.randint(100, 32000),
+                    price=Decimal(price) / 100,
+                    created_at=created_at,
+                    updated_at=created_at,
+                ))
+                attribute_ids = rng.sample(self.attribute_ids, options['attributes_per_product'])
+                for attribute_id in attribute_ids:
+                    self.writer.add(ProductAttribute(
+                        id=product_attribute_id,
+                        product_id=product_id,
+                        attribute_id=attribute_id,
+                        value=f'value {rng.randint(1, 10)}',
+                    ))
+                    product_attribute_id += 1
+
+    def pick_products(self, shop_number, count):
+        per_shop = self.options['products_per_shop']
+        return [
+            self.product_ids.start + shop_number * per_shop + number
+            for number in self.product_choice.pick_distinct(count)
+        ]
+
+    def sample_count(self, mean):
+        """
+        Geometric count of at least one with the given mean.
+        """
+        count = 1
+        while count < 100 and self.rng.random() > 1 / mean:
+            count += 1
+        return count
+
+    def seed_buyers(self):
+        options, rng = self.options, self.rng
+        buyers = options['buyers']
+        self.shop_choice = SkewedChoice(rng, options['shops'], options['skew'])
+        self.product_choice = SkewedChoice(rng, options['products_per_shop'], options['skew'])
+
+        first_cart = self.first_id(Cart)
+        first_shipping_note = self.first_id(ShippingNote)
+        self.shipping_note_ids = range(first_shipping_note, first_shipping_note + buyers)
+
+        cart_products = []
+        for number in range(buyers):
+            buyer = self.make_user('buyer', number)
+            self.writer.add(buyer)
+            self.buyer_ids.append(buyer.id)
+            self.writer.add(Cart(id=first_cart + number, user_id=buyer.id))
+            self.writer.add(ShippingNote(
+                id=first_shipping_note + number,
+                user_id=buyer.id,
+                country='Russia',
+                city=rng.choice(CITIES),
+                street=f'{rng.choice(NOUNS)} street',
+                house=str(rng.randint(1, 200)),
+                phone=f'+7900{rng.randint(0, 9999999):07d}',
+            ))
+
+            if rng.random() < options['carts']:
+                product_ids = set()
+                for _ in range(self.sample_count(options['cart_size'])):
+                    product_ids.update(self.pick_products(self.shop_choice.pick(), 1))
+                cart_products.extend(
+                    (first_cart + number, product_id) for product_id in sorted(product_ids)
+                )
+
+        first_cart_product = self.first_id(CartProduct)
+        for number, (cart_id, product_id) in enumerate(cart_products):
+            self.writer.add(CartProduct(
+                id=first_cart_product + number,
+                cart_id=cart_id,
+                product_id=product_id,
+                quantity=rng.randint(1, 10),
+            ))
+
+    def seed_orders(self):
+        options, rng = self.options, self.rng
+        orders = options['orders']
+        created_dates = sorted((self.created_at(options['days']) for _ in range(orders)))
+
+        next_order = self.first_id(Order)
+        next_order_shop = self.first_id(OrderShop)
+        next_order_product = self.first_id(OrderProduct)
+
+        for created_at in created_dates:
+            buyer_number = rng.randrange(len(self.buyer_ids))
+            if self.now - created_at > timedelta(days=RECENT_DAYS):
+                statuses = PAST_STATUSES
+            else:
+                statuses = RECENT_STATUSES
+
+            order = Order(
+                id=next_order,
+                user_id=self.buyer_ids[buyer_number],
+                shipping_note_id=self.shipping_note_ids[buyer_number],
+                created_at=created_at,
+                total=Decimal(0),
+                item_count=0,
+                statuses=[],
+            )
+            next_order += 1
+
+            shop_numbers = {
+                self.shop_choice.pick()
+                for _ in range(self.sample_count(options['shops_per_order']))
+            }
+            for shop_number in sorted(shop_numbers):
+                shop_id = self.shop_ids[shop_number]
+                status = rng.choices(
+                    [status for status, _ in statuses], [weight for _, weight in statuses],
+                )[0]
+                self.writer.add(OrderShop(
+                    id=next_order_shop, order_id=order.id, shop_id=shop_id, status=status,
+                ))
+                order.statuses.append({'shop': self.shop_names[shop_id], 'status': status})
+                next_order_shop += 1
+
+                positions = self.sample_count(options['positions_per_shop'])
+                for product_id in self.pick_products(shop_number, positions):
+                    quantity = rng.randint(1, 5)
+                    sold_price = Decimal(self.prices[product_id - self.product_ids.start]) / 100
+                    self.writer.add(OrderProduct(
+                        id=next_order_product,
+                        order_id=order.id,
+                        product_id=product_id,
+                        quantity=quantity,
+                        sold_price=sold_price,
+                    ))
+                    order.total += quantity * sold_price
+                    order.item_count += quantity
+                    next_order_product += 1
+
+            self.writer.add(order)
+
+    def finish(self):
+        if connection.vendor == 'postgresql':
+            self.stdout.write('Building search vectors')
+            Product.objects.update_search_vector(
+                Product.objects.filter(
+                    id__gte=self.product_ids.start, id__lt=self.product_ids.stop,
+                ).values('id')
+            )
+
+        models = list(self.writer.counts)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+        cache.invalidate(Category, Attribute, Shop, Product, ProductAttribute)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a deterministic dataset for load testing: shops with products and attributes, '
+        'buyers with carts and order history. Popular shops and products are skewed by --skew.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=1, help='Random seed, the same seed gives the same dataset',
+        )
+        parser.add_argument('--shops', type=int, default=100)
+        parser.add_argument('--products-per-shop', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--attributes', type=int, default=30)
+        parser.add_argument('--attributes-per-product', type=int, default=5)
+        parser.add_argument('--buyers', type=int, default=10000)
+        parser.add_argument(
+            '--carts', type=float, default=0.3, help='Share of buyers with a filled cart',
+        )
+        parser.add_argument('--cart-size', type=float, default=4, help='Mean positions in a cart')
+        parser.add_argument('--orders', type=int, default=50000)
+        parser.add_argument(
+            '--shops-per-order', type=float, default=1.5, help='Mean shops in an order',
+        )
+        parser.add_argument(
+            '--positions-per-shop', type=float, default=2,
+            help='Mean positions of a shop in an order',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Zipf exponent of shop and product popularity',
+        )
+        parser.add_argument('--days', type=int, default=365, help='Days of order history')
+        parser.add_argument(
+            '--password', default='load-test-password', help='Password of generated users',
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        seeder = DatasetSeeder(options, self.stdout)
+
+        if User.objects.filter(email__startswith=f'{seeder.tag}-').exists():
+            raise CommandError(f'Dataset with seed {options["seed"]} is already loaded.')
+        if options['attributes_per_product'] > options['attributes']:
+            raise CommandError('--attributes-per-product can not exceed --attributes.')
+
+        started = time.monotonic()
+        counts = seeder.run()
+
+        for model, count in counts.items():
+            self.stdout.write(f'{model._meta.label}: {count} rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Dataset {seeder.tag} loaded in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,404 @@
+"""
+Metrics of the API and Celery workers in the Prometheus text format.
+
+Every process counts samples in memory and adds them to the "metrics" cache
+at most every METRICS_FLUSH_INTERVAL seconds, so /metrics reports all web and
+worker processes sharing the cache without an external collector. With Redis
+samples are fields of one hash incremented atomically, other caches keep them
+in one entry updated by one process at a time.
+"""
+import hmac
+import json
+import threading
+import time
+from collections import Counter as Tally, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import connections
+from django.http import HttpResponse
+
+from asgiref.sync import sync_to_async
+from celery import current_app
+from celery.signals import task_prerun, task_postrun, worker_process_shutdown, worker_shutdown
+from kombu.exceptions import KombuError
+
+from api.cache import get_stats as get_cache_stats
+from api.middleware import HybridMiddleware
+
+METRICS_CACHE = 'metrics'
+SAMPLES_KEY = 'api:metrics:samples'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Histogram sums are stored in the cache as integer millionths
+SUM_SCALE = 1_000_000
+
+REGISTRY = {}
+
+
+class _Buffer:
+    """
+    Samples of this process not added to the cache yet.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = Tally()
+        self.flushed_at = time.monotonic()
+
+    def add(self, sample, value):
+        with self.lock:
+            self.samples[sample] += value
+
+    def due(self):
+        return time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL
+
+    def take(self, force=False):
+        with self.lock:
+            if not force and not self.due():
+                return {}
+            samples, self.samples, self.flushed_at = self.samples, Tally(), time.monotonic()
+            return samples
+
+
+_buffer = _Buffer()
+
+# Serializes updates of the samples entry in caches other than Redis
+_store_lock = threading.Lock()
+
+
+def _encode_sample(sample):
+    return json.dumps(sample)
+
+
+def _decode_sample(field):
+    name, labels, suffix = json.loads(field)
+    return name, tuple(tuple(label) for label in labels), suffix
+
+
+def _redis_samples(metrics_cache):
+    key = metrics_cache.make_key(SAMPLES_KEY)
+    return key, metrics_cache._cache.get_client(key, write=True)  # pylint: disable=protected-access
+
+
+def get_samples():
+    """
+    Sample values of all processes.
+    """
+    metrics_cache = caches[METRICS_CACHE]
+    if isinstance(metrics_cache, RedisCache):
+        key, client = _redis_samples(metrics_cache)
+        return {_decode_sample(field): int(value) for field, value in client.hgetall(key).items()}
+    return metrics_cache.get(SAMPLES_KEY, {})
+
+
+def flush(force=False):
+    """
+    Adds samples counted by this process to the cache, once METRICS_FLUSH_INTERVAL
+    has passed since the previous flush or right away with force.
+    """
+    samples = _buffer.take(force)
+    if not samples:
+        return
+
+    metrics_cache = caches[METRICS_CACHE]
+    if isinstance(metrics_cache, RedisCache):
+        key, client = _redis_samples(metrics_cache)
+        pipeline = client.pipeline(transaction=False)
+        for sample, value in samples.items():
+            pipeline.hincrby(key, _encode_sample(sample), value)
+        pipeline.execute()
+        return
+
+    with _store_lock:
+        stored = Tally(metrics_cache.get(SAMPLES_KEY, {}))
+        stored.update(samples)
+        metrics_cache.set(SAMPLES_KEY, dict(stored), timeout=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in labels) + '}'
+
+
+def _format_bound(bound):
+    return bound if isinstance(bound, str) else format(bound, 'g')
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        REGISTRY[name] = self
+
+    def _labels(self, values):
+        return tuple((label, str(values[label])) for label in self.labels)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self, samples):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, value=1, **labels):
+        _buffer.add((self.name, self._labels(labels), ''), value)
+
+    def render(self, samples):
+        return self.header() + [
+            f'{self.name}{_format_labels(labels)} {value}'
+            for (_, labels, _), value in samples
+        ]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + ('+Inf',)
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        bound = next(bound for bound in self.buckets if bound == '+Inf' or value <= bound)
+        _buffer.add((self.name, labels + (('le', _format_bound(bound)),), '_bucket'), 1)
+        _buffer.add((self.name, labels, '_sum'), round(value * SUM_SCALE))
+        _buffer.add((self.name, labels, '_count'), 1)
+
+    def render(self, samples):
+        series = defaultdict(dict)
+        for (_, labels, suffix), value in samples:
+            if suffix == '_bucket':
+                series[labels[:-1]][labels[-1][1]] = value
+            else:
+                series[labels][suffix] = value
+
+        lines = self.header()
+        for labels, values in sorted(series.items()):
+            count = 0
+            for bound in map(_format_bound, self.buckets):
+                count += values.get(bound, 0)
+                bucket_labels = _format_labels(labels + (('le', bound),))
+                lines.append(f'{self.name}_bucket{bucket_labels} {count}')
+            total = values.get('_sum', 0) / SUM_SCALE
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {values.get("_count", 0)}')
+        return lines
+
+
+HTTP_REQUESTS = Counter(
+    'fastr_http_requests_total',
+    'HTTP requests by route and response status.',
+    ('method', 'route', 'status'),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'fastr_http_request_duration_seconds',
+    'HTTP request latency by route.',
+    ('method', 'route'),
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    'fastr_http_request_db_queries',
+    'Database queries per HTTP request by route.',
+    ('method', 'route'),
+    (0, 1, 2, 5, 10, 20, 50, 100),
+)
+ORDERS_PLACED = Counter(
+    'fastr_orders_placed_total',
+    'Orders placed by buyers.',
+)
+CELERY_TASKS = Counter(
+    'fastr_celery_tasks_total',
+    'Celery tasks run by task and final state.',
+    ('task', 'state'),
+)
+CELERY_TASK_DURATION = Histogram(
+    'fastr_celery_task_duration_seconds',
+    'Celery task run time by task.',
+    ('task',),
+    (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+
+
+def _queue_lengths():
+    queues = {current_app.conf.task_default_queue}
+    queues.update(queue.name for queue in current_app.conf.task_queues or ())
+
+    lengths = {}
+    with current_app.connection_for_read() as connection:
+        try:
+            connection.ensure_connection(max_retries=1)
+        except KombuError:
+            return lengths
+
+        for queue in sorted(queues):
+            try:
+                lengths[queue] = connection.default_channel.queue_declare(
+                    queue=queue, passive=True,
+                ).message_count
+            except connection.channel_errors:
+                # Queues are declared by the first message or worker
+                lengths[queue] = 0
+    return lengths
+
+
+def _collected():
+    """
+    Metrics read at scrape time rather than counted.
+    """
+    stats = get_cache_stats()
+    lookups = stats['hits'] + stats['misses']
+    lines = [
+        '# HELP fastr_cache_requests_total Cached API response lookups by result.',
+        '# TYPE fastr_cache_requests_total counter',
+        f'fastr_cache_requests_total{{result="hit"}} {stats["hits"]}',
+        f'fastr_cache_requests_total{{result="miss"}} {stats["misses"]}',
+        '# HELP fastr_cache_hit_ratio Share of cached API response lookups served from the cache.',
+        '# TYPE fastr_cache_hit_ratio gauge',
+        f'fastr_cache_hit_ratio {stats["hits"] / lookups if lookups else 0}',
+        '# HELP fastr_celery_queue_length Messages waiting in Celery broker queues.',
+        '# TYPE fastr_celery_queue_length gauge',
+    ]
+    lines.extend(
+        f'fastr_celery_queue_length{_format_labels((("queue", queue),))} {length}'
+        for queue, length in _queue_lengths().items()
+    )
+    return lines
+
+
+def render():
+    samples = defaultdict(list)
+    for sample, value in sorted(get_samples().items()):
+        samples[sample[0]].append((sample, value))
+
+    lines = []
+    for metric in REGISTRY.values():
+        lines.extend(metric.render(samples[metric.name]))
+    lines.extend(_collected())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Metrics of all processes. Requires a bearer token when METRICS_TOKEN is set.
+    """
+    if settings.METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}',
+    ):
+        return HttpResponse(status=401)
+
+    flush(force=True)
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+# Execute wrappers of the middlewares measuring queries of the current request
+_query_observers = ContextVar('query_observers', default=())
+
+
+@contextmanager
+def observing_queries(observer):
+    """
+    Adds an execute wrapper to the queries of the current request, wherever
+    counting_queries is entered for it.
+    """
+    token = _query_observers.set(_query_observers.get() + (observer,))
+    try:
+        yield
+    finally:
+        _query_observers.reset(token)
+
+
+@contextmanager
+def counting_queries():
+    """
+    Passes queries run on this thread to the observers of the request being measured, if any.
+    Under ASGI views run on other threads than the middleware, and enter it there.
+    """
+    with ExitStack() as stack:
+        for observer in _query_observers.get():
+            for alias in connections:
+                connection = connections[alias]
+                # Nested middlewares enter it again on the same thread
+                if observer not in connection.execute_wrappers:
+                    stack.enter_context(connection.execute_wrapper(observer))
+        yield
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Counts requests by route and status, their latency and database queries.
+    Requests not matching any route are counted under the "unmatched" route.
+    """
+    def handle(self, request):
+        queries = _QueryCounter()
+        start = time.perf_counter()
+        with observing_queries(queries), counting_queries():
+            response = self.get_response(request)
+
+        self._observe(request, response, time.perf_counter() - start, queries.count)
+        flush()
+        return response
+
+    async def ahandle(self, request):
+        queries = _QueryCounter()
+        start = time.perf_counter()
+        with observing_queries(queries):
+            response = await self.get_response(request)
+
+        self._observe(request, response, time.perf_counter() - start, queries.count)
+        if _buffer.due():
+            await sync_to_async(flush, thread_sensitive=False)()
+        return response
+
+    @staticmethod
+    def _observe(request, response, duration, queries):
+        resolver_match = request.resolver_match
+        route = resolver_match.view_name if resolver_match is not None else 'unmatched'
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+        HTTP_REQUEST_DURATION.observe(duration, method=request.method, route=route)
+        HTTP_REQUEST_QUERIES.observe(queries, method=request.method, route=route)
+
+
+_task_started = {}
+
+
+@task_prerun.connect
+def task_started(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    CELERY_TASKS.inc(task=task.name, state=state)
+    if started is not None:
+        CELERY_TASK_DURATION.observe(time.perf_counter() - started, task=task.name)
+    flush()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def worker_stopped(**kwargs):
+    flush(force=True)
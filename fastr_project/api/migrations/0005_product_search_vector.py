@@ -0,0 +1,47 @@
+# Generated by Django 4.0.5 on 2026-10-18 05:16
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(
+        'CREATE INDEX product_search_vector_idx ON api_product USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        """
+        UPDATE api_product SET search_vector =
+            setweight(to_tsvector(%s::regconfig, name), 'A') ||
+            setweight(to_tsvector(%s::regconfig, description), 'B') ||
+            setweight(to_tsvector(%s::regconfig, COALESCE((
+                SELECT string_agg(value, ' ') FROM api_productattribute
+                WHERE api_productattribute.product_id = api_product.id
+            ), '')), 'C')
+        """,
+        [settings.SEARCH_CONFIG] * 3,
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS product_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Search vector'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.5 on 2026-10-18 05:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['shop', 'price'], name='product_shop_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productattribute',
+            index=models.Index(fields=['attribute', 'value'], name='attribute_value_idx'),
+        ),
+    ]
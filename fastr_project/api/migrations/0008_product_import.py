@@ -0,0 +1,74 @@
+# Generated by Django 4.0.5 on 2026-10-18 05:28
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def dedupe_shop_skus(apps, schema_editor):
+    """
+    SKUs become unique per shop. Of products sharing a SKU in a shop the oldest keeps it,
+    the others get their id appended to it, sellers may want to review those SKUs.
+    """
+    Product = apps.get_model('api', 'Product')
+    max_length = Product._meta.get_field('sku').max_length
+
+    duplicates = (
+        Product.objects.values('shop_id', 'sku')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        taken = set(Product.objects.filter(shop_id=duplicate['shop_id']).values_list('sku', flat=True))
+        products = Product.objects.filter(shop_id=duplicate['shop_id'], sku=duplicate['sku']).order_by('id')
+        for product in products[1:]:
+            suffix, number = f'-{product.id}', 1
+            while (sku := product.sku[:max_length - len(suffix)] + suffix) in taken:
+                suffix, number = f'-{product.id}-{number}', number + 1
+            taken.add(sku)
+            Product.objects.filter(id=product.id).update(sku=sku)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_outbox_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('json', 'JSON'), ('ndjson', 'NDJSON'), ('yaml', 'YAML')], max_length=10, verbose_name='Format')),
+                ('data', models.BinaryField(verbose_name='Data')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Status')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Processed rows')),
+                ('created', models.PositiveIntegerField(default=0, verbose_name='Created products')),
+                ('updated', models.PositiveIntegerField(default=0, verbose_name='Updated products')),
+                ('errors', models.JSONField(default=list, verbose_name='Errors')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created date')),
+                ('finished_at', models.DateTimeField(null=True, verbose_name='Finished date')),
+            ],
+            options={
+                'verbose_name': 'Product import',
+                'verbose_name_plural': 'Product imports',
+            },
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='event',
+            field=models.CharField(choices=[('order_created', 'Order created'), ('order_updated', 'Order updated'), ('product_import', 'Product import')], max_length=20, verbose_name='Event'),
+        ),
+        migrations.RunPython(dedupe_shop_skus, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('shop', 'sku'), name='unique_shop_sku'),
+        ),
+        migrations.AddField(
+            model_name='productimport',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_imports', to='api.shop', verbose_name='Shop'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.0.5 on 2026-10-18 05:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_product_import'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField(verbose_name='Product ID')),
+                ('shop_id', models.BigIntegerField(verbose_name='Shop ID')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='Deleted date')),
+            ],
+            options={
+                'verbose_name': 'Product tombstone',
+                'verbose_name_plural': 'Product tombstones',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at', 'id'], name='product_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producttombstone',
+            index=models.Index(fields=['deleted_at', 'product_id'], name='tombstone_deleted_idx'),
+        ),
+    ]
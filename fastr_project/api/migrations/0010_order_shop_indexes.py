@@ -0,0 +1,21 @@
+# Generated by Django 4.0.5 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_product_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ordershop',
+            index=models.Index(fields=['shop', 'order'], name='order_shop_shop_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordershop',
+            index=models.Index(fields=['shop', 'status', 'order'], name='order_shop_status_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.0.5 on 2026-10-18 05:36
+
+from itertools import groupby
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_order_summary(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    OrderProduct = apps.get_model('api', 'OrderProduct')
+    OrderShop = apps.get_model('api', 'OrderShop')
+
+    positions = OrderProduct.objects.filter(order=OuterRef('id')).order_by().values('order')
+    Order.objects.update(
+        total=Coalesce(Subquery(positions.annotate(
+            total=Sum(F('quantity') * F('sold_price'), output_field=models.DecimalField()),
+        ).values('total')), 0, output_field=models.DecimalField()),
+        item_count=Coalesce(Subquery(positions.annotate(
+            item_count=Sum('quantity'),
+        ).values('item_count')), 0),
+    )
+
+    order_shops = (
+        OrderShop.objects.order_by('order_id', 'id')
+        .values_list('order_id', 'shop__name', 'status')
+        .iterator(chunk_size=2000)
+    )
+    orders = []
+    for order_id, rows in groupby(order_shops, key=lambda row: row[0]):
+        orders.append(Order(id=order_id, statuses=[{'shop': shop, 'status': status} for _, shop, status in rows]))
+        if len(orders) == 2000:
+            Order.objects.bulk_update(orders, ['statuses'])
+            orders = []
+    Order.objects.bulk_update(orders, ['statuses'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_order_shop_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Item count'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='statuses',
+            field=models.JSONField(default=list, verbose_name='Shop statuses'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Total'),
+        ),
+        migrations.RunPython(fill_order_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.5 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_order_summary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='event',
+            field=models.CharField(choices=[('order_created', 'Order created'), ('order_updated', 'Order updated'), ('orders_updated', 'Orders updated'), ('product_import', 'Product import')], max_length=20, verbose_name='Event'),
+        ),
+    ]
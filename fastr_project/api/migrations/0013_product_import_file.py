@@ -0,0 +1,36 @@
+# Generated by Django 4.0.5 on 2026-10-18 08:10
+
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+
+
+def move_data_to_files(apps, schema_editor):
+    ProductImport = apps.get_model('api', 'ProductImport')
+
+    # One price list in memory at a time
+    for product_import in ProductImport.objects.filter(status='pending').iterator(chunk_size=1):
+        product_import.file.save(
+            f'{product_import.id}.{product_import.format}', ContentFile(bytes(product_import.data)), save=False,
+        )
+        ProductImport.objects.filter(id=product_import.id).update(file=product_import.file.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_orders_updated_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimport',
+            name='file',
+            field=models.FileField(default='', upload_to='product_imports/', verbose_name='File'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(move_data_to_files, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='productimport',
+            name='data',
+        ),
+    ]
@@ -1,7 +1,16 @@
-from django.db import models
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connections, models, transaction
 from django.core import validators
-from django.db.models import F, Sum
+from django.db.models import F, Q, Sum, ExpressionWrapper, Case, When, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
+from api import cache
 from users.models import User
 
 
@@ -14,6 +23,37 @@ ORDER_STATUS_CHOICES = (
     ('canceled', 'Canceled'),
 )
 
+# Statuses a shop order can move to from each status
+ORDER_STATUS_TRANSITIONS = {
+    'new': ('confirmed', 'canceled'),
+    'confirmed': ('assembled', 'canceled'),
+    'assembled': ('sent', 'canceled'),
+    'sent': ('delivered',),
+    'delivered': (),
+    'canceled': (),
+}
+
+OUTBOX_EVENT_CHOICES = (
+    ('order_created', 'Order created'),
+    ('order_updated', 'Order updated'),
+    ('orders_updated', 'Orders updated'),
+    ('product_import', 'Product import'),
+)
+
+IMPORT_FORMAT_CHOICES = (
+    ('csv', 'CSV'),
+    ('json', 'JSON'),
+    ('ndjson', 'NDJSON'),
+    ('yaml', 'YAML'),
+)
+
+IMPORT_STATUS_CHOICES = (
+    ('pending', 'Pending'),
+    ('processing', 'Processing'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=50, verbose_name='Name', unique=True)
@@ -83,6 +123,103 @@ class ShippingNote(models.Model):
         return f'{self.city}_{self.street}_{self.house}'
 
 
+class OutOfStockError(Exception):
+    def __init__(self, product_ids):
+        super().__init__(f'Not enough stock for products: {product_ids}')
+        self.product_ids = product_ids
+
+
+class ProductManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+    def reserve_stock(self, quantities):
+        """
+        Decrements stock of all given products in one guarded UPDATE.
+        Rows are locked in primary key order first, so concurrent checkouts
+        over the same products can not deadlock each other.
+        """
+        if not quantities:
+            return
+
+        stock = self._lock_stock(quantities)
+        shortage = [
+            product_id for product_id, quantity in quantities.items()
+            if stock.get(product_id, 0) < quantity
+        ]
+        if shortage:
+            raise OutOfStockError(shortage)
+
+        enough_stock = Q()
+        for product_id, quantity in quantities.items():
+            enough_stock |= Q(id=product_id, stock_quantity__gte=quantity)
+
+        updated = self.filter(enough_stock).update(
+            stock_quantity=self._stock_change(quantities, sign=-1),
+            updated_at=timezone.now(),
+        )
+        if updated != len(quantities):
+            raise OutOfStockError(sorted(quantities))
+
+        cache.invalidate_instances(self.model, quantities)
+
+    def release_stock(self, quantities):
+        """
+        Returns reserved stock of all given products in one UPDATE.
+        """
+        if not quantities:
+            return
+
+        self._lock_stock(quantities)
+        self.filter(id__in=quantities).update(
+            stock_quantity=self._stock_change(quantities, sign=1),
+            updated_at=timezone.now(),
+        )
+        cache.invalidate_instances(self.model, quantities)
+
+    def update_search_vector(self, product_ids):
+        """
+        Rebuilds search vectors of given products: name is weighted over
+        description, attribute values have the lowest weight. PostgreSQL only.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return
+
+        attribute_values = (
+            ProductAttribute.objects.filter(product=OuterRef('pk'))
+            .values('product')
+            .annotate(values=StringAgg('value', ' '))
+            .values('values')
+        )
+        self.filter(id__in=product_ids).update(
+            search_vector=(
+                SearchVector('name', weight='A', config=settings.SEARCH_CONFIG) +
+                SearchVector('description', weight='B', config=settings.SEARCH_CONFIG) +
+                SearchVector(
+                    Coalesce(Subquery(attribute_values), Value('')),
+                    weight='C',
+                    config=settings.SEARCH_CONFIG,
+                )
+            )
+        )
+
+    def _lock_stock(self, quantities):
+        return dict(
+            self.select_for_update()
+            .filter(id__in=quantities)
+            .order_by('id')
+            .values_list('id', 'stock_quantity')
+        )
+
+    @staticmethod
+    def _stock_change(quantities, sign):
+        return Case(
+            *(When(id=product_id, then=F('stock_quantity') + sign * quantity)
+              for product_id, quantity in quantities.items()),
+            default=F('stock_quantity'),
+        )
+
+
 class Product(models.Model):
     shop = models.ForeignKey(
         Shop,
@@ -122,18 +259,48 @@ class Product(models.Model):
     )
     created_at = models.DateTimeField(verbose_name='Created date', auto_now_add=True)
     updated_at = models.DateTimeField(verbose_name='Update date', auto_now=True)
+    # Maintained by api.signals, GIN indexed on PostgreSQL by migration 0005
+    search_vector = SearchVectorField(verbose_name='Search vector', null=True, editable=False)
+    objects = ProductManager()
 
     class Meta:
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
         constraints = [
-            models.UniqueConstraint(fields=['shop', 'name'], name='unique_position')
+            models.UniqueConstraint(fields=['shop', 'name'], name='unique_position'),
+            models.UniqueConstraint(fields=['shop', 'sku'], name='unique_shop_sku'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            models.Index(fields=['shop', 'created_at', 'id'], name='product_shop_created_idx'),
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['shop', 'price'], name='product_shop_price_idx'),
+            models.Index(fields=['updated_at', 'id'], name='product_updated_idx'),
         ]
 
     def __str__(self):
         return f'{self.name}'
 
 
+class ProductTombstone(models.Model):
+    """
+    Deleted product, reported by the catalog change feed. Written by api.signals.
+    """
+    product_id = models.BigIntegerField(verbose_name='Product ID')
+    shop_id = models.BigIntegerField(verbose_name='Shop ID')
+    deleted_at = models.DateTimeField(verbose_name='Deleted date', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Product tombstone'
+        verbose_name_plural = 'Product tombstones'
+        indexes = [
+            models.Index(fields=['deleted_at', 'product_id'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f'product_{self.product_id}_tombstone'
+
+
 class ProductAttribute(models.Model):
     product = models.ForeignKey(
         Product,
@@ -154,6 +321,9 @@ class ProductAttribute(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'attribute'], name='unique_attributes')
         ]
+        indexes = [
+            models.Index(fields=['attribute', 'value'], name='attribute_value_idx'),
+        ]
 
 
 class Cart(models.Model):
@@ -182,7 +352,10 @@ class Cart(models.Model):
 class CartProductManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().annotate(
-            sum=Sum(F('quantity') * F('product__price'))
+            sum=ExpressionWrapper(
+                F('quantity') * F('product__price'),
+                output_field=models.DecimalField(max_digits=16, decimal_places=2),
+            )
         )
 
 
@@ -213,6 +386,57 @@ class CartProduct(models.Model):
         ]
 
 
+class OrderManager(models.Manager):
+    def refresh_summary(self, order_ids):
+        """
+        Recomputes stored totals and shop statuses of the orders from their
+        positions and shops. Orders are locked first, so concurrent status
+        changes of one order are applied one after another.
+        """
+        with transaction.atomic():
+            orders = list(
+                self.select_for_update().filter(id__in=order_ids).order_by('id').only('id')
+            )
+            if not orders:
+                return
+
+            summaries = {order.id: _OrderSummary() for order in orders}
+            for order_id, quantity, sold_price in (
+                OrderProduct.objects.filter(order__in=summaries)
+                .values_list('order_id', 'quantity', 'sold_price')
+            ):
+                summaries[order_id].add_position(quantity, sold_price)
+            for order_id, shop_name, status in (
+                OrderShop.objects.filter(order__in=summaries)
+                .order_by('id')
+                .values_list('order_id', 'shop__name', 'status')
+            ):
+                summaries[order_id].add_shop(shop_name, status)
+
+            for order in orders:
+                summaries[order.id].apply(order)
+            self.bulk_update(orders, ['total', 'item_count', 'statuses'])
+
+
+class _OrderSummary:
+    def __init__(self):
+        self.total = Decimal(0)
+        self.item_count = 0
+        self.statuses = []
+
+    def add_position(self, quantity, sold_price):
+        self.total += quantity * sold_price
+        self.item_count += quantity
+
+    def add_shop(self, shop_name, status):
+        self.statuses.append({'shop': shop_name, 'status': status})
+
+    def apply(self, order):
+        order.total = self.total
+        order.item_count = self.item_count
+        order.statuses = self.statuses
+
+
 class Order(models.Model):
     user = models.ForeignKey(
         User,
@@ -239,42 +463,138 @@ class Order(models.Model):
         through='OrderShop',
     )
     created_at = models.DateTimeField(verbose_name='Created date', auto_now_add=True)
+    total = models.DecimalField(verbose_name='Total', max_digits=16, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(verbose_name='Item count', default=0)
+    statuses = models.JSONField(verbose_name='Shop statuses', default=list)
+
+    objects = OrderManager()
 
     class Meta:
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-
-        cart_products = CartProduct.objects.filter(
-            cart=self.user.cart
+        with transaction.atomic():
+            is_new = self._state.adding
+            super().save(*args, **kwargs)
+
+            if is_new:
+                self._place_cart_products(CartProduct.objects.filter(cart__user=self.user_id))
+
+    def _place_cart_products(self, cart_products):
+        """
+        Moves cart positions to the order as a set: one joined read of the cart,
+        one stock reservation, one bulk insert of positions, one bulk insert of shops,
+        one delete and one update of the order summary. Raises OutOfStockError
+        if any position is not in stock.
+        """
+        positions = cart_products.select_related('product__shop').only(
+            'quantity', 'product__price', 'product__shop__name',
         )
 
-        order_shops = []
-        for position in cart_products:
-            OrderProduct.objects.create(
+        order_products = []
+        order_shops = {}
+        summary = _OrderSummary()
+        for position in positions:
+            summary.add_position(position.quantity, position.product.price)
+            if position.product.shop_id not in order_shops:
+                summary.add_shop(position.product.shop.name, 'new')
+            order_products.append(OrderProduct(
                 order=self,
-                product=position.product,
+                product_id=position.product_id,
                 quantity=position.quantity,
                 sold_price=position.product.price,
+            ))
+            order_shops.setdefault(
+                position.product.shop_id,
+                OrderShop(order=self, shop_id=position.product.shop_id, status='new'),
             )
-            order_shops.append(position.product.shop)
 
-        cart_products.delete()
+        Product.objects.reserve_stock({
+            order_product.product_id: order_product.quantity
+            for order_product in order_products
+        })
 
-        unique_order_shops = set(order_shops)
-        for shop in unique_order_shops:
-            OrderShop.objects.create(
-                order=self,
-                shop=shop,
-                status='new',
-            )
+        OrderProduct.objects.bulk_create(order_products)
+        OrderShop.objects.bulk_create(order_shops.values())
+
+        CartProduct.objects.filter(
+            id__in=[position.id for position in positions]
+        ).delete()
+
+        summary.apply(self)
+        Order.objects.filter(id=self.id).update(
+            total=self.total, item_count=self.item_count, statuses=self.statuses,
+        )
 
     def __str__(self):
         return f'order_{self.id}'
 
 
+class OrderShopManager(models.Manager):
+    def transition(self, shop_id, order_ids, from_status, to_status):
+        """
+        Moves orders of the shop from one status to another in one guarded UPDATE.
+        Canceled orders return their stock, and each buyer is notified once about
+        all their changed orders. Returns results in the order of given order ids.
+        """
+        with transaction.atomic():
+            order_shops = {
+                order_id: (order_shop_id, status, user_id)
+                for order_shop_id, order_id, status, user_id in (
+                    self.select_for_update(of=('self',))
+                    .filter(shop=shop_id, order__in=order_ids)
+                    .order_by('id')
+                    .values_list('id', 'order_id', 'status', 'order__user_id')
+                )
+            }
+            matched = [
+                order_id for order_id, (_, status, _) in order_shops.items()
+                if status == from_status
+            ]
+            self.filter(
+                shop=shop_id, order__in=matched, status=from_status,
+            ).update(status=to_status)
+
+            if to_status == 'canceled':
+                quantities = Counter()
+                for product_id, quantity in (
+                    OrderProduct.objects.filter(order__in=matched, product__shop=shop_id)
+                    .values_list('product_id', 'quantity')
+                ):
+                    quantities[product_id] += quantity
+                Product.objects.release_stock(dict(quantities))
+
+            # Bulk updates send no signals, summaries are refreshed here
+            Order.objects.refresh_summary(matched)
+
+            if settings.EMAIL_ORDER_NOTIFICATIONS:
+                buyer_order_shops = defaultdict(list)
+                for order_id in matched:
+                    order_shop_id, _, user_id = order_shops[order_id]
+                    buyer_order_shops[user_id].append(order_shop_id)
+                OutboxEvent.objects.bulk_create(
+                    OutboxEvent(event='orders_updated', payload={'order_shop_ids': order_shop_ids})
+                    for order_shop_ids in buyer_order_shops.values()
+                )
+
+        results = []
+        for order_id in dict.fromkeys(order_ids):
+            if order_id not in order_shops:
+                results.append({'order': order_id, 'status': None, 'result': 'not_found'})
+            elif order_shops[order_id][1] != from_status:
+                results.append({
+                    'order': order_id, 'status': order_shops[order_id][1],
+                    'result': 'invalid_status',
+                })
+            else:
+                results.append({'order': order_id, 'status': to_status, 'result': 'transitioned'})
+        return results
+
+
 class OrderShop(models.Model):
     order = models.ForeignKey(
         Order,
@@ -293,11 +613,36 @@ class OrderShop(models.Model):
         choices=ORDER_STATUS_CHOICES,
         max_length=9,
     )
+    objects = OrderShopManager()
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['order', 'shop'], name='unique_orders')
         ]
+        indexes = [
+            models.Index(fields=['shop', 'order'], name='order_shop_shop_order_idx'),
+            models.Index(fields=['shop', 'status', 'order'], name='order_shop_status_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            is_canceled = self.status == 'canceled' and self._is_canceling()
+            super().save(*args, **kwargs)
+
+            if is_canceled:
+                Product.objects.release_stock(dict(
+                    OrderProduct.objects.filter(order=self.order_id, product__shop=self.shop_id)
+                    .values_list('product_id', 'quantity')
+                ))
+
+    def _is_canceling(self):
+        previous_status = (
+            OrderShop.objects.select_for_update()
+            .filter(id=self.id)
+            .values_list('status', flat=True)
+            .first()
+        )
+        return previous_status not in (None, 'canceled')
 
 
 class OrderProductManager(models.Manager):
@@ -334,3 +679,54 @@ class OrderProduct(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['order', 'product'], name='unique_order_positions')
         ]
+
+
+class OutboxEvent(models.Model):
+    """
+    Event written in the transaction of the change it describes,
+    relayed to Celery tasks by api.tasks.relay_outbox_events.
+    """
+    event = models.CharField(verbose_name='Event', choices=OUTBOX_EVENT_CHOICES, max_length=20)
+    payload = models.JSONField(verbose_name='Payload')
+    created_at = models.DateTimeField(verbose_name='Created date', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Outbox event'
+        verbose_name_plural = 'Outbox events'
+
+    def __str__(self):
+        return f'{self.event}_{self.id}'
+
+
+class ProductImport(models.Model):
+    """
+    Price list uploaded by a seller, imported by api.tasks.import_products.
+    """
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name='Shop',
+        related_name='product_imports',
+        on_delete=models.CASCADE,
+    )
+    format = models.CharField(verbose_name='Format', choices=IMPORT_FORMAT_CHOICES, max_length=10)
+    # Uploaded file, deleted once imported
+    file = models.FileField(verbose_name='File', upload_to='product_imports/')
+    status = models.CharField(
+        verbose_name='Status',
+        choices=IMPORT_STATUS_CHOICES,
+        max_length=20,
+        default='pending',
+    )
+    processed = models.PositiveIntegerField(verbose_name='Processed rows', default=0)
+    created = models.PositiveIntegerField(verbose_name='Created products', default=0)
+    updated = models.PositiveIntegerField(verbose_name='Updated products', default=0)
+    errors = models.JSONField(verbose_name='Errors', default=list)
+    created_at = models.DateTimeField(verbose_name='Created date', auto_now_add=True)
+    finished_at = models.DateTimeField(verbose_name='Finished date', null=True)
+
+    class Meta:
+        verbose_name = 'Product import'
+        verbose_name_plural = 'Product imports'
+
+    def __str__(self):
+        return f'product_import_{self.id}'
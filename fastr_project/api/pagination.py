@@ -0,0 +1,28 @@
+from django.conf import settings
+
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination for list endpoints. Pages are fetched with an indexed
+    range condition instead of OFFSET, so every page costs the same.
+    Clients can change page size with the page_size query parameter.
+    """
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Keyset pagination by creation date, ties are ordered by id.
+    """
+    ordering = ('created_at', 'id')
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Keyset pagination by order, for per-shop orders.
+    """
+    ordering = ('order_id',)
@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission
 
+from api.authentication import get_identity
+
 
 class IsSeller(BasePermission):
     message = "Failed! You have to be a seller not a buyer!"
@@ -16,20 +18,14 @@ class IsSellerHasShop(BasePermission):
     message = "Failed! You do not have shop!"
 
     def has_permission(self, request, view):
-        user = request.user
-        if not hasattr(user, 'shop'):
-            return False
-        return True
+        return get_identity(request).shop_id is not None
 
 
 class IsSellerHasNoShop(BasePermission):
     message = "Failed! You already have shop!"
 
     def has_permission(self, request, view):
-        user = request.user
-        if hasattr(user, 'shop'):
-            return False
-        return True
+        return get_identity(request).shop_id is None
 
 
 class IsBuyer(BasePermission):
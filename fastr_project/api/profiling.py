@@ -0,0 +1,213 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+from asgiref.sync import sync_to_async
+from rest_framework import serializers
+
+from api.metrics import counting_queries, observing_queries
+from api.middleware import HybridMiddleware
+
+logger = logging.getLogger(__name__)
+
+VIEWS_KEY = 'api:profiling:views'
+METRIC_KEY = 'api:profiling:{}:{}:{}:{}'
+
+# Upper bounds of histogram buckets: milliseconds for timings, statements for queries
+TIME_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+METRICS = {
+    'total': TIME_BUCKETS,
+    'db': TIME_BUCKETS,
+    'serializer': TIME_BUCKETS,
+    'queries': QUERY_BUCKETS,
+}
+
+# Repeated SQL statements logged with slow requests
+DUPLICATED_QUERIES_LOGGED = 5
+
+_current_profile = ContextVar('profile', default=None)
+
+
+class RequestProfile:
+    """
+    Statements and timings of one request, collected by a database execute wrapper.
+    Serializer time includes queries serializers run on their own.
+    """
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries.append(sql)
+
+    def duplicated_queries(self):
+        return [
+            (sql, count)
+            for sql, count in Counter(self.queries).most_common(DUPLICATED_QUERIES_LOGGED)
+            if count > 1
+        ]
+
+
+def _profiled_data(data):
+    def profiled(serializer):
+        profile = _current_profile.get()
+        if profile is None or profile.serializing:
+            return data.fget(serializer)
+
+        profile.serializing = True
+        start = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            profile.serializer_time += time.perf_counter() - start
+            profile.serializing = False
+
+    profiled.profiled = True
+    return property(profiled)
+
+
+def _instrument_serializers():
+    for serializer_class in (serializers.Serializer, serializers.ListSerializer):
+        data = serializer_class.__dict__['data']
+        if not getattr(data.fget, 'profiled', False):
+            serializer_class.data = _profiled_data(data)
+
+
+def _metric_key(view, metric, bucket):
+    method, view_name = view.split(' ', 1)
+    return METRIC_KEY.format(method, view_name, metric, bucket)
+
+
+def _incr(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, delta)
+
+
+def _observe(view, metric, value):
+    bucket = next((bound for bound in METRICS[metric] if value <= bound), '+Inf')
+    _incr(_metric_key(view, metric, bucket))
+    _incr(_metric_key(view, metric, 'sum'), round(value))
+
+
+def _metric_keys(view):
+    yield _metric_key(view, 'requests', 'count')
+    for metric, buckets in METRICS.items():
+        for bucket in buckets + ('+Inf', 'sum'):
+            yield _metric_key(view, metric, bucket)
+
+
+def record(view, values):
+    views = cache.get(VIEWS_KEY, set())
+    if view not in views:
+        cache.set(VIEWS_KEY, views | {view}, timeout=None)
+
+    _incr(_metric_key(view, 'requests', 'count'))
+    for metric, value in values.items():
+        _observe(view, metric, value)
+
+
+def get_profile_stats():
+    """
+    Request count and histograms of every metric per view. Buckets are
+    cumulative: each one counts requests at or below its bound.
+    """
+    views = sorted(cache.get(VIEWS_KEY, set()))
+    values = cache.get_many([key for view in views for key in _metric_keys(view)])
+
+    stats = {}
+    for view in views:
+        stats[view] = {'requests': values.get(_metric_key(view, 'requests', 'count'), 0)}
+        for metric, buckets in METRICS.items():
+            count, histogram = 0, {}
+            for bucket in buckets + ('+Inf',):
+                count += values.get(_metric_key(view, metric, bucket), 0)
+                histogram[str(bucket)] = count
+            stats[view][metric] = {
+                'sum': values.get(_metric_key(view, metric, 'sum'), 0),
+                'buckets': histogram,
+            }
+    return stats
+
+
+def reset_profile_stats():
+    views = cache.get(VIEWS_KEY, set())
+    cache.delete_many([key for view in views for key in _metric_keys(view)] + [VIEWS_KEY])
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """
+    Measures every request: queries, database time, serializer time and total time.
+    Timings are sent in the Server-Timing header and added to per-view histograms,
+    requests slower than PROFILING_SLOW_REQUEST are logged with their repeated statements.
+    Enabled by the PROFILING setting.
+    """
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        _instrument_serializers()
+
+    def handle(self, request):
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with observing_queries(profile), counting_queries():
+                response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+
+        self._report(request, response, profile, start)
+        return response
+
+    async def ahandle(self, request):
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with observing_queries(profile):
+                response = await self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+
+        await sync_to_async(self._report, thread_sensitive=False)(request, response, profile, start)
+        return response
+
+    @staticmethod
+    def _report(request, response, profile, start):
+        values = {
+            'total': (time.perf_counter() - start) * 1000,
+            'db': profile.db_time * 1000,
+            'serializer': profile.serializer_time * 1000,
+            'queries': len(profile.queries),
+        }
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={values["db"]:.1f};desc="{values["queries"]} queries"',
+            f'serializer;dur={values["serializer"]:.1f}',
+            f'total;dur={values["total"]:.1f}',
+        ))
+
+        resolver_match = request.resolver_match
+        if resolver_match is not None:
+            record(f'{request.method} {resolver_match.view_name}', values)
+
+        if values['total'] >= settings.PROFILING_SLOW_REQUEST:
+            logger.warning(
+                'Slow request %s %s: %.1fms, %d queries in %.1fms, serializers %.1fms%s',
+                request.method, request.path, values['total'], values['queries'], values['db'],
+                values['serializer'],
+                ''.join(f'\n  {count}x {sql}' for sql, count in profile.duplicated_queries()),
+            )
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# Bytes collected before a chunk of a streamed response is sent
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class StreamingRenderer(BaseRenderer):
+    """
+    Renders rows one by one into chunks of a streamed response. Other data,
+    as error details, is rendered as a single row.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = [data] if isinstance(data, dict) else list(data)
+        return b''.join(self.stream(rows, list(rows[0]) if rows else []))
+
+    def stream(self, rows, header):
+        buffer = io.StringIO()
+        for _ in self.write_rows(rows, header, buffer):
+            if buffer.tell() >= STREAM_BUFFER_SIZE:
+                yield buffer.getvalue().encode(self.charset)
+                buffer.seek(0)
+                buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode(self.charset)
+
+    def write_rows(self, rows, header, buffer):
+        """
+        Writes rows into the buffer, yielding after each one.
+        """
+        raise NotImplementedError('write_rows() must be implemented.')
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def write_rows(self, rows, header, buffer):
+        for row in rows:
+            buffer.write(json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n')
+            yield
+
+
+class CSVRenderer(StreamingRenderer):
+    """
+    Rows are written in columns of the header, missing values are left empty.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def write_rows(self, rows, header, buffer):
+        writer = csv.DictWriter(buffer, fieldnames=header, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            yield
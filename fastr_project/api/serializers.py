@@ -1,16 +1,20 @@
-from django.db.models import Sum
+from collections import Counter
+
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
 from rest_framework import serializers
 
+from api import cache
+from api.authentication import get_identity
 from api.models import (
     Category, Attribute, Shop, ShippingNote, Product, Order,
-    ProductAttribute, CartProduct, Cart, OrderProduct, OrderShop
-)
-from api.tasks import (
-    order_created_email, order_received_email,
-    order_updated_email
+    ProductAttribute, CartProduct, Cart, OrderProduct, OrderShop,
+    OutboxEvent, OutOfStockError, ProductImport, ORDER_STATUS_CHOICES, ORDER_STATUS_TRANSITIONS,
 )
+from api.importers import FORMAT_EXTENSIONS
+from api.signals import collect_product_changes
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -55,48 +59,106 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         fields = ('id', 'category', 'product_attributes', 'sku', 'name', 'description', 'stock_quantity', 'price')
 
     def validate(self, data):
-        shop = self.context['request'].user.shop
+        shop_id = get_identity(self.context['request']).shop_id
 
         if data.get('name'):
             product_exists = Product.objects.filter(
-                shop=shop, name=data['name']
+                shop_id=shop_id, name=data['name']
             ).exists()
 
             if product_exists:
                 raise serializers.ValidationError('Failed! Shop already have product with that name!')
 
+        if data.get('sku'):
+            products = Product.objects.filter(shop_id=shop_id, sku=data['sku'])
+            if self.instance is not None:
+                products = products.exclude(id=self.instance.id)
+
+            if products.exists():
+                raise serializers.ValidationError(
+                    {'sku': ['Failed! Shop already have product with that SKU!']}
+                )
+
         return data
 
     def create(self, validated_data):
         product_attributes = validated_data.pop('product_attributes')
 
-        product = Product.objects.create(**validated_data)
+        with transaction.atomic(), collect_product_changes():
+            product = Product.objects.create(**validated_data)
 
-        for product_attribute in product_attributes:
-            ProductAttribute.objects.create(
-                product=product,
-                **product_attribute,
-            )
+            for product_attribute in product_attributes:
+                ProductAttribute.objects.create(
+                    product=product,
+                    **product_attribute,
+                )
 
         return product
 
     def update(self, product, validated_data):
         product_attributes = validated_data.pop('product_attributes', {})
 
-        Product.objects.filter(id=product.id).update(**validated_data)
-        updated_product = Product.objects.get(id=product.id)
+        with transaction.atomic(), collect_product_changes() as saved:
+            Product.objects.filter(id=product.id).update(
+                **validated_data, updated_at=timezone.now(),
+            )
+            saved.add(product.id)
+            updated_product = Product.objects.get(id=product.id)
 
-        for product_attribute in product_attributes:
-            if product_attribute.get('value') and product_attribute.get('attribute'):
-                ProductAttribute.objects.update_or_create(
-                    product=updated_product,
-                    attribute=product_attribute['attribute'],
-                    defaults={'value': product_attribute['value']}
-                )
+            for product_attribute in product_attributes:
+                if product_attribute.get('value') and product_attribute.get('attribute'):
+                    ProductAttribute.objects.update_or_create(
+                        product=updated_product,
+                        attribute=product_attribute['attribute'],
+                        defaults={'value': product_attribute['value']}
+                    )
+
+        cache.invalidate(Product)
 
         return updated_product
 
 
+class ProductImportSerializer(serializers.ModelSerializer):
+    file = serializers.FileField(write_only=True)
+
+    class Meta:
+        model = ProductImport
+        fields = (
+            'id', 'file', 'format', 'status', 'processed', 'created', 'updated', 'errors',
+            'created_at', 'finished_at',
+        )
+        read_only_fields = (
+            'status', 'processed', 'created', 'updated', 'errors', 'created_at', 'finished_at',
+        )
+        extra_kwargs = {'format': {'required': False}}
+
+    def validate(self, data):
+        file = data['file']
+        if file.size > settings.PRODUCT_IMPORT_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Failed! Price list is larger than {settings.PRODUCT_IMPORT_MAX_SIZE} bytes!'
+            )
+
+        if not data.get('format'):
+            extension = file.name.rpartition('.')[2].lower()
+            if extension not in FORMAT_EXTENSIONS:
+                raise serializers.ValidationError(
+                    f'Failed! Price list format is not supported: {extension}!'
+                )
+            data['format'] = FORMAT_EXTENSIONS[extension]
+
+        return data
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            product_import = ProductImport.objects.create(**validated_data)
+            OutboxEvent.objects.create(
+                event='product_import', payload={'product_import_id': product_import.id},
+            )
+
+        return product_import
+
+
 class ProductRetrieveAttributesSerializer(serializers.ModelSerializer):
     id = serializers.PrimaryKeyRelatedField(queryset=Attribute.objects.all(), source='attribute')
     name = serializers.StringRelatedField(source='attribute.name')
@@ -133,26 +195,88 @@ class ShopRetrieveSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'categories')
 
 
+class CartPositionProductField(serializers.PrimaryKeyRelatedField):
+    """
+    Looks products up among the ones fetched by the list serializer.
+    """
+    @staticmethod
+    def is_pk(data):
+        if isinstance(data, bool):
+            return False
+        try:
+            int(data)
+        except (TypeError, ValueError):
+            return False
+        return True
+
+    def to_internal_value(self, data):
+        if not self.is_pk(data):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        product = self.context['products'].get(int(data))
+        if product is None:
+            self.fail('does_not_exist', pk_value=data)
+        return product
+
+
 class CartProductCreateListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        """
+        Fetches submitted products and existing cart positions for the whole batch,
+        so that positions are validated without a query per position.
+        """
+        if isinstance(data, list):
+            product_ids = {
+                position.get('product') for position in data
+                if isinstance(position, dict)
+                and CartPositionProductField.is_pk(position.get('product'))
+            }
+            product_ids = [int(product_id) for product_id in product_ids]
+            cart_id = get_identity(self.context['request']).cart_id
+
+            self.context['products'] = Product.objects.in_bulk(product_ids)
+            self.context['cart_products'] = {
+                cart_product.product_id: cart_product
+                for cart_product in CartProduct.objects.filter(
+                    cart_id=cart_id, product__in=product_ids,
+                )
+            }
+
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        product_ids = Counter(position['product'].id for position in attrs)
+        duplicates = sorted(product_id for product_id, count in product_ids.items() if count > 1)
+        if duplicates:
+            ids = ', '.join(map(str, duplicates))
+            raise serializers.ValidationError(
+                f'Failed! Products with ids: {ids}, are submitted more than once!'
+            )
+
+        return attrs
+
+    def create(self, validated_data):
+        return CartProduct.objects.bulk_create(
+            CartProduct(**position) for position in validated_data
+        )
+
     def update(self, cart, validated_data):
+        cart_products = self.context['cart_products']
 
         result = []
         for position in validated_data:
-            product = position.get('product')
-            quantity = {'quantity': position.get('quantity')}
-
-            cart_product = CartProduct.objects.filter(
-                cart=cart,
-                product=product
-            ).first()
+            cart_product = cart_products.get(position.get('product').id)
 
             if cart_product:
-                result.append(self.child.update(cart_product, quantity))
+                cart_product.quantity = position.get('quantity')
+                result.append(cart_product)
 
+        CartProduct.objects.bulk_update(result, ['quantity'])
         return result
 
 
 class CartProductCreateSerializer(serializers.ModelSerializer):
+    product = CartPositionProductField(queryset=Product.objects.all())
 
     class Meta:
         model = CartProduct
@@ -164,14 +288,7 @@ class CartProductCreateSerializer(serializers.ModelSerializer):
 
         product = data.get('product')
         if request.method == 'POST':
-            cart = request.user.cart
-            product = data.get('product')
-
-            cart_product_exist = CartProduct.objects.filter(
-                cart=cart, product=product
-            ).exists()
-
-            if cart_product_exist:
+            if product.id in self.context['cart_products']:
                 raise serializers.ValidationError(
                     f'Failed! Cart already have product with id: {product.id}!'
                 )
@@ -205,7 +322,7 @@ class CartRetrieveSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_total_sum(obj: Cart) -> str:
-        total_sum = obj.cart_products.aggregate(Sum('sum'))['sum__sum']
+        total_sum = sum(cart_product.sum for cart_product in obj.cart_products.all())
         if total_sum:
             return str(total_sum)
         return '0'
@@ -220,10 +337,9 @@ class OrderCreateSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         user = self.context['request'].user
-        cart = self.context['request'].user.cart
+        cart_id = get_identity(self.context['request']).cart_id
 
-        cart_products = CartProduct.objects.filter(cart=cart)
-        if not cart_products:
+        if not CartProduct.objects.filter(cart_id=cart_id).exists():
             raise serializers.ValidationError(
                 'Failed! You do not have any positions in cart!'
             )
@@ -238,11 +354,18 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
-        created_order = super().create(validated_data)
-
-        if settings.EMAIL_ORDER_NOTIFICATIONS:
-            order_created_email.delay(created_order.id)
-            order_received_email.delay(created_order.id)
+        try:
+            with transaction.atomic():
+                created_order = super().create(validated_data)
+
+                if settings.EMAIL_ORDER_NOTIFICATIONS:
+                    OutboxEvent.objects.create(
+                        event='order_created', payload={'order_id': created_order.id},
+                    )
+        except OutOfStockError as error:
+            raise serializers.ValidationError(
+                f'Failed! Products with id: {error.product_ids}, not in stock!'
+            ) from error
 
         return created_order
 
@@ -257,30 +380,33 @@ class OrderRetrievePositionsSerializer(serializers.ModelSerializer):
         fields = ('product', 'sold_price', 'quantity', 'sum')
 
 
-class OrderRetrieveStatusesSerializer(serializers.ModelSerializer):
-    shop = serializers.StringRelatedField()
+class OrderRetrieveStatusesSerializer(serializers.Serializer):
+    shop = serializers.CharField()
+    status = serializers.CharField()
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """
+    Order as stored at checkout and status changes, read without touching positions.
+    """
+    order = serializers.PrimaryKeyRelatedField(source='id', read_only=True)
+    statuses = OrderRetrieveStatusesSerializer(many=True, read_only=True)
+    total_sum = serializers.CharField(source='total', read_only=True)
+    created_at = serializers.DateTimeField('%d.%m.%Y')
 
     class Meta:
-        model = OrderShop
-        fields = ('shop', 'status')
+        model = Order
+        fields = ('order', 'statuses', 'item_count', 'total_sum', 'created_at')
 
 
-class OrderRetrieveSerializer(serializers.ModelSerializer):
-    order = serializers.PrimaryKeyRelatedField(source='id', read_only=True)
+class OrderRetrieveSerializer(OrderSummarySerializer):
     positions = OrderRetrievePositionsSerializer(source='order_products', many=True)
-    statuses = OrderRetrieveStatusesSerializer(source='order_shops', many=True)
     shipping_note = ShippingNoteSerializer()
-    total_sum = serializers.SerializerMethodField()
-    created_at = serializers.DateTimeField('%d.%m.%Y')
 
     class Meta:
         model = Order
         fields = ('order', 'positions', 'statuses', 'shipping_note', 'total_sum', 'created_at')
 
-    @staticmethod
-    def get_total_sum(obj: Order) -> str:
-        return str(obj.order_products.aggregate(Sum('sum'))['sum__sum'])
-
 
 class OrderShopRetrieveOrderPositionsSerializer(serializers.ModelSerializer):
     sold_price = serializers.CharField()
@@ -303,7 +429,17 @@ class OrderShopRetrieveOrderSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_total_sum(obj: Order) -> str:
-        return str(obj.order_products.aggregate(Sum('sum'))['sum__sum'])
+        total_sum = sum(order_product.sum for order_product in obj.order_products.all())
+        if total_sum:
+            return str(total_sum)
+        return '0'
+
+
+def _validate_transition(from_status, to_status):
+    if to_status not in ORDER_STATUS_TRANSITIONS[from_status]:
+        raise serializers.ValidationError(
+            f'Failed! Order status can not change from {from_status} to {to_status}!'
+        )
 
 
 class OrderShopRetrieveSerializer(serializers.ModelSerializer):
@@ -313,10 +449,30 @@ class OrderShopRetrieveSerializer(serializers.ModelSerializer):
         model = OrderShop
         fields = ('order', 'status')
 
+    def validate_status(self, status):
+        if self.instance and status != self.instance.status:
+            _validate_transition(self.instance.status, status)
+        return status
+
     def update(self, order_shop, validated_data):
-        updated_order_shop = super().update(order_shop, validated_data)
+        with transaction.atomic():
+            updated_order_shop = super().update(order_shop, validated_data)
 
-        if settings.EMAIL_ORDER_NOTIFICATIONS:
-            order_updated_email.delay(updated_order_shop.id)
+            if settings.EMAIL_ORDER_NOTIFICATIONS:
+                OutboxEvent.objects.create(
+                    event='order_updated', payload={'order_shop_id': updated_order_shop.id},
+                )
 
         return updated_order_shop
+
+
+class OrderShopTransitionSerializer(serializers.Serializer):
+    orders = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1, max_length=1000,
+    )
+    from_status = serializers.ChoiceField(ORDER_STATUS_CHOICES)
+    to_status = serializers.ChoiceField(ORDER_STATUS_CHOICES)
+
+    def validate(self, data):
+        _validate_transition(data['from_status'], data['to_status'])
+        return data
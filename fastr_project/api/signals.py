@@ -0,0 +1,168 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from api import cache
+from api.authentication import invalidate_identity
+from api.models import (
+    Category, Attribute, Shop, Cart, Product, ProductAttribute, ProductTombstone,
+    Order, OrderProduct, OrderShop,
+)
+
+
+# Saved products and products with changed attributes of the current collect_product_changes block
+_product_changes = ContextVar('product_changes', default=None)
+
+# Fields of related models rendered into products of the change feed
+FEED_FIELDS = {
+    Shop: ('name', 'is_open'),
+    Category: ('name',),
+    Attribute: ('name',),
+}
+
+
+def _apply_product_changes(saved, attributes_changed):
+    Product.objects.update_search_vector(saved | attributes_changed)
+    # Attribute values are part of the product in the change feed
+    touched = attributes_changed - saved
+    if touched:
+        Product.objects.filter(id__in=touched).update(updated_at=timezone.now())
+
+
+@contextmanager
+def collect_product_changes():
+    """
+    Rebuilds search vectors of products changed within the block once on exit,
+    instead of on every product and attribute save. Yields the set of saved
+    product ids, products updated without signals are added to it.
+    """
+    saved, attributes_changed = set(), set()
+    token = _product_changes.set((saved, attributes_changed))
+    try:
+        yield saved
+    finally:
+        _product_changes.reset(token)
+    if saved or attributes_changed:
+        _apply_product_changes(saved, attributes_changed)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        changes = _product_changes.get()
+        if changes is None:
+            _apply_product_changes({instance.id}, set())
+        else:
+            changes[0].add(instance.id)
+
+
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+def product_attribute_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        changes = _product_changes.get()
+        if changes is None:
+            _apply_product_changes(set(), {instance.product_id})
+        else:
+            changes[1].add(instance.product_id)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    ProductTombstone.objects.create(product_id=instance.id, shop_id=instance.shop_id)
+
+
+@receiver(pre_save, sender=Shop)
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Attribute)
+def feed_source_saving(sender, instance, raw=False, **kwargs):
+    # Compared with the saved values by feed_source_saved
+    instance.feed_values = None
+    if not raw and instance.pk is not None:
+        instance.feed_values = (
+            sender.objects.filter(pk=instance.pk).values(*FEED_FIELDS[sender]).first()
+        )
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Attribute)
+def feed_source_saved(sender, instance, raw=False, **kwargs):
+    """
+    Brings products rendering a renamed shop, category or attribute back into the
+    change feed. Products of a closed shop leave the feed, so they get tombstones,
+    and come back once it reopens.
+    """
+    previous = getattr(instance, 'feed_values', None)
+    if raw or previous is None:
+        return
+    changed = {field for field, value in previous.items() if getattr(instance, field) != value}
+    if not changed:
+        return
+
+    if sender is Shop:
+        products = Product.objects.filter(shop=instance)
+    elif sender is Category:
+        products = Product.objects.filter(category=instance)
+    else:
+        products = Product.objects.filter(product_attributes__attribute=instance)
+
+    if sender is Shop and not instance.is_open:
+        if 'is_open' in changed:
+            ProductTombstone.objects.bulk_create(
+                (
+                    ProductTombstone(product_id=product_id, shop_id=instance.id)
+                    for product_id in products.values_list('id', flat=True).iterator()
+                ),
+                batch_size=1000,
+            )
+    else:
+        products.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=OrderProduct)
+@receiver(post_delete, sender=OrderProduct)
+@receiver(post_save, sender=OrderShop)
+@receiver(post_delete, sender=OrderShop)
+def order_changed(sender, instance, raw=False, **kwargs):
+    # Checkout writes the summary of new orders itself, with bulk inserts that send no signals
+    if not raw:
+        Order.objects.refresh_summary([instance.order_id])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Attribute)
+@receiver(post_delete, sender=Attribute)
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+def catalog_changed(sender, **kwargs):
+    cache.invalidate(sender)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def user_changed(sender, instance, **kwargs):
+    invalidate_identity(instance.id)
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def identity_changed(sender, instance, **kwargs):
+    invalidate_identity(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Shop.categories.through)
+def shop_categories_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        cache.invalidate(Shop)
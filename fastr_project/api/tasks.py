@@ -1,14 +1,66 @@
-from django.core.mail import EmailMessage
+from smtplib import SMTPException
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
 
 from celery import shared_task
 
-from api.models import Order, OrderShop
+from api.databases import get_or_primary, list_or_primary
+from api.importers import import_price_list
+from api.models import Order, OrderShop, OutboxEvent
 
 
-@shared_task
-def order_created_email(order_id):
+# Notification tasks only read, from the replica if there is one
+EMAIL_RETRY_OPTIONS = {
+    'bind': True, 'max_retries': 5, 'default_retry_delay': 60, 'reads_replica': True,
+}
+
+SENT_EMAIL_KEY = 'api:tasks:sent:{}:{}'
+# Seconds messages of a task are remembered as sent, longer than all retries of the task take
+SENT_EMAIL_TIMEOUT = 24 * 60 * 60
 
-    order = Order.objects.get(id=order_id)
+
+def send_emails(messages, task_id=None):
+    """
+    Sends messages over one SMTP connection. Returns keys of messages failed to send.
+    Messages sent by the task with the same id before are skipped, so a task
+    delivered again does not send them twice.
+    """
+    if task_id is not None:
+        sent_keys = {key: SENT_EMAIL_KEY.format(task_id, key) for key in messages}
+        sent = cache.get_many(sent_keys.values())
+        messages = {key: msg for key, msg in messages.items() if sent_keys[key] not in sent}
+
+    if not messages:
+        return []
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except (SMTPException, OSError):
+        return list(messages)
+
+    failed = []
+    try:
+        for key, msg in messages.items():
+            try:
+                connection.send_messages([msg])
+            except (SMTPException, OSError):
+                failed.append(key)
+            else:
+                if task_id is not None:
+                    cache.set(sent_keys[key], True, timeout=SENT_EMAIL_TIMEOUT)
+    finally:
+        connection.close()
+    return failed
+
+
+@shared_task(**EMAIL_RETRY_OPTIONS)
+def order_created_email(self, order_id):
+
+    order = get_or_primary(Order.objects.select_related('user'), id=order_id)
 
     msg_body = f"""
     Hello, {order.user.get_short_name()}!
@@ -26,16 +78,21 @@ def order_created_email(order_id):
         to=(order.user.email,),
         body=msg_body,
     )
-    msg.send()
+    if send_emails({order.id: msg}, self.request.id):
+        raise self.retry()
 
 
-@shared_task
-def order_received_email(order_id):
-
-    order = Order.objects.get(id=order_id)
-    order_shops = OrderShop.objects.filter(order=order)
+@shared_task(**EMAIL_RETRY_OPTIONS)
+def order_received_email(self, order_id, shop_ids=None):
+    """
+    Notifies shops of the order. Retries only notifications of shops failed to send.
+    """
+    order_shops = OrderShop.objects.select_related('order', 'shop__user').filter(order=order_id)
+    if shop_ids is not None:
+        order_shops = order_shops.filter(shop__in=shop_ids)
 
-    for order_shop in order_shops:
+    messages = {}
+    for order_shop in list_or_primary(order_shops):
 
         msg_body = f"""
         Hello, {order_shop.shop.user.get_short_name()}!
@@ -48,18 +105,23 @@ def order_received_email(order_id):
         The FASTR team
         """
 
-        msg = EmailMessage(
+        messages[order_shop.shop_id] = EmailMessage(
             subject='New order received on FASTR.com!',
             to=(order_shop.shop.user.email,),
             body=msg_body,
         )
-        msg.send()
 
+    failed_shop_ids = send_emails(messages, self.request.id)
+    if failed_shop_ids:
+        raise self.retry(args=(order_id,), kwargs={'shop_ids': failed_shop_ids})
 
-@shared_task
-def order_updated_email(order_shop_id):
 
-    order_shop = OrderShop.objects.get(id=order_shop_id)
+@shared_task(**EMAIL_RETRY_OPTIONS)
+def order_updated_email(self, order_shop_id):
+
+    order_shop = get_or_primary(
+        OrderShop.objects.select_related('order__user', 'shop'), id=order_shop_id,
+    )
 
     msg_body = f"""
         Hello, {order_shop.order.user.get_short_name()}!
@@ -78,4 +140,86 @@ def order_updated_email(order_shop_id):
         to=(order_shop.order.user.email,),
         body=msg_body,
     )
-    msg.send()
+    if send_emails({order_shop.id: msg}, self.request.id):
+        raise self.retry()
+
+
+@shared_task(**EMAIL_RETRY_OPTIONS)
+def orders_updated_email(self, order_shop_ids):
+    """
+    Notifies a buyer of status changes of their orders in one message.
+    """
+    order_shops = list_or_primary(
+        OrderShop.objects.select_related('order__user', 'shop')
+        .filter(id__in=order_shop_ids)
+        .order_by('order_id')
+    )
+    if not order_shops:
+        return
+
+    user = order_shops[0].order.user
+    orders = '\n'.join(
+        f'        Order ID: {order_shop.order.id}, shop {order_shop.shop.name}: {order_shop.status}'
+        for order_shop in order_shops
+    )
+
+    msg_body = f"""
+        Hello, {user.get_short_name()}!
+        Shops from your orders have updated order statuses
+
+{orders}
+
+        Thanks for using our site!
+        The FASTR team
+        """
+
+    msg = EmailMessage(
+        subject='Shops have updated your order statuses on FASTR.com!',
+        to=(user.email,),
+        body=msg_body,
+    )
+    if send_emails({user.id: msg}, self.request.id):
+        raise self.retry()
+
+
+@shared_task
+def import_products(product_import_id):
+    return import_price_list(product_import_id)
+
+
+# Tasks each outbox event is relayed to, called with the event payload.
+# Tasks may get an event twice and must not repeat its effects: email tasks skip
+# messages sent under the same task id, imports only start pending price lists.
+OUTBOX_EVENT_TASKS = {
+    'order_created': (order_created_email, order_received_email),
+    'order_updated': (order_updated_email,),
+    'orders_updated': (orders_updated_email,),
+    'product_import': (import_products,),
+}
+
+
+@shared_task
+def relay_outbox_events():
+    """
+    Publishes pending outbox events to their tasks in batches, oldest first.
+    Events are deleted in the transaction that published them and locked rows
+    are skipped, so overlapping relays do not publish the same event. Delivery
+    is at least once: events published by a transaction that failed to commit
+    are published again, with the same task ids derived from the event.
+    """
+    relayed = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                OutboxEvent.objects.select_for_update(skip_locked=True)
+                .order_by('id')[:settings.OUTBOX_BATCH_SIZE]
+            )
+            for event in events:
+                for task in OUTBOX_EVENT_TASKS[event.event]:
+                    task.apply_async(kwargs=event.payload, task_id=f'outbox-{event.id}-{task.name}')
+
+            OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+
+        relayed += len(events)
+        if len(events) < settings.OUTBOX_BATCH_SIZE:
+            return relayed
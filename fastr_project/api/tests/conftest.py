@@ -1,10 +1,56 @@
+import os
+
 import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from asgiref.testing import ApplicationCommunicator
+
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache, caches
 
 from rest_framework.test import APIClient
 
 from model_bakery import baker
 
 from api.models import Cart
+from fastr.asgi import application as asgi_application
+
+
+# Search vectors are computed by the database
+baker.generators.add(SearchVectorField, lambda: None)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Test database rollbacks do not reach cached responses
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    # Uploaded price lists are stored in a directory of their own per test
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+
+
+@pytest.fixture
+def redis_caches(settings):
+    """
+    Default and metrics caches on the Redis server of CACHE_URL, or of TEST_REDIS_URL
+    when the tests run with another cache. Skips the test if the server is down.
+    """
+    if settings.CACHE_URL.startswith('redis'):
+        url = settings.CACHE_URL
+    else:
+        url = os.environ.get('TEST_REDIS_URL', 'redis://localhost:6379/15')
+    redis_cache = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url}
+    settings.CACHES = {'default': redis_cache, 'metrics': redis_cache}
+
+    try:
+        cache.clear()
+    except RedisConnectionError:
+        pytest.skip(f'Redis server is not available at {url}')
+    yield caches['default']
+    cache.clear()
 
 
 @pytest.fixture
@@ -73,3 +119,46 @@ def model_prepare():
         return baker.prepare(model, _fill_optional=True, *args, **kwargs)
 
     return factory
+
+
+@pytest.fixture
+def assert_max_queries(django_assert_max_num_queries):
+
+    def check(client, url, max_queries):
+        with django_assert_max_num_queries(max_queries):
+            resp = client.get(url)
+
+        assert resp.status_code == 200
+        return resp
+
+    return check
+
+
+@pytest.fixture
+def asgi_get():
+    """
+    Sends a GET request through the ASGI application. Returns status and body.
+    """
+    async def get(path, query_string=''):
+        communicator = ApplicationCommunicator(asgi_application, {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'query_string': query_string.encode(),
+            'headers': [(b'host', b'testserver')],
+        })
+        await communicator.send_input({'type': 'http.request'})
+
+        start = await communicator.receive_output(timeout=30)
+        body = b''
+        more_body = True
+        while more_body:
+            message = await communicator.receive_output(timeout=30)
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+        return start['status'], body
+
+    return get
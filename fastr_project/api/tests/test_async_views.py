@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import pytest
+
+from asgiref.sync import async_to_sync
+
+from django.core.cache import caches
+from django.urls import resolve, reverse
+
+from api import metrics
+from api.models import Category, Product, Shop
+
+
+ASYNC_URLCONF = 'fastr.asgi_urls'
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAsyncCatalogViews:
+    def test_async_routes(self):
+        for name, args in (
+            ('api:categories-list', ()),
+            ('api:categories-detail', (1,)),
+            ('api:shops-list', ()),
+            ('api:shops-detail', (1,)),
+            ('api:products-list', ()),
+            ('api:products-detail', (1,)),
+        ):
+            url = reverse(name, args=args, urlconf=ASYNC_URLCONF)
+            assert url == reverse(name, args=args)
+            assert asyncio.iscoroutinefunction(resolve(url, urlconf=ASYNC_URLCONF).func)
+            assert not asyncio.iscoroutinefunction(resolve(url).func)
+
+        for url in (reverse('api:buyer-cart'), reverse('api:products-facets')):
+            assert not asyncio.iscoroutinefunction(resolve(url, urlconf=ASYNC_URLCONF).func)
+
+    def test_async_responses(self, anon_client, asgi_get, model_create):
+        shop = model_create(Shop)
+        category = model_create(Category)
+        product = model_create(Product, shop=shop, category=category)
+
+        for url in (
+            reverse('api:categories-list'),
+            reverse('api:categories-detail', args=(category.id,)),
+            reverse('api:shops-list'),
+            reverse('api:shops-detail', args=(shop.id,)),
+            reverse('api:products-list'),
+            reverse('api:products-detail', args=(product.id,)),
+        ):
+            status, body = async_to_sync(asgi_get)(url)
+
+            assert status == 200
+            assert json.loads(body) == anon_client.get(url).json()
+
+    def test_async_not_found(self, asgi_get):
+        status, _ = async_to_sync(asgi_get)(reverse('api:products-detail', args=(0,)))
+
+        assert status == 404
+
+    def test_async_metrics(self, asgi_get, settings, model_create):
+        settings.METRICS_FLUSH_INTERVAL = 0
+        metrics.flush(force=True)
+        caches[metrics.METRICS_CACHE].clear()
+        model_create(Product)
+
+        for url in (reverse('api:products-list'), reverse('api:buyer-shipping-notes-list')):
+            async_to_sync(asgi_get)(url)
+        metrics.flush(force=True)
+        lines = metrics.render().splitlines()
+
+        assert 'fastr_http_requests_total{method="GET",route="api:products-list",status="200"} 1' in lines
+        assert 'fastr_http_request_db_queries_bucket{method="GET",route="api:products-list",le="0"} 0' in lines
+        assert 'fastr_http_requests_total{method="GET",route="api:buyer-shipping-notes-list",status="401"} 1' in lines
@@ -0,0 +1,85 @@
+import pytest
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.authentication import IDENTITY_KEY, load_identity
+from api.models import Category, Shop
+
+
+def _jwt_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+@pytest.mark.django_db
+class TestCachedJWTAuthentication:
+    def test_identity_cached(self, seller_user, model_create):
+        shop = model_create(Shop, user=seller_user)
+        client = _jwt_client(seller_user)
+        url = reverse('api:seller-shop')
+
+        with CaptureQueriesContext(connection) as cold:
+            resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.json()['name'] == shop.name
+
+        with CaptureQueriesContext(connection) as warm:
+            resp = client.get(url)
+        assert resp.status_code == 200
+        assert len(warm) == 2
+        assert len(cold) == 3
+
+    def test_identity_cached_without_user_data(self, buyer_user):
+        client = _jwt_client(buyer_user)
+        assert client.get(reverse('api:buyer-cart')).status_code == 200
+
+        cached = cache.get(IDENTITY_KEY.format(buyer_user.id))
+        assert cached == (buyer_user.id, True, 'buyer', None, buyer_user.cart.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = client.get(reverse('users:user_details'))
+        assert resp.status_code == 200
+        assert resp.json()['email'] == buyer_user.email
+        assert len(queries) == 1
+
+    def test_identity_invalidated_on_shop_change(self, seller_user, model_create):
+        category = model_create(Category)
+        client = _jwt_client(seller_user)
+        url = reverse('api:seller-shop')
+
+        assert client.get(url).status_code == 403
+        assert load_identity(seller_user.id).shop_id is None
+
+        resp = client.post(url, data={'name': 'Lamps', 'categories': [category.id]})
+        assert resp.status_code == 201
+
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.json()['name'] == 'Lamps'
+        assert client.post(url, data={'name': 'Chairs', 'categories': [category.id]}).status_code == 403
+
+    def test_identity_invalidated_on_user_change(self, buyer_user):
+        client = _jwt_client(buyer_user)
+        url = reverse('api:buyer-cart')
+
+        assert client.get(url).status_code == 200
+
+        buyer_user.is_active = False
+        buyer_user.save()
+        assert client.get(url).status_code == 401
+
+    def test_user_not_found(self, buyer_user):
+        client = _jwt_client(buyer_user)
+        buyer_user.delete()
+
+        assert client.get(reverse('api:buyer-cart')).status_code == 401
+
+    def test_anonymous_user(self, anon_client):
+        assert anon_client.get(reverse('api:seller-shop')).status_code == 401
@@ -0,0 +1,484 @@
+import asyncio
+import contextlib
+import os
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from statistics import median, quantiles
+
+import pytest
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.tokens import default_token_generator
+from django.core.wsgi import get_wsgi_application
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, reset_queries
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import (
+    Attribute, Category, Shop, ShippingNote, Product, ProductAttribute, CartProduct, Order, OrderShop,
+)
+
+
+# Run with: pytest -m benchmark
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db]
+
+# Seeded data volumes are multiplied by the scale
+SCALE = int(os.environ.get('BENCHMARK_SCALE', 1))
+
+# Timed requests of every route, after one cold request
+ROUNDS = int(os.environ.get('BENCHMARK_ROUNDS', 20))
+
+# Latency ceilings are multiplied by the factor on slower machines
+LATENCY_FACTOR = float(os.environ.get('BENCHMARK_LATENCY_FACTOR', 1))
+
+# Concurrent requests of the load comparison between the ASGI and WSGI applications
+CONCURRENCY = int(os.environ.get('BENCHMARK_CONCURRENCY', 32))
+
+PASSWORD = 'Benchmark-Password-1'
+
+# Ceilings per route: queries of the cold request, p95 latency in ms, peak traced memory in KiB.
+# Memory ceilings are multiplied by the scale, query ceilings hold for any scale.
+# Ceilings hold on SQLite and PostgreSQL alike.
+THRESHOLDS = {
+    'categories-list': (2, 50, 256),
+    'categories-detail': (2, 50, 256),
+    'attributes-list': (2, 50, 256),
+    'attributes-detail': (2, 50, 256),
+    'attributes-create': (3, 50, 256),
+    'products-list': (3, 100, 2048),
+    'products-detail': (3, 50, 256),
+    'products-search': (3, 100, 2048),
+    'products-filter': (3, 100, 1024),
+    'products-facets': (2, 100, 4096),
+    'products-export': (4, 500, 4096),
+    'products-changes': (4, 300, 4096),
+    'shops-list': (3, 50, 256),
+    'shops-detail': (3, 50, 256),
+    'seller-shop': (3, 50, 256),
+    'seller-shop-update': (6, 50, 256),
+    'seller-products-list': (4, 250, 4096),
+    'seller-products-detail': (4, 50, 256),
+    'seller-products-create': (15, 100, 256),
+    'seller-products-update': (25, 250, 512),
+    'seller-product-imports-list': (3, 100, 512),
+    'seller-product-imports-create': (6, 100, 256),
+    'seller-orders-list': (4, 150, 2048),
+    'seller-orders-detail': (4, 100, 512),
+    'seller-orders-update': (15, 150, 512),
+    'seller-orders-transition': (12, 300, 512),
+    'buyer-shipping-notes-list': (2, 50, 256),
+    'buyer-shipping-notes-create': (2, 50, 256),
+    'buyer-cart': (3, 100, 512),
+    'buyer-cart-create': (5, 100, 512),
+    'buyer-cart-update': (5, 100, 512),
+    'buyer-cart-delete': (3, 50, 256),
+    'buyer-orders-list': (2, 100, 1024),
+    'buyer-orders-detail': (3, 100, 512),
+    'buyer-orders-create': (17, 200, 512),
+    'users-profile': (2, 50, 256),
+    'users-registration': (3, 1000, 256),
+    'users-token-create': (2, 1000, 256),
+    'users-token-verify': (0, 50, 256),
+    'users-token-refresh': (0, 50, 256),
+    'users-password-change': (10, 2000, 1024),
+    'users-password-reset': (2, 50, 256),
+    'users-password-reset-confirm': (3, 1000, 256),
+}
+
+
+def _client(user=None):
+    client = APIClient()
+    if user is not None:
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+def _consume(resp):
+    if resp.streaming:
+        for _ in resp.streaming_content:
+            pass
+    return resp
+
+
+@pytest.fixture(autouse=True)
+def no_throttling(monkeypatch):
+    # Timed rounds and load requests exceed the rate limits of a single client
+    monkeypatch.setattr(APIView, 'throttle_classes', [])
+
+
+@pytest.fixture
+def benchmark(record_property):
+    """
+    Measures a route: queries of a cold request, latency of timed rounds and peak
+    memory of one traced round. Setup runs before every request and is not measured.
+    """
+    def run(name, send, setup=None, rounds=ROUNDS):
+        max_queries, max_p95, max_memory = THRESHOLDS[name]
+
+        def request(number, context=None):
+            if setup is not None:
+                setup(number)
+            # Requests clear the query log when they start, captured queries are read before the next one
+            reset_queries()
+            with contextlib.nullcontext() if context is None else context:
+                start = time.perf_counter()
+                resp = _consume(send(number))
+                elapsed = (time.perf_counter() - start) * 1000
+            assert resp.status_code < 400, resp.content
+            return elapsed
+
+        context = CaptureQueriesContext(connection)
+        request(0, context)
+        queries = [query['sql'] for query in context.captured_queries]
+        timings = [request(number) for number in range(1, rounds + 1)]
+
+        tracemalloc.start()
+        try:
+            request(rounds + 1)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        result = {
+            'queries': len(queries),
+            'p50': round(median(timings), 2),
+            'p95': round(quantiles(timings, n=20, method='inclusive')[-1], 2),
+            'peak_memory': peak_memory // 1024,
+        }
+        record_property(name, result)
+
+        assert result['queries'] <= max_queries, '\n'.join(queries)
+        assert result['p95'] <= max_p95 * LATENCY_FACTOR
+        assert result['peak_memory'] <= max_memory * SCALE
+        return result
+
+    return run
+
+
+@pytest.fixture
+def catalog(model_create, seller_user):
+    shop = model_create(Shop, user=seller_user)
+    categories = model_create(Category, _quantity=10)
+    attributes = model_create(Attribute, _quantity=10)
+
+    products = model_create(Product, shop=shop, category=categories[0], _quantity=100 * SCALE)
+    for number, category in enumerate(categories[1:]):
+        products += model_create(Product, category=category, _quantity=10 * SCALE)
+    ProductAttribute.objects.bulk_create(
+        ProductAttribute(product=product, attribute=attribute, value=str(number % 7))
+        for number, product in enumerate(products)
+        for attribute in attributes[:3]
+    )
+    Product.objects.update_search_vector([product.id for product in products])
+    return {'shop': shop, 'categories': categories, 'attributes': attributes, 'products': products}
+
+
+@pytest.fixture
+def orders(model_create, catalog, buyer_user):
+    shipping_note = model_create(ShippingNote, user=buyer_user)
+    orders = []
+    for number in range(20 * SCALE):
+        for product in catalog['products'][number * 3:number * 3 + 3]:
+            model_create(CartProduct, cart=buyer_user.cart, product=product, quantity=1)
+        orders.append(model_create(Order, user=buyer_user, shipping_note=shipping_note))
+    return orders
+
+
+class TestCatalogBenchmarks:
+    def test_categories(self, benchmark, catalog, buyer_user):
+        client = _client(buyer_user)
+        category = catalog['categories'][0]
+
+        benchmark('categories-list', lambda _: client.get(reverse('api:categories-list')))
+        benchmark('categories-detail', lambda _: client.get(reverse('api:categories-detail', args=(category.id,))))
+
+    def test_attributes(self, benchmark, catalog, seller_user):
+        client = _client(seller_user)
+        attribute = catalog['attributes'][0]
+
+        benchmark('attributes-list', lambda _: client.get(reverse('api:attributes-list')))
+        benchmark('attributes-detail', lambda _: client.get(reverse('api:attributes-detail', args=(attribute.id,))))
+        benchmark('attributes-create', lambda number: client.post(
+            reverse('api:attributes-list'), {'name': f'Benchmark {number}'},
+        ))
+
+    def test_products(self, benchmark, catalog, buyer_user, settings):
+        client = _client(buyer_user)
+        settings.CHANGES_SETTLE_LAG = 0
+        product = catalog['products'][0]
+        url = reverse('api:products-list')
+
+        benchmark('products-list', lambda _: client.get(url))
+        benchmark('products-detail', lambda _: client.get(reverse('api:products-detail', args=(product.id,))))
+        benchmark('products-search', lambda _: client.get(url, {'search': product.name[:5]}))
+        benchmark('products-filter', lambda _: client.get(url, {
+            'category': catalog['categories'][0].id, 'attribute': f'{catalog["attributes"][0].id}:1',
+        }))
+        benchmark('products-facets', lambda _: client.get(reverse('api:products-facets')))
+        benchmark('products-export', lambda _: client.get(reverse('api:products-export'), {'format': 'csv'}))
+        benchmark('products-changes', lambda _: client.get(reverse('api:products-changes')))
+
+    def test_shops(self, benchmark, catalog, buyer_user):
+        client = _client(buyer_user)
+
+        benchmark('shops-list', lambda _: client.get(reverse('api:shops-list')))
+        benchmark('shops-detail', lambda _: client.get(reverse('api:shops-detail', args=(catalog['shop'].id,))))
+
+
+class TestSellerBenchmarks:
+    def test_shop(self, benchmark, catalog, seller_user):
+        client = _client(seller_user)
+        url = reverse('api:seller-shop')
+
+        benchmark('seller-shop', lambda _: client.get(url))
+        benchmark('seller-shop-update', lambda number: client.patch(url, {'is_open': bool(number % 2)}))
+
+    def test_products(self, benchmark, catalog, seller_user):
+        client = _client(seller_user)
+        product = catalog['products'][0]
+        attributes = [{'id': attribute.id, 'value': 'Benchmark'} for attribute in catalog['attributes'][:3]]
+
+        def product_attrs(number):
+            return {
+                'category': catalog['categories'][0].id,
+                'sku': f'BENCH-{number}',
+                'name': f'Benchmark {number}',
+                'description': 'Benchmark',
+                'product_attributes': attributes,
+                'stock_quantity': 10,
+                'price': '9.99',
+            }
+
+        benchmark('seller-products-list', lambda _: client.get(reverse('api:seller-products-list')))
+        benchmark('seller-products-detail', lambda _: client.get(
+            reverse('api:seller-products-detail', args=(product.id,)),
+        ))
+        benchmark('seller-products-create', lambda number: client.post(
+            reverse('api:seller-products-list'), product_attrs(number),
+        ))
+        benchmark('seller-products-update', lambda number: client.patch(
+            reverse('api:seller-products-detail', args=(product.id,)),
+            {'price': f'{number + 1}.50', 'product_attributes': attributes},
+        ))
+
+    def test_product_imports(self, benchmark, catalog, seller_user, settings):
+        client = _client(seller_user)
+        settings.EMAIL_ORDER_NOTIFICATIONS = False
+        data = b'sku,name,description,category,price,stock_quantity\nA,Lamp,Lamp,Lamps,10,1\n'
+
+        benchmark('seller-product-imports-create', lambda _: client.post(
+            reverse('api:seller-product-imports-list'),
+            {'file': SimpleUploadedFile('products.csv', data)},
+            format='multipart',
+        ))
+        benchmark('seller-product-imports-list', lambda _: client.get(reverse('api:seller-product-imports-list')))
+
+    def test_orders(self, benchmark, orders, seller_user, settings):
+        client = _client(seller_user)
+        settings.EMAIL_ORDER_NOTIFICATIONS = False
+        url = reverse('api:seller-orders-detail', kwargs={'order': orders[0].id})
+
+        benchmark('seller-orders-list', lambda _: client.get(reverse('api:seller-orders-list')))
+        benchmark('seller-orders-detail', lambda _: client.get(url))
+        def reset_statuses(_):
+            OrderShop.objects.filter(order__in=orders).update(status='new')
+
+        benchmark('seller-orders-update', lambda _: client.patch(url, {'status': 'confirmed'}), setup=reset_statuses)
+        benchmark('seller-orders-transition', lambda _: client.post(reverse('api:seller-orders-transition'), {
+            'orders': [order.id for order in orders], 'from_status': 'new', 'to_status': 'confirmed',
+        }), setup=reset_statuses)
+
+
+class TestBuyerBenchmarks:
+    def test_shipping_notes(self, benchmark, buyer_user, model_create, model_prepare):
+        client = _client(buyer_user)
+        model_create(ShippingNote, user=buyer_user, _quantity=10)
+        shipping_note = model_prepare(ShippingNote)
+        url = reverse('api:buyer-shipping-notes-list')
+
+        benchmark('buyer-shipping-notes-list', lambda _: client.get(url))
+        benchmark('buyer-shipping-notes-create', lambda _: client.post(url, {
+            field: getattr(shipping_note, field)
+            for field in ('country', 'city', 'street', 'house', 'building', 'office', 'phone')
+        }))
+
+    def test_cart(self, benchmark, catalog, buyer_user):
+        client = _client(buyer_user)
+        url = reverse('api:buyer-cart')
+        products = [product.id for product in catalog['products']]
+        positions = 10
+
+        def fill_cart(_):
+            CartProduct.objects.filter(cart=buyer_user.cart).delete()
+            CartProduct.objects.bulk_create(
+                CartProduct(cart=buyer_user.cart, product_id=product_id, quantity=1)
+                for product_id in products[:positions]
+            )
+
+        def empty_cart(_):
+            CartProduct.objects.filter(cart=buyer_user.cart).delete()
+
+        benchmark('buyer-cart-create', lambda _: client.post(
+            url, [{'product': product_id, 'quantity': 1} for product_id in products[:positions]],
+        ), setup=empty_cart)
+        benchmark('buyer-cart', lambda _: client.get(url))
+        benchmark('buyer-cart-update', lambda number: client.patch(
+            url, [{'product': product_id, 'quantity': number % 5 + 1} for product_id in products[:positions]],
+        ))
+        benchmark('buyer-cart-delete', lambda _: client.delete(
+            url, {'products': products[:positions]},
+        ), setup=fill_cart)
+
+    def test_orders(self, benchmark, orders, catalog, buyer_user, settings):
+        client = _client(buyer_user)
+        settings.EMAIL_ORDER_NOTIFICATIONS = False
+        products = catalog['products'][-10:]
+        Product.objects.filter(id__in=[product.id for product in products]).update(stock_quantity=32000)
+
+        def fill_cart(_):
+            CartProduct.objects.bulk_create(
+                CartProduct(cart=buyer_user.cart, product=product, quantity=1) for product in products
+            )
+
+        benchmark('buyer-orders-list', lambda _: client.get(reverse('api:buyer-orders-list')))
+        benchmark('buyer-orders-detail', lambda _: client.get(
+            reverse('api:buyer-orders-detail', args=(orders[0].id,)),
+        ))
+        benchmark('buyer-orders-create', lambda _: client.post(
+            reverse('api:buyer-orders-list'), {'shipping_note': orders[0].shipping_note_id},
+        ), setup=fill_cart)
+        assert OrderShop.objects.filter(shop=products[0].shop).exists()
+
+
+class TestUsersBenchmarks:
+    @pytest.fixture
+    def user(self, django_user_model):
+        user = django_user_model.objects.create_user(email='benchmark@gmail.com', password=PASSWORD, type='buyer')
+        return user
+
+    def test_profile(self, benchmark, user):
+        client = _client(user)
+
+        benchmark('users-profile', lambda _: client.get(reverse('users:user_details')))
+
+    def test_registration(self, benchmark):
+        client = _client()
+
+        benchmark('users-registration', lambda number: client.post(reverse('users:registration'), {
+            'email': f'benchmark{number}@gmail.com',
+            'password': PASSWORD,
+            'first_name': 'Bench',
+            'last_name': 'Mark',
+            'company': 'Fastr',
+            'position': 'QA',
+            'type': 'buyer',
+        }), rounds=3)
+
+    def test_tokens(self, benchmark, user):
+        client = _client()
+        refresh = RefreshToken.for_user(user)
+
+        benchmark('users-token-create', lambda _: client.post(
+            reverse('users:token_create'), {'email': user.email, 'password': PASSWORD},
+        ), rounds=3)
+        benchmark('users-token-verify', lambda _: client.post(
+            reverse('users:token_verify'), {'token': str(refresh.access_token)},
+        ))
+        benchmark('users-token-refresh', lambda _: client.post(
+            reverse('users:token_refresh'), {'refresh': str(refresh)},
+        ))
+
+    def test_passwords(self, benchmark, user):
+        client = _client(user)
+        uid = urlsafe_base64_encode(force_bytes(user.pk))
+        tokens = {}
+
+        def make_token(number):
+            user.refresh_from_db()
+            tokens[number] = default_token_generator.make_token(user)
+
+        benchmark('users-password-change', lambda _: client.post(reverse('users:password_change'), {
+            'old_password': PASSWORD, 'new_password1': PASSWORD, 'new_password2': PASSWORD,
+        }), rounds=3)
+        benchmark('users-password-reset', lambda _: client.post(
+            reverse('users:rest_password_reset'), {'email': user.email},
+        ))
+        benchmark('users-password-reset-confirm', lambda number: client.post(
+            reverse('users:rest_password_reset_confirm'),
+            {'uid': uid, 'token': tokens[number], 'new_password1': PASSWORD, 'new_password2': PASSWORD},
+        ), setup=make_token, rounds=3)
+
+
+def _load_result(results, elapsed):
+    statuses, timings = zip(*results)
+    assert set(statuses) == {200}
+    return {
+        'throughput': round(len(timings) / elapsed, 1),
+        'p50': round(median(timings), 2),
+        'p95': round(quantiles(timings, n=20, method='inclusive')[-1], 2),
+        'p99': round(quantiles(timings, n=100, method='inclusive')[-1], 2),
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+class TestLoadBenchmarks:
+    """
+    Catalog reads at CONCURRENCY concurrent requests: through the WSGI application
+    on a thread per request slot, and through the ASGI application on one event loop.
+    Query strings are unique per request, so no response is served from the cache.
+    """
+    def test_catalog_load(self, catalog, asgi_get, record_property):
+        product, shop = catalog['products'][0], catalog['shop']
+        paths = [
+            reverse('api:categories-list'),
+            reverse('api:categories-detail', args=(catalog['categories'][0].id,)),
+            reverse('api:shops-list'),
+            reverse('api:shops-detail', args=(shop.id,)),
+            reverse('api:products-list'),
+            reverse('api:products-detail', args=(product.id,)),
+        ]
+        requests = [(paths[number % len(paths)], f'load={number}') for number in range(CONCURRENCY * ROUNDS)]
+
+        wsgi_application = get_wsgi_application()
+        factory = RequestFactory()
+
+        def wsgi_get(request):
+            path, query_string = request
+            environ = factory.get(f'{path}?{query_string}').environ
+            statuses = []
+            start = time.perf_counter()
+            response = wsgi_application(environ, lambda status, headers: statuses.append(status))
+            b''.join(response)
+            response.close()
+            return int(statuses[0][:3]), (time.perf_counter() - start) * 1000
+
+        async def asgi_load():
+            slots = asyncio.Semaphore(CONCURRENCY)
+
+            async def timed_get(request):
+                async with slots:
+                    start = time.perf_counter()
+                    status, _ = await asgi_get(*request)
+                    return status, (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*map(timed_get, requests))
+            return results, time.perf_counter() - start
+
+        with ThreadPoolExecutor(CONCURRENCY) as pool:
+            start = time.perf_counter()
+            wsgi = _load_result(list(pool.map(wsgi_get, requests)), time.perf_counter() - start)
+        asgi = _load_result(*async_to_sync(asgi_load)())
+
+        record_property('catalog-load-wsgi', wsgi)
+        record_property('catalog-load-asgi', asgi)
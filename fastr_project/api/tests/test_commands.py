@@ -0,0 +1,73 @@
+from io import StringIO
+
+import pytest
+
+from django.core.management import CommandError, call_command
+from django.db.models import Count
+
+from api.models import Attribute, CartProduct, Category, Order, OrderShop, Product, ProductAttribute, Shop
+from users.models import User
+
+
+SEED_OPTIONS = {
+    'seed': 7,
+    'shops': 3,
+    'products_per_shop': 20,
+    'categories': 4,
+    'attributes': 5,
+    'attributes_per_product': 2,
+    'buyers': 10,
+    'orders': 30,
+    'batch_size': 25,
+}
+
+
+def _seed_load(**options):
+    call_command('seed_load', stdout=StringIO(), **{**SEED_OPTIONS, **options})
+
+
+def _dataset():
+    return (
+        list(Product.objects.order_by('id').values_list('sku', 'name', 'price', 'stock_quantity')),
+        list(Order.objects.order_by('id').values_list('total', 'item_count', 'statuses')),
+    )
+
+
+@pytest.mark.django_db
+class TestSeedLoad:
+    def test_seed_load(self):
+        _seed_load()
+
+        assert Shop.objects.count() == 3
+        assert Product.objects.count() == 60
+        assert User.objects.filter(type='buyer').count() == 10
+        assert Order.objects.count() == 30
+        assert CartProduct.objects.exists()
+        assert not ProductAttribute.objects.values('product').annotate(
+            count=Count('id'),
+        ).exclude(count=2).exists()
+
+        orders = list(Order.objects.order_by('id').values_list('total', 'item_count', 'statuses'))
+        Order.objects.refresh_summary(Order.objects.values('id'))
+        assert list(Order.objects.order_by('id').values_list('total', 'item_count', 'statuses')) == orders
+        assert OrderShop.objects.count() == sum(len(statuses) for _, _, statuses in orders)
+
+        category = Category.objects.create(name='Lamps')
+        assert category.id == Category.objects.exclude(id=category.id).order_by('-id').first().id + 1
+
+    def test_seed_load_deterministic(self):
+        _seed_load()
+        dataset = _dataset()
+
+        User.objects.filter(email__startswith='seed7-').delete()
+        Category.objects.filter(name__startswith='seed7 ').delete()
+        Attribute.objects.filter(name__startswith='seed7 ').delete()
+        _seed_load()
+
+        assert _dataset() == dataset
+
+    def test_seed_load_twice(self):
+        _seed_load()
+
+        with pytest.raises(CommandError):
+            _seed_load()
@@ -0,0 +1,111 @@
+import pytest
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api import databases
+from api.models import Category, Order, Product, Shop
+from api.tasks import order_created_email
+
+
+@pytest.fixture
+def replica(settings):
+    settings.REPLICA_DATABASE = 'replica'
+    settings.READ_YOUR_WRITES_TIMEOUT = 60
+    return connections['replica']
+
+
+@pytest.mark.django_db(transaction=True, databases='__all__')
+class TestReplicaRouting:
+    def test_catalog_reads_replica(self, anon_client, model_create, replica):
+        shop = model_create(Shop, is_open=True)
+        model_create(Product, shop=shop, category=model_create(Category))
+
+        for name in ('api:categories-list', 'api:shops-list', 'api:products-list'):
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary:
+                with CaptureQueriesContext(replica) as replicated:
+                    resp = anon_client.get(reverse(name))
+            assert resp.status_code == 200
+            assert replicated
+            assert not primary
+
+    def test_primary_without_replica(self, anon_client, model_create):
+        model_create(Category)
+
+        with CaptureQueriesContext(connections['replica']) as replicated:
+            resp = anon_client.get(reverse('api:categories-list'))
+        assert resp.status_code == 200
+        assert not replicated
+
+    def test_read_your_writes(self, buyer_user, buyer_client, model_create, replica):
+        product = model_create(Product, stock_quantity=10)
+        url = reverse('api:products-detail', args=(product.id,))
+
+        with CaptureQueriesContext(replica) as replicated:
+            assert buyer_client.get(url).status_code == 200
+        assert replicated
+
+        resp = buyer_client.post(reverse('api:buyer-cart'), [{'product': product.id, 'quantity': 1}])
+        assert resp.status_code == 201
+        assert databases.is_sticky(buyer_user)
+
+        with CaptureQueriesContext(replica) as replicated:
+            assert buyer_client.get(url).status_code == 200
+        assert not replicated
+
+    def test_failed_write_not_sticky(self, buyer_user, buyer_client, replica):
+        resp = buyer_client.post(reverse('api:buyer-cart'), [{'product': 0, 'quantity': 1}])
+        assert resp.status_code == 400
+        assert not databases.is_sticky(buyer_user)
+
+    def test_task_reads_replica(self, buyer_user, model_create, replica):
+        order = model_create(Order, user=buyer_user)
+
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary:
+            with CaptureQueriesContext(replica) as replicated:
+                order_created_email.apply(args=(order.id,))
+        assert replicated
+        assert not primary
+        assert databases._read_database.get() is None
+
+
+class TestReplicaRouter:
+    def test_router(self):
+        router = databases.ReplicaRouter()
+
+        assert router.db_for_read(Product) is None
+        token = databases._read_database.set('replica')
+        try:
+            assert router.db_for_read(Product) == 'replica'
+            assert router.db_for_write(Product) == DEFAULT_DB_ALIAS
+        finally:
+            databases._read_database.reset(token)
+
+        assert router.allow_migrate(DEFAULT_DB_ALIAS, 'api')
+        assert not router.allow_migrate('replica', 'api')
+
+
+@pytest.mark.django_db(transaction=True, databases='__all__')
+class TestConnectionHealthChecks:
+    def test_unusable_connection_closed(self, monkeypatch, settings):
+        settings.DATABASE_HEALTH_CHECKS = True
+        connection = connections['replica']
+        connection.ensure_connection()
+        closed = []
+        monkeypatch.setattr(connection, 'is_usable', lambda: False)
+        monkeypatch.setattr(connection, 'close', lambda: closed.append(connection.alias))
+
+        databases.check_connections()
+
+        assert closed == ['replica']
+
+    def test_health_checks_disabled(self, monkeypatch, settings):
+        settings.DATABASE_HEALTH_CHECKS = False
+        connection = connections['replica']
+        connection.ensure_connection()
+        monkeypatch.setattr(connection, 'is_usable', lambda: False)
+
+        databases.check_connections()
+
+        assert connection.connection is not None
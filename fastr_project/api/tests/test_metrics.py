@@ -0,0 +1,121 @@
+import pytest
+
+from django.core.cache import cache, caches
+from django.urls import reverse
+
+from api import metrics
+from api.models import CartProduct, Category, ShippingNote
+from users.tasks import user_registered_email
+
+
+@pytest.fixture(autouse=True)
+def metrics_flush(settings):
+    settings.METRICS_FLUSH_INTERVAL = 0
+    metrics.flush(force=True)
+    caches[metrics.METRICS_CACHE].clear()
+
+
+def _metrics(client):
+    resp = client.get(reverse('metrics'))
+    assert resp.status_code == 200
+    assert resp['Content-Type'] == metrics.CONTENT_TYPE
+    return resp.content.decode().splitlines()
+
+
+@pytest.mark.django_db
+class TestMetrics:
+    def test_request_metrics(self, anon_client, model_create):
+        model_create(Category, _quantity=3)
+        url = reverse('api:categories-list')
+        anon_client.get(url)
+        anon_client.get(url)
+        anon_client.get('/api/v1/missing/')
+
+        lines = _metrics(anon_client)
+
+        assert 'fastr_http_requests_total{method="GET",route="api:categories-list",status="200"} 2' in lines
+        assert 'fastr_http_requests_total{method="GET",route="unmatched",status="404"} 1' in lines
+        assert 'fastr_http_request_duration_seconds_count{method="GET",route="api:categories-list"} 2' in lines
+        assert (
+            'fastr_http_request_duration_seconds_bucket{method="GET",route="api:categories-list",le="+Inf"} 2'
+        ) in lines
+        assert 'fastr_http_request_db_queries_count{method="GET",route="api:categories-list"} 2' in lines
+        assert 'fastr_cache_requests_total{result="hit"} 1' in lines
+        assert 'fastr_cache_requests_total{result="miss"} 1' in lines
+        assert 'fastr_cache_hit_ratio 0.5' in lines
+
+    def test_histogram_buckets(self, anon_client):
+        for queries in (0, 3, 3, 500):
+            metrics.HTTP_REQUEST_QUERIES.observe(queries, method='GET', route='test')
+        metrics.flush(force=True)
+
+        lines = [line for line in _metrics(anon_client) if 'route="test"' in line]
+
+        assert lines == [
+            'fastr_http_request_db_queries_bucket{method="GET",route="test",le="0"} 1',
+            'fastr_http_request_db_queries_bucket{method="GET",route="test",le="1"} 1',
+            'fastr_http_request_db_queries_bucket{method="GET",route="test",le="2"} 1',
+            'fastr_http_request_db_queries_bucket{method="GET",route="test",le="5"} 3',
+            'fastr_http_request_db_queries_bucket{method="GET",route="test",le="10"} 3',
+            'fastr_http_request_db_queries_bucket{method="GET",route="test",le="20"} 3',
+            'fastr_http_request_db_queries_bucket{method="GET",route="test",le="50"} 3',
+            'fastr_http_request_db_queries_bucket{method="GET",route="test",le="100"} 3',
+            'fastr_http_request_db_queries_bucket{method="GET",route="test",le="+Inf"} 4',
+            'fastr_http_request_db_queries_sum{method="GET",route="test"} 506.0',
+            'fastr_http_request_db_queries_count{method="GET",route="test"} 4',
+        ]
+
+    def test_orders_placed(
+        self, buyer_user, buyer_client, model_create, settings, django_capture_on_commit_callbacks,
+    ):
+        settings.EMAIL_ORDER_NOTIFICATIONS = False
+        model_create(CartProduct, cart=buyer_user.cart, quantity=1, product__stock_quantity=10)
+        shipping_note = model_create(ShippingNote, user=buyer_user)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            resp = buyer_client.post(reverse('api:buyer-orders-list'), data={'shipping_note': shipping_note.id})
+
+        assert resp.status_code == 201
+        assert 'fastr_orders_placed_total 1' in _metrics(buyer_client)
+
+    def test_task_metrics(self, anon_client, buyer_user):
+        user_registered_email.apply(args=(buyer_user.id,))
+        user_registered_email.apply(args=(buyer_user.id,))
+
+        lines = _metrics(anon_client)
+
+        assert 'fastr_celery_tasks_total{task="users.tasks.user_registered_email",state="SUCCESS"} 2' in lines
+        assert 'fastr_celery_task_duration_seconds_count{task="users.tasks.user_registered_email"} 2' in lines
+        assert 'fastr_celery_queue_length{queue="celery"} 0' in lines
+
+    def test_label_escaping(self, anon_client):
+        metrics.CELERY_TASKS.inc(task='a "quoted"\\name\n', state='SUCCESS')
+        metrics.flush(force=True)
+
+        assert 'fastr_celery_tasks_total{task="a \\"quoted\\"\\\\name\\n",state="SUCCESS"} 1' in _metrics(anon_client)
+
+    def test_samples_keep_cache_entries(self, anon_client):
+        cache.set('cached', True)
+        for task in range(500):
+            metrics.CELERY_TASKS.inc(task=task, state='SUCCESS')
+        metrics.flush(force=True)
+
+        assert cache.get('cached')
+        assert 'fastr_celery_tasks_total{task="499",state="SUCCESS"} 1' in _metrics(anon_client)
+
+    def test_redis_samples(self, anon_client, redis_caches):
+        for _ in range(2):
+            metrics.CELERY_TASKS.inc(task='redis', state='SUCCESS')
+            metrics.flush(force=True)
+
+        key = redis_caches.make_key(metrics.SAMPLES_KEY)
+        assert redis_caches._cache.get_client(key).type(key) == b'hash'
+        assert 'fastr_celery_tasks_total{task="redis",state="SUCCESS"} 2' in _metrics(anon_client)
+
+    def test_metrics_token(self, anon_client, settings):
+        settings.METRICS_TOKEN = 'secret'
+        url = reverse('metrics')
+
+        assert anon_client.get(url).status_code == 401
+        assert anon_client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code == 401
+        assert anon_client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code == 200
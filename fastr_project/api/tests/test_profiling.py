@@ -0,0 +1,125 @@
+import logging
+import re
+
+import pytest
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from api.metrics import counting_queries
+from api.models import Category
+from api.profiling import ProfilingMiddleware, RequestProfile
+
+
+@pytest.fixture
+def profiling(settings):
+    settings.MIDDLEWARE = ['api.profiling.ProfilingMiddleware', *settings.MIDDLEWARE]
+    settings.PROFILING_SLOW_REQUEST = 10_000
+
+
+@pytest.fixture
+def staff_client(django_user_model):
+    client = APIClient()
+    client.force_authenticate(django_user_model.objects.create(
+        email='staff@mail.com',
+        type='staff',
+        is_staff=True,
+    ))
+    return client
+
+
+def _server_timing(resp):
+    return {
+        metric.split(';')[0]: metric
+        for metric in resp['Server-Timing'].split(', ')
+    }
+
+
+def _query_count(resp):
+    return int(re.search(r'desc="(\d+) queries"', _server_timing(resp)['db']).group(1))
+
+
+@pytest.mark.django_db
+class TestProfiling:
+    def test_server_timing(self, profiling, anon_client, model_create):
+        model_create(Category, _quantity=3)
+
+        resp = anon_client.get(reverse('api:categories-list'))
+        timing = _server_timing(resp)
+
+        assert resp.status_code == 200
+        assert set(timing) == {'db', 'serializer', 'total'}
+        assert re.fullmatch(r'db;dur=[\d.]+;desc="\d+ queries"', timing['db'])
+        assert re.fullmatch(r'total;dur=[\d.]+', timing['total'])
+
+    def test_async_server_timing(self, profiling, model_create):
+        model_create(Category, _quantity=3)
+
+        def count_categories():
+            with counting_queries():
+                return Category.objects.count()
+
+        async def get_response(request):
+            return HttpResponse(await sync_to_async(count_categories)())
+
+        middleware = ProfilingMiddleware(get_response)
+        resp = async_to_sync(middleware)(RequestFactory().get('/'))
+
+        assert middleware.is_async
+        assert resp.content == b'3'
+        assert _query_count(resp) == 1
+
+    def test_not_profiled(self, anon_client):
+        resp = anon_client.get(reverse('api:categories-list'))
+
+        assert resp.status_code == 200
+        assert not resp.has_header('Server-Timing')
+
+    def test_profiling_stats(self, profiling, anon_client, staff_client, model_create):
+        model_create(Category, _quantity=3)
+        url = reverse('api:categories-list')
+        queries = [_query_count(anon_client.get(url)) for _ in range(3)]
+
+        resp = staff_client.get(reverse('api:profiling'))
+        stats = resp.json()['GET api:categories-list']
+
+        assert resp.status_code == 200
+        assert stats['requests'] == 3
+        assert stats['queries']['buckets']['1'] == sum(count <= 1 for count in queries)
+        assert stats['queries']['buckets']['+Inf'] == 3
+        assert stats['queries']['sum'] == sum(queries)
+        assert stats['total']['buckets']['+Inf'] == 3
+
+        resp = staff_client.delete(reverse('api:profiling'))
+        assert resp.status_code == 204
+        assert 'GET api:categories-list' not in staff_client.get(reverse('api:profiling')).json()
+
+    def test_profiling_stats_staff_only(self, buyer_client, anon_client):
+        url = reverse('api:profiling')
+
+        assert buyer_client.get(url).status_code == 403
+        assert anon_client.get(url).status_code == 401
+        assert buyer_client.delete(url).status_code == 403
+
+    def test_slow_request_log(self, profiling, settings, anon_client, model_create, caplog):
+        settings.PROFILING_SLOW_REQUEST = 0
+        model_create(Category, _quantity=3)
+
+        with caplog.at_level(logging.WARNING, logger='api.profiling'):
+            anon_client.get(reverse('api:categories-list'))
+
+        assert len(caplog.records) == 1
+        assert caplog.records[0].getMessage().startswith('Slow request GET /api/v1/categories/')
+
+    def test_duplicated_queries(self):
+        profile = RequestProfile()
+        for sql in ['SELECT 1', 'SELECT 2', 'SELECT 2', 'SELECT 3', 'SELECT 3', 'SELECT 3']:
+            profile(lambda *args: None, sql, None, False, {})
+
+        assert profile.duplicated_queries() == [('SELECT 3', 3), ('SELECT 2', 2)]
+        assert len(profile.queries) == 6
@@ -0,0 +1,179 @@
+from smtplib import SMTPException
+from types import SimpleNamespace
+
+import pytest
+
+from django.core.files.base import ContentFile
+from django.core.mail.backends import locmem
+
+from api import tasks
+from api.models import Category, Order, OrderShop, OutboxEvent, Product, ProductImport
+from api.tasks import import_products, order_received_email, orders_updated_email, relay_outbox_events
+
+
+@pytest.mark.django_db
+class TestOrderReceivedEmail:
+    def test_order_received_email(self, model_create, mailoutbox, django_assert_num_queries):
+        order = model_create(Order)
+        model_create(OrderShop, order=order, _quantity=3)
+        order_shops = list(OrderShop.objects.select_related('shop__user').filter(order=order))
+
+        with django_assert_num_queries(1):
+            order_received_email.apply(args=(order.id,))
+
+        assert sorted(msg.to[0] for msg in mailoutbox) == sorted(
+            order_shop.shop.user.email for order_shop in order_shops
+        )
+
+    def test_order_received_email_retry(self, model_create, mailoutbox, monkeypatch):
+        order = model_create(Order)
+        model_create(OrderShop, order=order, _quantity=3)
+        order_shops = list(OrderShop.objects.select_related('shop__user').filter(order=order))
+        failing = {order_shops[0].shop.user.email}
+        sent = []
+
+        send_messages = locmem.EmailBackend.send_messages
+
+        def fail_once(backend, messages):
+            sent.extend(msg.to[0] for msg in messages)
+            if messages[0].to[0] in failing:
+                failing.clear()
+                raise SMTPException
+            return send_messages(backend, messages)
+
+        monkeypatch.setattr(locmem.EmailBackend, 'send_messages', fail_once)
+        order_received_email.apply(args=(order.id,))
+
+        assert sorted(msg.to[0] for msg in mailoutbox) == sorted(
+            order_shop.shop.user.email for order_shop in order_shops
+        )
+        assert len(sent) == len(order_shops) + 1
+        assert sent.count(order_shops[0].shop.user.email) == 2
+
+    def test_order_received_email_redelivered(self, model_create, mailoutbox):
+        order = model_create(Order)
+        model_create(OrderShop, order=order, _quantity=3)
+
+        order_received_email.apply(args=(order.id,), task_id='outbox-1-order_received_email')
+        order_received_email.apply(args=(order.id,), task_id='outbox-1-order_received_email')
+
+        assert len(mailoutbox) == OrderShop.objects.filter(order=order).count()
+
+
+@pytest.mark.django_db
+class TestOrdersUpdatedEmail:
+    def test_orders_updated_email(self, buyer_user, model_create, mailoutbox, django_assert_num_queries):
+        order_shops = [
+            model_create(OrderShop, order=model_create(Order, user=buyer_user), status='sent') for _ in range(3)
+        ]
+
+        with django_assert_num_queries(1):
+            orders_updated_email.apply(args=([order_shop.id for order_shop in order_shops],))
+
+        assert len(mailoutbox) == 1
+        assert mailoutbox[0].to == [buyer_user.email]
+        for order_shop in order_shops:
+            assert f'Order ID: {order_shop.order_id}, shop {order_shop.shop.name}: sent' in mailoutbox[0].body
+
+
+@pytest.mark.django_db
+class TestRelayOutboxEvents:
+    def test_relay_outbox_events(self, settings, monkeypatch):
+        settings.OUTBOX_BATCH_SIZE = 2
+        published = []
+        monkeypatch.setattr(tasks, 'OUTBOX_EVENT_TASKS', {
+            'order_created': (SimpleNamespace(
+                name='email', apply_async=lambda kwargs, task_id: published.append((task_id, kwargs)),
+            ),),
+        })
+        events = OutboxEvent.objects.bulk_create(
+            OutboxEvent(event='order_created', payload={'order_id': order_id}) for order_id in range(5)
+        )
+
+        assert relay_outbox_events.apply().get() == 5
+        assert published == [
+            (f'outbox-{event.id}-email', {'order_id': order_id}) for order_id, event in enumerate(events)
+        ]
+        assert not OutboxEvent.objects.exists()
+
+    def test_relay_outbox_events_broker_failure(self, monkeypatch):
+        def fail(kwargs, task_id):
+            raise ConnectionError
+
+        monkeypatch.setattr(tasks, 'OUTBOX_EVENT_TASKS', {
+            'order_created': (SimpleNamespace(name='email', apply_async=fail),),
+        })
+        OutboxEvent.objects.create(event='order_created', payload={'order_id': 1})
+
+        with pytest.raises(ConnectionError):
+            relay_outbox_events()
+        assert OutboxEvent.objects.count() == 1
+
+
+@pytest.mark.django_db
+class TestImportProducts:
+    @pytest.mark.parametrize('file_format, data', (
+        ('json', b'[{"sku": "A", "name": "Lamp", "description": "Lamp", "category": "Lamps", '
+                 b'"price": "10", "stock_quantity": 1, "attributes": {"Color": "red"}}, '
+                 b'{"sku": "B", "name": "Bulb", "description": "Bulb", "category": "Lamps", '
+                 b'"price": 2, "stock_quantity": 9}]'),
+        ('ndjson', b'{"sku": "A", "name": "Lamp", "description": "Lamp", "category": "Lamps", '
+                   b'"price": "10", "stock_quantity": 1, "attributes": {"Color": "red"}}\n\n'
+                   b'{"sku": "B", "name": "Bulb", "description": "Bulb", "category": "Lamps", '
+                   b'"price": 2, "stock_quantity": 9}\n'),
+        ('yaml', b'- {sku: A, name: Lamp, description: Lamp, category: Lamps, price: 10, stock_quantity: 1, '
+                 b'attributes: {Color: red}}\n'
+                 b'- {sku: B, name: Bulb, description: Bulb, category: Lamps, price: 2, stock_quantity: 9}\n'),
+    ))
+    def test_import_products(self, model_create, settings, file_format, data):
+        settings.PRODUCT_IMPORT_CHUNK_SIZE = 1
+        model_create(Category, name='Lamps')
+        product_import = model_create(
+            ProductImport, format=file_format, file=ContentFile(data, name=f'prices.{file_format}'),
+            status='pending', errors=[],
+        )
+        file_name = product_import.file.name
+
+        assert import_products(product_import.id)
+        assert not import_products(product_import.id)
+
+        product_import.refresh_from_db()
+        assert (product_import.status, product_import.created, product_import.errors) == ('done', 2, [])
+        assert not product_import.file
+        assert not product_import.file.storage.exists(file_name)
+        assert list(
+            Product.objects.filter(shop=product_import.shop).order_by('sku').values_list('sku', 'stock_quantity')
+        ) == [('A', 1), ('B', 9)]
+        assert Product.objects.get(shop=product_import.shop, sku='A').product_attributes.get().value == 'red'
+
+    def test_import_products_duplicated_sku(self, model_create):
+        model_create(Category, name='Lamps')
+        data = b''.join(
+            b'{"sku": "A", "name": "%s", "description": "Lamp", "category": "Lamps", '
+            b'"price": 10, "stock_quantity": %d}\n' % (name, stock_quantity)
+            for name, stock_quantity in ((b'Lamp', 1), (b'Desk lamp', 2))
+        )
+        product_import = model_create(
+            ProductImport, format='ndjson', file=ContentFile(data, name='prices.ndjson'),
+            status='pending', errors=[],
+        )
+
+        import_products(product_import.id)
+
+        product_import.refresh_from_db()
+        assert (product_import.processed, product_import.created) == (2, 1)
+        assert product_import.errors == [
+            {'row': 2, 'errors': {'sku': ['Failed! Product with that SKU is already in row 1!']}},
+        ]
+        assert Product.objects.get(shop=product_import.shop, sku='A').name == 'Lamp'
+
+    def test_import_products_invalid_file(self, model_create):
+        product_import = model_create(
+            ProductImport, format='json', file=ContentFile(b'{"sku"', name='prices.json'), status='pending',
+        )
+
+        import_products(product_import.id)
+
+        product_import.refresh_from_db()
+        assert product_import.status == 'failed'
+        assert product_import.errors[0]['errors'].startswith('Invalid JSON')
@@ -0,0 +1,110 @@
+import pytest
+
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from api import throttling
+from api.models import Category
+
+
+@pytest.fixture
+def throttled(monkeypatch, settings):
+    monkeypatch.setattr(APIView, 'throttle_classes', [throttling.SlidingWindowThrottle])
+    monkeypatch.setattr(throttling.SlidingWindowThrottle, 'timer', lambda self: 1000.0)
+    settings.MIDDLEWARE = [*settings.MIDDLEWARE, 'api.throttling.RateLimitMiddleware']
+
+    def set_rates(**rates):
+        settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}
+
+    return set_rates
+
+
+class TestSlidingWindow:
+    def test_previous_window_weighted(self):
+        for second in range(10):
+            assert throttling.hit('test', 'client', 10, 60, now=6000 + second)[0]
+
+        allowed, rate_limit, wait = throttling.hit('test', 'client', 10, 60, now=6010)
+        assert not allowed
+        assert rate_limit == throttling.RateLimit(10, 60, 0, 50)
+        assert wait == 50 + 6
+
+        # Half of the previous window is still inside the sliding window
+        for _ in range(5):
+            assert throttling.hit('test', 'client', 10, 60, now=6090)[0]
+        allowed, rate_limit, wait = throttling.hit('test', 'client', 10, 60, now=6090)
+        assert not allowed
+        assert rate_limit.remaining == 0
+        assert wait == 6
+
+        assert throttling.hit('test', 'client', 10, 60, now=6096)[0]
+        assert throttling.hit('test', 'other', 10, 60, now=6090)[0]
+
+    def test_redis_script(self, redis_caches, monkeypatch):
+        # Counters are checked and incremented by the script only
+        monkeypatch.delattr(throttling, '_cache_hit')
+        results = [throttling.hit('test', 'redis', 3, 60, now=6000)[0] for _ in range(4)]
+
+        assert results == [True, True, True, False]
+        assert redis_caches.get('api:throttling:test:redis:100') == 3
+
+    def test_parse_rate(self):
+        assert throttling.parse_rate('10/day') == (10, 24 * 60 * 60)
+        assert throttling.parse_rate('100/min') == (100, 60)
+
+
+@pytest.mark.django_db
+class TestSlidingWindowThrottle:
+    def test_rate_limit_headers(self, throttled, model_create):
+        throttled(catalog='2/min')
+        model_create(Category)
+        client = APIClient()
+        url = reverse('api:categories-list')
+
+        for remaining in (1, 0):
+            resp = client.get(url)
+            assert resp.status_code == 200
+            assert resp['RateLimit-Limit'] == '2'
+            assert resp['RateLimit-Remaining'] == str(remaining)
+            assert resp['RateLimit-Reset'] == '20'
+            assert resp['RateLimit-Policy'] == '2;w=60'
+
+        resp = client.get(url)
+        assert resp.status_code == 429
+        assert resp['RateLimit-Remaining'] == '0'
+        assert resp['Retry-After'] == '50'
+
+    def test_scopes(self, throttled, buyer_user, model_create):
+        throttled(catalog='1/min', checkout='2/hour', user='50/day')
+        client = APIClient()
+        client.force_authenticate(user=buyer_user)
+
+        assert client.get(reverse('api:categories-list')).status_code == 200
+        assert client.get(reverse('api:shops-list')).status_code == 429
+
+        resp = client.get(reverse('api:buyer-orders-list'))
+        assert resp.status_code == 200
+        assert resp['RateLimit-Policy'] == '50;w=86400'
+
+        resp = client.post(reverse('api:buyer-orders-list'), data={})
+        assert resp.status_code == 400
+        assert resp['RateLimit-Policy'] == '2;w=3600'
+
+    def test_anonymous_clients_by_address(self, throttled):
+        throttled(dj_rest_auth='1/min')
+        url = reverse('users:registration')
+
+        assert APIClient(REMOTE_ADDR='10.0.0.1').post(url, data={}).status_code == 400
+        assert APIClient(REMOTE_ADDR='10.0.0.2').post(url, data={}).status_code == 400
+        assert APIClient(REMOTE_ADDR='10.0.0.1').post(url, data={}).status_code == 429
+
+    def test_unknown_scope_not_limited(self, throttled, model_create):
+        throttled(anon='1/min')
+        client = APIClient()
+
+        for _ in range(3):
+            resp = client.get(reverse('api:categories-list'))
+            assert resp.status_code == 200
+            assert 'RateLimit-Limit' not in resp
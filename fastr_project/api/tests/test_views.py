@@ -1,11 +1,29 @@
+import io
+import csv
+import json
 import random
+from datetime import timedelta
+from decimal import Decimal
+import threading
 import pytest
 
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+from api.authentication import load_identity
+from api.cache import get_stats as get_cache_stats
+from api.pagination import CursorPagination
+from api.tasks import import_products
 
 from api.models import (
     Category, Attribute, Shop, Order, Product,
-    ShippingNote, CartProduct, OrderShop,
+    ShippingNote, Cart, CartProduct, OrderShop, OrderProduct, ProductAttribute, OutboxEvent,
+    ProductImport,
 )
 
 
@@ -28,7 +46,7 @@ class TestCategoryViewSet:
 
         url = reverse('api:categories-list')
         resp = anon_client.get(url)
-        resp_categories = resp.json()
+        resp_categories = resp.json()['results']
 
         assert resp.status_code == 200
         assert resp_categories == categories_attrs
@@ -81,7 +99,7 @@ class TestShippingNoteView:
 
         url = reverse('api:buyer-shipping-notes-list')
         resp = buyer_client.get(url)
-        resp_shipping_notes = resp.json()
+        resp_shipping_notes = resp.json()['results']
 
         assert resp.status_code == 200
         assert resp_shipping_notes == shipping_notes_attrs
@@ -121,7 +139,7 @@ class TestAttributeViewSet:
 
         url = reverse('api:attributes-list')
         resp = seller_client.get(url)
-        resp_attributes = resp.json()
+        resp_attributes = resp.json()['results']
 
         assert resp.status_code == 200
         assert resp_attributes == attributes_attrs
@@ -163,6 +181,20 @@ class TestProductCreateViewSet:
         product_attrs.pop('product_attributes')
         assert Product.objects.get(**product_attrs)
 
+    def test_product_create_taken_sku(self, seller_user, seller_client, model_create, model_prepare):
+        set_shop = model_create(Shop, user=seller_user)
+        taken_product = model_create(Product, shop=set_shop)
+
+        product = model_prepare(Product, shop=set_shop, sku=taken_product.sku, _save_related=True)
+        product_attrs = self._product_dict(product, [])
+
+        url = reverse('api:seller-products-list')
+        resp = seller_client.post(url, product_attrs)
+
+        assert resp.status_code == 400
+        assert resp.json() == {'sku': ['Failed! Shop already have product with that SKU!']}
+        assert Product.objects.filter(shop=set_shop).count() == 1
+
     def test_product_retrieve(self, seller_user, seller_client, model_create):
         set_shop = model_create(Shop, user=seller_user)
 
@@ -201,6 +233,26 @@ class TestProductCreateViewSet:
         update_product_attrs.pop('product_attributes')
         assert Product.objects.get(**update_product_attrs)
 
+    def test_product_update_taken_sku(self, seller_user, seller_client, model_create):
+        set_shop = model_create(Shop, user=seller_user)
+        product, taken_product = model_create(Product, shop=set_shop, _quantity=2)
+
+        url = reverse('api:seller-products-detail', kwargs={'pk': product.id})
+        resp = seller_client.patch(url, {'sku': taken_product.sku})
+
+        assert resp.status_code == 400
+        assert resp.json() == {'sku': ['Failed! Shop already have product with that SKU!']}
+
+        resp = seller_client.patch(url, {'sku': product.sku})
+        assert resp.status_code == 200
+
+    def test_products_list_queries(self, seller_user, seller_client, model_create, assert_max_queries):
+        set_shop = model_create(Shop, user=seller_user)
+        for product in model_create(Product, shop=set_shop, _quantity=10):
+            model_create(ProductAttribute, product=product, _quantity=3)
+
+        assert_max_queries(seller_client, reverse('api:seller-products-list'), 3)
+
     def test_products_list(self, seller_user, seller_client, model_create):
         set_shop = model_create(Shop, user=seller_user)
         products = model_create(Product, shop=set_shop, _quantity=3)
@@ -215,12 +267,65 @@ class TestProductCreateViewSet:
 
         url = reverse('api:seller-products-list')
         resp = seller_client.get(url)
-        resp_products = resp.json()
+        resp_products = resp.json()['results']
 
         assert resp.status_code == 200
         assert resp_products == products_attrs
 
 
+@pytest.mark.django_db
+class TestProductImportViewSet:
+    def test_product_import(self, seller_user, seller_client, model_create):
+        set_shop = model_create(Shop, user=seller_user)
+        category = model_create(Category, name='Lamps')
+        product = model_create(Product, shop=set_shop, sku='L-1', name='Old lamp')
+        model_create(Product, shop=set_shop, sku='L-9', name='Taken lamp')
+        price_list = (
+            'sku,name,description,category,price,stock_quantity,Color\n'
+            'L-1,Desk lamp,Bright,Lamps,10.50,5,red\n'
+            'L-2,Floor lamp,Tall,Lamps,99,1,\n'
+            'L-3,Wall lamp,Small,Chairs,5,1,blue\n'
+            'L-4,Taken lamp,Small,Lamps,5,1,blue\n'
+        )
+
+        url = reverse('api:seller-product-imports-list')
+        resp = seller_client.post(
+            url, {'file': SimpleUploadedFile('prices.csv', price_list.encode())}, format='multipart',
+        )
+        resp_import = resp.json()
+
+        assert resp.status_code == 201
+        assert (resp_import['format'], resp_import['status']) == ('csv', 'pending')
+        assert OutboxEvent.objects.get(event='product_import').payload == {'product_import_id': resp_import['id']}
+
+        import_products(resp_import['id'])
+
+        url = reverse('api:seller-product-imports-detail', kwargs={'pk': resp_import['id']})
+        resp_import = seller_client.get(url).json()
+
+        assert {key: resp_import[key] for key in ('status', 'processed', 'created', 'updated')} == {
+            'status': 'done', 'processed': 4, 'created': 1, 'updated': 1,
+        }
+        assert [error['row'] for error in resp_import['errors']] == [3, 4]
+        product.refresh_from_db()
+        assert (product.name, product.category, product.price, product.stock_quantity) == (
+            'Desk lamp', category, Decimal('10.50'), 5,
+        )
+        assert product.product_attributes.get(attribute__name='Color').value == 'red'
+        assert Product.objects.get(shop=set_shop, sku='L-2').name == 'Floor lamp'
+
+    def test_product_import_unsupported_format(self, seller_user, seller_client, model_create):
+        model_create(Shop, user=seller_user)
+
+        url = reverse('api:seller-product-imports-list')
+        resp = seller_client.post(
+            url, {'file': SimpleUploadedFile('prices.xls', b'')}, format='multipart',
+        )
+
+        assert resp.status_code == 400
+        assert not ProductImport.objects.exists()
+
+
 @pytest.mark.django_db
 class TestProductRetrieveViewSet:
     @staticmethod
@@ -272,12 +377,330 @@ class TestProductRetrieveViewSet:
 
         url = reverse('api:products-list')
         resp = buyer_client.get(url)
-        resp_products = resp.json()
+        resp_products = resp.json()['results']
 
         assert resp.status_code == 200
         assert resp_products == products_attrs
 
 
+    def test_products_list_queries(self, anon_client, model_create, assert_max_queries):
+        for product in model_create(Product, _quantity=10):
+            model_create(ProductAttribute, product=product, _quantity=3)
+
+        assert_max_queries(anon_client, reverse('api:products-list'), 2)
+
+    def test_products_list_pagination(self, anon_client, model_create):
+        products = model_create(Product, _quantity=5)
+
+        url = f"{reverse('api:products-list')}?page_size=2"
+        resp_products_ids = []
+        while url:
+            resp = anon_client.get(url)
+            resp_page = resp.json()
+
+            assert resp.status_code == 200
+            assert len(resp_page['results']) <= 2
+            resp_products_ids.extend(product['id'] for product in resp_page['results'])
+            url = resp_page['next']
+
+        assert resp_products_ids == [product.id for product in products]
+
+    def test_products_list_max_page_size(self, anon_client, model_create, monkeypatch):
+        model_create(Product, _quantity=3)
+        monkeypatch.setattr(CursorPagination, 'max_page_size', 2)
+
+        url = reverse('api:products-list')
+        resp = anon_client.get(url, {'page_size': 10 ** 6})
+
+        assert resp.status_code == 200
+        assert len(resp.json()['results']) == 2
+
+
+    def test_products_search(self, anon_client, model_create):
+        product = model_create(Product, name='Wireless keyboard', description='Bluetooth')
+        model_create(Product, name='Mouse', description='Optical')
+
+        url = reverse('api:products-list')
+        resp = anon_client.get(url, {'search': 'keyb'})
+        resp_products = resp.json()['results']
+
+        assert resp.status_code == 200
+        assert [resp_product['id'] for resp_product in resp_products] == [product.id]
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql', reason='Full-text search requires PostgreSQL')
+    def test_products_search_ranking(self, anon_client, model_create):
+        by_attribute = model_create(Product, name='Stand', description='Metal')
+        model_create(ProductAttribute, product=by_attribute, value='Desk lamp')
+        by_description = model_create(Product, name='Bulb', description='Spare bulb for lamps')
+        by_name = model_create(Product, name='Table lamp', description='Warm light')
+        model_create(Product, name='Chair', description='Wooden')
+
+        url = reverse('api:products-list')
+        resp = anon_client.get(url, {'search': 'lamp'})
+        resp_products = resp.json()['results']
+
+        assert resp.status_code == 200
+        assert [resp_product['id'] for resp_product in resp_products] == [
+            by_name.id, by_description.id, by_attribute.id,
+        ]
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql', reason='Full-text search requires PostgreSQL')
+    def test_products_search_pages(self, anon_client, model_create):
+        products = model_create(Product, name='Table lamp', description='Warm light', _quantity=5)
+        products += model_create(Product, name='Bulb', description='Spare bulb for lamps', _quantity=4)
+        Product.objects.update_search_vector([product.id for product in products])
+
+        url = reverse('api:products-list')
+        resp = anon_client.get(url, {'search': 'lamp', 'page_size': 2})
+        resp_ids = []
+        while True:
+            assert resp.status_code == 200
+            resp_ids += [resp_product['id'] for resp_product in resp.json()['results']]
+            assert len(resp_ids) <= len(products)
+            if not resp.json()['next']:
+                break
+            resp = anon_client.get(resp.json()['next'])
+
+        assert resp_ids == [product.id for product in products]
+
+    def test_products_list_cache(
+        self, anon_client, model_create, django_assert_num_queries, django_capture_on_commit_callbacks,
+    ):
+        product = model_create(Product, stock_quantity=10)
+        url = reverse('api:products-list')
+
+        first = anon_client.get(url)
+        with django_assert_num_queries(0):
+            second = anon_client.get(url)
+        not_modified = anon_client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        assert (first['X-Cache'], second['X-Cache']) == ('MISS', 'HIT')
+        assert first.json() == second.json()
+        assert first['ETag'] == second['ETag']
+        assert not_modified.status_code == 304
+        assert get_cache_stats() == {'hits': 2, 'misses': 1}
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Product.objects.reserve_stock({product.id: 4})
+        resp = anon_client.get(url)
+
+        assert resp['X-Cache'] == 'MISS'
+        assert resp['ETag'] != first['ETag']
+        assert resp.json()['results'][0]['stock_quantity'] == 6
+
+        with django_capture_on_commit_callbacks(execute=True):
+            product.shop.is_open = False
+            product.shop.save()
+        resp = anon_client.get(url)
+
+        assert resp['X-Cache'] == 'MISS'
+        assert resp.json()['results'] == []
+
+    def test_products_detail_cache_stock(self, anon_client, model_create, django_capture_on_commit_callbacks):
+        product, other = model_create(Product, stock_quantity=10, _quantity=2)
+        url = reverse('api:products-detail', args=(product.id,))
+        other_url = reverse('api:products-detail', args=(other.id,))
+
+        anon_client.get(url)
+        anon_client.get(other_url)
+        with django_capture_on_commit_callbacks(execute=True):
+            Product.objects.reserve_stock({product.id: 4})
+        resp = anon_client.get(url)
+        other_resp = anon_client.get(other_url)
+
+        assert resp['X-Cache'] == 'MISS'
+        assert resp.json()['stock_quantity'] == 6
+        assert other_resp['X-Cache'] == 'HIT'
+
+    def test_products_export(self, anon_client, model_create, django_assert_num_queries):
+        color = model_create(Attribute, name='Color')
+        products = model_create(Product, _quantity=3)
+        for product in products:
+            model_create(ProductAttribute, product=product, attribute=color, value=f'color {product.id}')
+
+        url = reverse('api:products-export')
+        with django_assert_num_queries(2):
+            resp = anon_client.get(url)
+            resp_products = [json.loads(line) for line in b''.join(resp.streaming_content).splitlines()]
+
+        assert resp.status_code == 200
+        assert resp['Content-Type'] == 'application/x-ndjson; charset=utf-8'
+        assert [product['id'] for product in resp_products] == [product.id for product in products]
+        assert resp_products[0]['attributes'] == {
+            product_attribute.attribute.name: product_attribute.value
+            for product_attribute in products[0].product_attributes.all()
+        }
+
+    def test_products_export_csv(self, seller_user, seller_client, model_create):
+        set_shop = model_create(Shop, user=seller_user)
+        product = model_create(Product, shop=set_shop)
+        model_create(Product)
+
+        url = reverse('api:seller-products-export')
+        resp = seller_client.get(url, {'format': 'csv'})
+        rows = list(csv.DictReader(io.StringIO(b''.join(resp.streaming_content).decode())))
+
+        assert resp.status_code == 200
+        assert [(row['id'], row['sku'], row['price']) for row in rows] == [
+            (str(product.id), product.sku, str(product.price)),
+        ]
+        for product_attribute in product.product_attributes.all():
+            assert rows[0][product_attribute.attribute.name] == product_attribute.value
+
+    def test_products_changes(self, anon_client, model_create, settings):
+        settings.CHANGES_SETTLE_LAG = 0
+        first, deleted, last = model_create(Product, _quantity=3)
+        deleted_id = deleted.id
+        deleted.delete()
+
+        url = reverse('api:products-changes')
+        resp = anon_client.get(url, {'page_size': 2})
+        resp_changes = resp.json()
+
+        assert resp.status_code == 200
+        assert [(change['id'], change['deleted']) for change in resp_changes['results']] == [
+            (first.id, False), (last.id, False),
+        ]
+        assert resp_changes['results'][0]['product']['sku'] == first.sku
+        assert resp_changes['has_more']
+
+        resp_changes = anon_client.get(url, {'page_size': 2, 'since': resp_changes['next']}).json()
+
+        assert [(change['id'], change['deleted'], change['product']) for change in resp_changes['results']] == [
+            (deleted_id, True, None),
+        ]
+
+        Product.objects.filter(id=first.id).update(price=first.price + 1, updated_at=timezone.now())
+        resp_changes = anon_client.get(url, {'since': resp_changes['next']}).json()
+
+        assert [change['id'] for change in resp_changes['results']] == [first.id]
+        assert resp_changes['results'][0]['product']['price'] == str(first.price + 1)
+
+        next_token = resp_changes['next']
+        resp_changes = anon_client.get(url, {'since': next_token}).json()
+
+        assert resp_changes == {'results': [], 'next': next_token, 'has_more': False}
+
+    def test_products_changes_shop_closed(self, anon_client, model_create, settings):
+        settings.CHANGES_SETTLE_LAG = 0
+        shop = model_create(Shop)
+        product = model_create(Product, shop=shop)
+
+        url = reverse('api:products-changes')
+        next_token = anon_client.get(url).json()['next']
+
+        shop.is_open = False
+        shop.save()
+        resp_changes = anon_client.get(url, {'since': next_token}).json()
+
+        assert [(change['id'], change['deleted']) for change in resp_changes['results']] == [
+            (product.id, True),
+        ]
+
+        shop.is_open = True
+        shop.save()
+        resp_changes = anon_client.get(url, {'since': resp_changes['next']}).json()
+
+        assert [(change['id'], change['deleted']) for change in resp_changes['results']] == [
+            (product.id, False),
+        ]
+
+    def test_products_changes_category_renamed(self, anon_client, model_create, settings):
+        settings.CHANGES_SETTLE_LAG = 0
+        product, other_product = model_create(Product, _quantity=2)
+
+        url = reverse('api:products-changes')
+        next_token = anon_client.get(url).json()['next']
+
+        product.category.name = 'Renamed category'
+        product.category.save()
+        other_product.category.save()
+        resp_changes = anon_client.get(url, {'since': next_token}).json()
+
+        assert [change['id'] for change in resp_changes['results']] == [product.id]
+        assert resp_changes['results'][0]['product']['category'] == 'Renamed category'
+
+    def test_products_changes_settle_lag(self, anon_client, model_create, settings):
+        settings.CHANGES_SETTLE_LAG = 60
+        model_create(Product)
+
+        url = reverse('api:products-changes')
+        resp = anon_client.get(url)
+
+        assert resp.status_code == 200
+        assert resp.json() == {'results': [], 'next': None, 'has_more': False}
+
+    def test_products_changes_invalid_token(self, anon_client):
+        url = reverse('api:products-changes')
+        resp = anon_client.get(url, {'since': 'invalid'})
+
+        assert resp.status_code == 400
+        assert resp.json() == {'since': ['Invalid token.']}
+
+    def test_products_filter(self, anon_client, model_create):
+        category, other_category = model_create(Category, _quantity=2)
+        color, size = model_create(Attribute, _quantity=2)
+        matching = model_create(Product, category=category, price=100)
+        model_create(ProductAttribute, product=matching, attribute=color, value='red')
+        model_create(ProductAttribute, product=matching, attribute=size, value='XL')
+        other_size = model_create(Product, category=category, price=150)
+        model_create(ProductAttribute, product=other_size, attribute=color, value='blue')
+        model_create(ProductAttribute, product=other_size, attribute=size, value='S')
+        model_create(Product, category=category, price=500)
+        model_create(Product, category=other_category, price=100)
+
+        url = reverse('api:products-list')
+        cases = (
+            ({'category': category.id, 'price_max': 200}, [matching, other_size]),
+            ({'shop': [matching.shop_id, other_size.shop_id]}, [matching, other_size]),
+            ({'attribute': [f'{color.id}:red', f'{color.id}:blue']}, [matching, other_size]),
+            ({'attribute': [f'{color.id}:red', f'{size.id}:S']}, []),
+            ({'attribute': f'{size.id}:S', 'price_min': 120}, [other_size]),
+        )
+        for params, products in cases:
+            resp = anon_client.get(url, params)
+
+            assert resp.status_code == 200
+            assert [product['id'] for product in resp.json()['results']] == [product.id for product in products]
+
+    def test_products_filter_invalid(self, anon_client):
+        url = reverse('api:products-list')
+        resp = anon_client.get(url, {'attribute': 'red', 'price_min': 'cheap'})
+
+        assert resp.status_code == 400
+        assert set(resp.json()) == {'attribute', 'price_min'}
+
+    def test_products_facets(self, anon_client, model_create, django_assert_num_queries):
+        category, other_category = model_create(Category, _quantity=2)
+        color = model_create(Attribute, name='Color')
+        red, blue, other = (
+            model_create(Product, category=category, price=100),
+            model_create(Product, category=category, price=100),
+            model_create(Product, category=other_category, price=100),
+        )
+        model_create(ProductAttribute, product=red, attribute=color, value='red')
+        model_create(ProductAttribute, product=blue, attribute=color, value='blue')
+        model_create(ProductAttribute, product=other, attribute=color, value='red')
+        model_create(Product, category=category, price=900)
+
+        url = reverse('api:products-facets')
+        with django_assert_num_queries(1):
+            resp = anon_client.get(url, {'price_max': 100})
+
+        resp_facets = resp.json()
+
+        assert resp.status_code == 200
+        assert resp_facets['categories'] == [
+            {'id': category.id, 'name': category.name, 'count': 2},
+            {'id': other_category.id, 'name': other_category.name, 'count': 1},
+        ]
+        assert {
+            'id': color.id,
+            'name': 'Color',
+            'values': [{'value': 'red', 'count': 2}, {'value': 'blue', 'count': 1}],
+        } in resp_facets['attributes']
+
+
 @pytest.mark.django_db
 class TestShopCreateView:
     def test_seller_shop_create(self, seller_user, seller_client, model_create, model_prepare):
@@ -332,6 +755,11 @@ class TestShopRetrieveViewSet:
         assert resp.status_code == 200
         assert resp_shop == shop_attrs
 
+    def test_shops_list_queries(self, anon_client, model_create, assert_max_queries):
+        model_create(Shop, categories=model_create(Category, _quantity=3), _quantity=10)
+
+        assert_max_queries(anon_client, reverse('api:shops-list'), 2)
+
     def test_shops_list(self, anon_client, model_create):
         shops = model_create(Shop, _quantity=3)
         shops_attrs = []
@@ -344,7 +772,7 @@ class TestShopRetrieveViewSet:
 
         url = reverse('api:shops-list')
         resp = anon_client.get(url)
-        resp_shops = resp.json()
+        resp_shops = resp.json()['results']
 
         assert resp.status_code == 200
         assert resp_shops == shops_attrs
@@ -420,6 +848,66 @@ class TestCartProductView:
         for product in delete_cart_products['products']:
             assert not CartProduct.objects.filter(cart=buyer_user.cart, product=product)
 
+    @pytest.mark.parametrize('positions', (1, 50, 500))
+    def test_cart_product_batch_queries(
+        self, buyer_user, buyer_client, model_create, django_assert_max_num_queries, positions,
+    ):
+        shop = model_create(Shop)
+        products = model_create(Product, shop=shop, stock_quantity=1000, _quantity=positions)
+        product_ids = [product.id for product in products]
+        url = reverse('api:buyer-cart')
+
+        with django_assert_max_num_queries(6):
+            resp = buyer_client.post(url, [{'product': product_id, 'quantity': 1} for product_id in product_ids])
+        assert resp.status_code == 201
+
+        with django_assert_max_num_queries(6):
+            resp = buyer_client.patch(url, [{'product': product_id, 'quantity': 2} for product_id in product_ids])
+        assert resp.status_code == 200
+        assert set(
+            CartProduct.objects.filter(cart=buyer_user.cart).values_list('quantity', flat=True)
+        ) == {2}
+
+        with django_assert_max_num_queries(3):
+            resp = buyer_client.delete(url, {'products': product_ids})
+        assert resp.status_code == 204
+        assert not CartProduct.objects.filter(cart=buyer_user.cart)
+
+    def test_cart_product_batch_errors(self, buyer_user, buyer_client, model_create):
+        cart_product = model_create(CartProduct, cart=buyer_user.cart, product__stock_quantity=1000)
+        product = model_create(Product, stock_quantity=1)
+
+        url = reverse('api:buyer-cart')
+        resp = buyer_client.post(url, [
+            {'product': cart_product.product.id, 'quantity': 1},
+            {'product': product.id, 'quantity': 2},
+            {'product': 'unknown', 'quantity': 1},
+            {'product': 0, 'quantity': 1},
+        ])
+
+        assert resp.status_code == 400
+        assert resp.json() == [
+            {'non_field_errors': [f'Failed! Cart already have product with id: {cart_product.product.id}!']},
+            {'non_field_errors': [f'Failed! This quantity of product with id: {product.id}, not in stock!']},
+            {'product': ['Incorrect type. Expected pk value, received str.']},
+            {'product': ['Invalid pk "0" - object does not exist.']},
+        ]
+
+    def test_cart_product_batch_duplicates(self, buyer_user, buyer_client, model_create):
+        product = model_create(Product, stock_quantity=10)
+
+        url = reverse('api:buyer-cart')
+        resp = buyer_client.post(url, [
+            {'product': product.id, 'quantity': 1},
+            {'product': product.id, 'quantity': 2},
+        ])
+
+        assert resp.status_code == 400
+        assert resp.json() == {
+            'non_field_errors': [f'Failed! Products with ids: {product.id}, are submitted more than once!'],
+        }
+        assert not CartProduct.objects.filter(cart=buyer_user.cart)
+
     def test_cart_products_list(self, buyer_user, buyer_client, model_create):
         model_create(CartProduct, cart=buyer_user.cart, _quantity=3)
         cart_products_attrs = self._cart_products_dict(buyer_user.cart)
@@ -431,6 +919,18 @@ class TestCartProductView:
         assert resp.status_code == 200
         assert resp_cart_products == cart_products_attrs
 
+    def test_cart_products_list_queries(self, buyer_user, buyer_client, model_create, assert_max_queries):
+        model_create(CartProduct, cart=buyer_user.cart, _quantity=10)
+
+        assert_max_queries(buyer_client, reverse('api:buyer-cart'), 2)
+
+    def test_cart_products_list_empty(self, buyer_client):
+        url = reverse('api:buyer-cart')
+        resp = buyer_client.get(url)
+
+        assert resp.status_code == 200
+        assert resp.json() == {'positions': [], 'total_sum': '0'}
+
 
 @pytest.mark.django_db
 class TestOrderViewSet:
@@ -476,8 +976,24 @@ class TestOrderViewSet:
         }
         return order_shop_dict
 
+    def _order_summary_dict(self, order):
+        order_dict = self._order_dict(order)
+        return {
+            'order': order.id,
+            'statuses': order_dict['statuses'],
+            'item_count': sum(position['quantity'] for position in order_dict['positions']),
+            'total_sum': order_dict['total_sum'],
+            'created_at': order_dict['created_at'],
+        }
+
     def test_order_create(self, buyer_user, buyer_client, model_create, settings):
-        set_cart_products = model_create(CartProduct, cart=buyer_user.cart, _quantity=3)
+        set_cart_products = model_create(
+            CartProduct,
+            cart=buyer_user.cart,
+            quantity=random.randint(1, 999),
+            product__stock_quantity=1000,
+            _quantity=3,
+        )
         set_shipping_note = model_create(ShippingNote, user=buyer_user)
         order_attrs = {'shipping_note': set_shipping_note.id}
 
@@ -506,6 +1022,130 @@ class TestOrderViewSet:
             }
             assert order.order_products.get(**order_product_attrs)
 
+    def test_order_create_queries(self, buyer_user, buyer_client, model_create, settings):
+        set_shipping_note = model_create(ShippingNote, user=buyer_user)
+        order_attrs = {'shipping_note': set_shipping_note.id}
+
+        settings.EMAIL_ORDER_NOTIFICATIONS = False
+
+        url = reverse('api:buyer-orders-list')
+        load_identity(buyer_user.id)
+        queries_count = []
+        for cart_size in (1, 10):
+            model_create(
+                CartProduct,
+                cart=buyer_user.cart,
+                quantity=1,
+                product__stock_quantity=1000,
+                _quantity=cart_size,
+            )
+
+            with CaptureQueriesContext(connection) as queries:
+                resp = buyer_client.post(url, data=order_attrs)
+
+            assert resp.status_code == 201
+            assert not CartProduct.objects.filter(cart=buyer_user.cart)
+            assert OrderShop.objects.filter(order=resp.json()['order']).count() == cart_size
+            queries_count.append(len(queries))
+
+        assert queries_count[0] == queries_count[1]
+
+    def test_order_create_reserves_stock(self, buyer_user, buyer_client, model_create, settings):
+        set_cart_product = model_create(
+            CartProduct, cart=buyer_user.cart, quantity=3, product__stock_quantity=10,
+        )
+        set_shipping_note = model_create(ShippingNote, user=buyer_user)
+
+        settings.EMAIL_ORDER_NOTIFICATIONS = False
+
+        url = reverse('api:buyer-orders-list')
+        resp = buyer_client.post(url, data={'shipping_note': set_shipping_note.id})
+
+        assert resp.status_code == 201
+        set_cart_product.product.refresh_from_db()
+        assert set_cart_product.product.stock_quantity == 7
+
+    def test_order_create_out_of_stock(self, buyer_user, buyer_client, model_create, settings):
+        set_cart_products = model_create(
+            CartProduct, cart=buyer_user.cart, quantity=3, product__stock_quantity=10, _quantity=2,
+        )
+        Product.objects.filter(id=set_cart_products[1].product.id).update(stock_quantity=2)
+        set_shipping_note = model_create(ShippingNote, user=buyer_user)
+
+        settings.EMAIL_ORDER_NOTIFICATIONS = False
+
+        url = reverse('api:buyer-orders-list')
+        resp = buyer_client.post(url, data={'shipping_note': set_shipping_note.id})
+
+        assert resp.status_code == 400
+        assert not Order.objects.filter(user=buyer_user)
+        assert CartProduct.objects.filter(cart=buyer_user.cart).count() == 2
+        assert list(
+            Product.objects.order_by('id').values_list('stock_quantity', flat=True)
+        ) == [10, 2]
+
+    def test_order_create_outbox_event(self, buyer_user, buyer_client, model_create, settings):
+        model_create(CartProduct, cart=buyer_user.cart, quantity=3, product__stock_quantity=3)
+        out_of_stock = model_create(CartProduct, quantity=3, product__stock_quantity=1)
+        set_shipping_note = model_create(ShippingNote, user=buyer_user)
+
+        settings.EMAIL_ORDER_NOTIFICATIONS = True
+
+        url = reverse('api:buyer-orders-list')
+        resp = buyer_client.post(url, data={'shipping_note': set_shipping_note.id})
+
+        assert resp.status_code == 201
+        assert list(OutboxEvent.objects.values_list('event', 'payload')) == [
+            ('order_created', {'order_id': resp.json()['order']}),
+        ]
+
+        out_of_stock.cart = buyer_user.cart
+        out_of_stock.save()
+        resp = buyer_client.post(url, data={'shipping_note': set_shipping_note.id})
+
+        assert resp.status_code == 400
+        assert OutboxEvent.objects.count() == 1
+
+    @pytest.mark.skipif(connection.vendor == 'sqlite', reason='SQLite serializes writers with table locks')
+    @pytest.mark.django_db(transaction=True)
+    def test_order_create_concurrent(self, django_user_model, model_create):
+        stock_quantity, buyers_count = 10, 25
+        product = model_create(Product, stock_quantity=stock_quantity)
+
+        clients = []
+        for number in range(buyers_count):
+            buyer = django_user_model.objects.create(email=f'buyer{number}@gmail.com', type='buyer')
+            cart = Cart.objects.create(user=buyer)
+            model_create(CartProduct, cart=cart, product=product, quantity=1)
+            shipping_note = model_create(ShippingNote, user=buyer)
+
+            client = APIClient()
+            client.force_authenticate(user=buyer)
+            clients.append((client, shipping_note.id))
+
+        url = reverse('api:buyer-orders-list')
+        barrier = threading.Barrier(buyers_count)
+        statuses = []
+
+        def checkout(client, shipping_note_id):
+            try:
+                barrier.wait()
+                statuses.append(client.post(url, data={'shipping_note': shipping_note_id}).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=args) for args in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        assert statuses.count(201) == stock_quantity
+        assert statuses.count(400) == buyers_count - stock_quantity
+        assert product.stock_quantity == 0
+        assert OrderProduct.objects.filter(product=product).count() == stock_quantity
+
     def test_order_retrieve(self, buyer_user, buyer_client, model_create):
         order = model_create(Order, user=buyer_user)
         order_attrs = self._order_dict(order)
@@ -519,15 +1159,60 @@ class TestOrderViewSet:
 
     def test_orders_list(self, buyer_user, buyer_client, model_create):
         orders = model_create(Order, user=buyer_user, _quantity=3)
-        orders_attrs = [self._order_dict(order) for order in orders]
+        orders_attrs = [self._order_summary_dict(order) for order in orders]
 
         url = reverse('api:buyer-orders-list')
         resp = buyer_client.get(url)
-        resp_orders = resp.json()
+        resp_orders = resp.json()['results']
 
         assert resp.status_code == 200
         assert resp_orders == orders_attrs
 
+    def test_orders_list_queries(self, buyer_user, buyer_client, model_create, django_assert_max_num_queries):
+        model_create(Order, user=buyer_user, _quantity=10)
+
+        with django_assert_max_num_queries(3):
+            resp = buyer_client.get(reverse('api:buyer-orders-list'))
+
+        assert resp.status_code == 200
+        assert len(resp.json()['results']) == 10
+
+    def test_order_retrieve_queries(self, buyer_user, buyer_client, model_create, django_assert_max_num_queries):
+        order = model_create(Order, user=buyer_user)
+        model_create(OrderProduct, order=order, _quantity=10)
+
+        with django_assert_max_num_queries(4):
+            resp = buyer_client.get(reverse('api:buyer-orders-detail', kwargs={'pk': order.id}))
+
+        assert resp.status_code == 200
+        assert len(resp.json()['positions']) == order.order_products.count()
+        assert Decimal(resp.json()['total_sum']) == sum(position.sum for position in order.order_products.all())
+
+    def test_order_summary(self, buyer_user, buyer_client, model_create, settings):
+        set_cart_products = model_create(
+            CartProduct, cart=buyer_user.cart, quantity=2, product__stock_quantity=10, _quantity=2,
+        )
+        set_shipping_note = model_create(ShippingNote, user=buyer_user)
+
+        settings.EMAIL_ORDER_NOTIFICATIONS = False
+
+        resp = buyer_client.post(reverse('api:buyer-orders-list'), data={'shipping_note': set_shipping_note.id})
+        assert resp.status_code == 201
+
+        order = Order.objects.get(id=resp.json()['order'])
+        assert order.total == sum(2 * cart_product.product.price for cart_product in set_cart_products)
+        assert order.item_count == 4
+        assert order.statuses == [
+            {'shop': cart_product.product.shop.name, 'status': 'new'} for cart_product in set_cart_products
+        ]
+
+        order_shop = order.order_shops.get(shop=set_cart_products[1].product.shop)
+        order_shop.status = 'sent'
+        order_shop.save()
+
+        order.refresh_from_db()
+        assert [status['status'] for status in order.statuses] == ['new', 'sent']
+
 
 @pytest.mark.django_db
 class TestOrderShopViewSet:
@@ -536,7 +1221,12 @@ class TestOrderShopViewSet:
         set_cart_products = []
         for product in set_products:
             set_cart_products.append(
-                model_create(CartProduct, cart=buyer_user.cart, product=product)
+                model_create(
+                    CartProduct,
+                    cart=buyer_user.cart,
+                    product=product,
+                    quantity=product.stock_quantity,
+                )
             )
         return set_cart_products
 
@@ -616,6 +1306,25 @@ class TestOrderShopViewSet:
             status=resp_order_shop['status'],
         )
 
+    def test_order_shop_cancel(self, buyer_user, seller_user, seller_client, model_create, settings):
+        set_shop = model_create(Shop, user=seller_user)
+        set_products = model_create(Product, shop=set_shop, stock_quantity=10, _quantity=3)
+        for product in set_products:
+            model_create(CartProduct, cart=buyer_user.cart, product=product, quantity=4)
+
+        settings.EMAIL_ORDER_NOTIFICATIONS = False
+
+        order = model_create(Order, user=buyer_user)
+        shop_products = Product.objects.filter(shop=set_shop)
+        assert set(shop_products.values_list('stock_quantity', flat=True)) == {6}
+
+        url = reverse('api:seller-orders-detail', kwargs={'order': order.id})
+        for _ in range(2):
+            resp = seller_client.patch(url, {'status': 'canceled'})
+            assert resp.status_code == 200
+
+        assert set(shop_products.values_list('stock_quantity', flat=True)) == {10}
+
     def test_orders_shop_list(self, buyer_user, seller_user, seller_client, model_create):
         set_shop = model_create(Shop, user=seller_user)
 
@@ -628,7 +1337,143 @@ class TestOrderShopViewSet:
 
         url = reverse('api:seller-orders-list')
         resp = seller_client.get(url)
-        resp_orders_shop = resp.json()
+        resp_orders_shop = resp.json()['results']
 
         assert resp.status_code == 200
         assert resp_orders_shop == orders_shop_attrs
+
+    def test_orders_shop_list_queries(self, buyer_user, seller_user, seller_client, model_create):
+        set_shop = model_create(Shop, user=seller_user)
+        url = reverse('api:seller-orders-list')
+        load_identity(seller_user.id)
+
+        queries = []
+        for _ in range(2):
+            for _ in range(3):
+                set_products = model_create(Product, shop=set_shop, _quantity=3)
+                self._set_cart_products(set_products, buyer_user, model_create)
+                model_create(Order, user=buyer_user)
+
+            with CaptureQueriesContext(connection) as context:
+                resp = seller_client.get(url)
+            assert resp.status_code == 200
+            queries.append(len(context))
+
+        assert len(resp.json()['results']) == 6
+        assert queries[0] == queries[1]
+
+    def test_orders_shop_list_filter(self, buyer_user, seller_user, seller_client, model_create):
+        set_shop = model_create(Shop, user=seller_user)
+
+        orders = []
+        for _ in range(3):
+            set_products = model_create(Product, shop=set_shop, _quantity=2)
+            self._set_cart_products(set_products, buyer_user, model_create)
+            orders.append(model_create(Order, user=buyer_user))
+        OrderShop.objects.filter(order=orders[1], shop=set_shop).update(status='sent')
+        Order.objects.filter(id=orders[2].id).update(created_at=timezone.now() - timedelta(days=3))
+
+        url = reverse('api:seller-orders-list')
+        today = timezone.localdate().isoformat()
+        for params, expected in (
+            ({'status': 'sent'}, [orders[1]]),
+            ({'status': ['new', 'sent']}, orders),
+            ({'created_after': today}, orders[:2]),
+            ({'created_before': today, 'status': 'new'}, [orders[0], orders[2]]),
+            ({'created_before': (timezone.localdate() - timedelta(days=1)).isoformat()}, [orders[2]]),
+        ):
+            resp = seller_client.get(url, params)
+            assert resp.status_code == 200
+            assert [order_shop['order']['id'] for order_shop in resp.json()['results']] == [
+                order.id for order in expected
+            ]
+
+        resp = seller_client.get(url, {'status': 'lost'})
+        assert resp.status_code == 400
+
+    def test_order_shop_update_invalid_transition(self, buyer_user, seller_user, seller_client, model_create):
+        set_shop = model_create(Shop, user=seller_user)
+        set_products = model_create(Product, shop=set_shop, _quantity=2)
+        self._set_cart_products(set_products, buyer_user, model_create)
+        order = model_create(Order, user=buyer_user)
+
+        url = reverse('api:seller-orders-detail', kwargs={'order': order.id})
+        resp = seller_client.patch(url, {'status': 'delivered'})
+
+        assert resp.status_code == 400
+        assert OrderShop.objects.get(order=order, shop=set_shop).status == 'new'
+
+    def _transition_orders(self, buyer_user, set_shop, model_create, count):
+        orders = []
+        for _ in range(count):
+            set_products = model_create(Product, shop=set_shop, stock_quantity=5, _quantity=2)
+            for product in set_products:
+                model_create(CartProduct, cart=buyer_user.cart, product=product, quantity=2)
+            orders.append(model_create(Order, user=buyer_user))
+        return orders
+
+    def test_orders_shop_transition(self, buyer_user, seller_user, seller_client, model_create, settings):
+        settings.EMAIL_ORDER_NOTIFICATIONS = True
+        set_shop = model_create(Shop, user=seller_user)
+        orders = self._transition_orders(buyer_user, set_shop, model_create, 3)
+        other_order = model_create(Order, user=buyer_user)
+        OrderShop.objects.filter(order__in=orders[:2], shop=set_shop).update(status='assembled')
+
+        url = reverse('api:seller-orders-transition')
+        with CaptureQueriesContext(connection) as context:
+            resp = seller_client.post(url, {
+                'orders': [order.id for order in (*orders, other_order)],
+                'from_status': 'assembled',
+                'to_status': 'sent',
+            })
+
+        assert resp.status_code == 200
+        assert resp.json() == [
+            {'order': orders[0].id, 'status': 'sent', 'result': 'transitioned'},
+            {'order': orders[1].id, 'status': 'sent', 'result': 'transitioned'},
+            {'order': orders[2].id, 'status': 'new', 'result': 'invalid_status'},
+            {'order': other_order.id, 'status': None, 'result': 'not_found'},
+        ]
+        assert len([
+            query for query in context.captured_queries if query['sql'].startswith('UPDATE "api_ordershop"')
+        ]) == 1
+        assert list(
+            OrderShop.objects.filter(order__in=orders, shop=set_shop).order_by('order_id').values_list('status', flat=True)
+        ) == ['sent', 'sent', 'new']
+        assert {'shop': set_shop.name, 'status': 'sent'} in Order.objects.get(id=orders[0].id).statuses
+
+        events = list(OutboxEvent.objects.filter(event='orders_updated'))
+        assert len(events) == 1
+        assert sorted(events[0].payload['order_shop_ids']) == sorted(
+            OrderShop.objects.filter(order__in=orders[:2], shop=set_shop).values_list('id', flat=True)
+        )
+
+    def test_orders_shop_transition_cancel(self, buyer_user, seller_user, seller_client, model_create, settings):
+        settings.EMAIL_ORDER_NOTIFICATIONS = False
+        set_shop = model_create(Shop, user=seller_user)
+        orders = self._transition_orders(buyer_user, set_shop, model_create, 2)
+        shop_products = Product.objects.filter(shop=set_shop)
+        assert set(shop_products.values_list('stock_quantity', flat=True)) == {3}
+
+        url = reverse('api:seller-orders-transition')
+        data = {'orders': [order.id for order in orders], 'from_status': 'new', 'to_status': 'canceled'}
+        for result in ('transitioned', 'invalid_status'):
+            resp = seller_client.post(url, data)
+            assert resp.status_code == 200
+            assert {order['result'] for order in resp.json()} == {result}
+
+        assert set(shop_products.values_list('stock_quantity', flat=True)) == {5}
+        assert {'shop': set_shop.name, 'status': 'canceled'} in Order.objects.get(id=orders[1].id).statuses
+        assert not OutboxEvent.objects.filter(event='orders_updated').exists()
+
+    def test_orders_shop_transition_invalid(self, seller_user, seller_client, model_create):
+        model_create(Shop, user=seller_user)
+        url = reverse('api:seller-orders-transition')
+
+        for data in (
+            {'orders': [1], 'from_status': 'new', 'to_status': 'delivered'},
+            {'orders': [1], 'from_status': 'canceled', 'to_status': 'new'},
+            {'orders': [], 'from_status': 'new', 'to_status': 'confirmed'},
+            {'orders': [1], 'from_status': 'new', 'to_status': 'lost'},
+        ):
+            assert seller_client.post(url, data).status_code == 400
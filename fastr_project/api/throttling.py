@@ -0,0 +1,169 @@
+"""
+Sliding window rate limits shared by all processes through the cache.
+
+Each client has a request counter per fixed window of the rate period. The
+sliding window count is the current counter plus the previous one weighted by
+the share of the previous window still inside the sliding window, so every
+check reads two counters regardless of the request history. With the Redis
+cache the check and increment run atomically in one Lua script, other caches
+check and increment separately.
+
+Views pick a rate by throttle_scope, clients without one are limited by the
+"user" or "anon" rate. RateLimitMiddleware reports the limit of the request
+in RateLimit-* headers.
+"""
+import hashlib
+import math
+import time
+from collections import namedtuple
+
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+from redis.exceptions import NoScriptError
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from api.middleware import HybridMiddleware
+
+RATE_KEY = 'api:throttling:{}:{}:{}'
+
+RateLimit = namedtuple('RateLimit', ('limit', 'period', 'remaining', 'reset'))
+
+# KEYS: current and previous window counters.
+# ARGV: limit, weight of the previous window, counter expiry in seconds.
+# Returns whether the request is allowed and both counters.
+SLIDING_WINDOW_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[2]) + current + 1 > tonumber(ARGV[1]) then
+    return {0, current, previous}
+end
+current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return {1, current, previous}
+"""
+SLIDING_WINDOW_SHA = hashlib.sha1(SLIDING_WINDOW_SCRIPT.encode()).hexdigest()
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """
+    Number of requests and period in seconds of a rate like "100/day".
+    """
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+def _redis_hit(redis_cache, keys, limit, weight, timeout):
+    client = redis_cache._cache.get_client(keys[0], write=True)  # pylint: disable=protected-access
+    args = (limit, weight, timeout)
+    try:
+        return client.evalsha(SLIDING_WINDOW_SHA, len(keys), *keys, *args)
+    except NoScriptError:
+        return client.eval(SLIDING_WINDOW_SCRIPT, len(keys), *keys, *args)
+
+
+def _cache_hit(default_cache, keys, limit, weight, timeout):
+    counters = default_cache.get_many(keys)
+    current, previous = counters.get(keys[0], 0), counters.get(keys[1], 0)
+    if previous * weight + current + 1 > limit:
+        return 0, current, previous
+    default_cache.add(keys[0], 0, timeout)
+    return 1, default_cache.incr(keys[0]), previous
+
+
+def hit(scope, ident, limit, period, now):
+    """
+    Counts a request of the client within the rate at the given timestamp.
+    Returns whether it is allowed, the rate limit state and seconds to wait if it is not.
+    """
+    window, elapsed = divmod(now, period)
+    weight = 1 - elapsed / period
+    keys = [RATE_KEY.format(scope, ident, int(window - offset)) for offset in (0, 1)]
+
+    # The cache proxy is never a RedisCache itself, the backend is checked
+    default_cache = caches['default']
+    if isinstance(default_cache, RedisCache):
+        keys = [default_cache.make_key(key) for key in keys]
+        allowed, current, previous = _redis_hit(default_cache, keys, limit, weight, 2 * period)
+    else:
+        allowed, current, previous = _cache_hit(default_cache, keys, limit, weight, 2 * period)
+
+    count = previous * weight + current
+    rate_limit = RateLimit(
+        limit, period, max(0, math.floor(limit - count)), math.ceil(period - elapsed),
+    )
+    if allowed:
+        return True, rate_limit, None
+
+    # Time until the previous window weighs little enough for one more request
+    if current + 1 > limit:
+        wait = period - elapsed + period * (1 - (limit - 1) / current)
+    else:
+        wait = period * (1 - (limit - current - 1) / previous) - elapsed
+    return False, rate_limit, wait
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Limits requests per user, or per IP address of anonymous clients, with the
+    rate of the view's throttle_scope from DEFAULT_THROTTLE_RATES.
+    """
+    timer = time.time
+
+    def __init__(self):
+        self.wait_time = None
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        return 'user' if request.user and request.user.is_authenticated else 'anon'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        allowed, rate_limit, self.wait_time = hit(scope, ident, *parse_rate(rate), now=self.timer())
+
+        # The most restrictive limit of the request is reported in its headers
+        previous = getattr(request._request, 'rate_limit', None)  # pylint: disable=protected-access
+        if previous is None or rate_limit.remaining < previous.remaining:
+            request._request.rate_limit = rate_limit  # pylint: disable=protected-access
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+def _add_headers(request, response):
+    rate_limit = getattr(request, 'rate_limit', None)
+    if rate_limit is not None:
+        response['RateLimit-Limit'] = rate_limit.limit
+        response['RateLimit-Remaining'] = rate_limit.remaining
+        response['RateLimit-Reset'] = rate_limit.reset
+        response['RateLimit-Policy'] = f'{rate_limit.limit};w={rate_limit.period}'
+    return response
+
+
+class RateLimitMiddleware(HybridMiddleware):
+    """
+    Adds RateLimit-Limit, RateLimit-Remaining, RateLimit-Reset and
+    RateLimit-Policy headers to responses of rate limited requests.
+    """
+    def handle(self, request):
+        return _add_headers(request, self.get_response(request))
+
+    async def ahandle(self, request):
+        return _add_headers(request, await self.get_response(request))
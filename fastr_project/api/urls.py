@@ -5,7 +5,8 @@ from rest_framework.routers import DefaultRouter
 from api.views import (
     CategoryViewSet, AttributeViewSet, ShopRetrieveViewSet,
     ShippingNoteViewSet, ProductRetrieveViewSet, OrderViewSet,
-    ShopCreateView, ProductCreateViewSet, OrderShopViewSet, CartProductView
+    ShopCreateView, ProductCreateViewSet, OrderShopViewSet, CartProductView,
+    ProductImportViewSet, ProfilingView,
 )
 
 
@@ -20,6 +21,7 @@ router.register('shops', ShopRetrieveViewSet, basename='shops')
 seller_router = DefaultRouter()
 seller_router.register('orders', OrderShopViewSet, basename='seller-orders')
 seller_router.register('products', ProductCreateViewSet, basename='seller-products')
+seller_router.register('product-imports', ProductImportViewSet, basename='seller-product-imports')
 
 buyer_router = DefaultRouter()
 buyer_router.register('orders', OrderViewSet, basename='buyer-orders')
@@ -36,4 +38,6 @@ urlpatterns = [
     path('v1/buyer/', include(buyer_router.urls)),
     path('v1/buyer/cart/', CartProductView.as_view(), name='buyer-cart'),
 
+    path('v1/profiling/', ProfilingView.as_view(), name='profiling'),
+
 ]
@@ -1,27 +1,43 @@
+from django.db import transaction
 from django.db.models import Prefetch
 
 from rest_framework.response import Response
+from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter
-from rest_framework.permissions import AllowAny
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.views import APIView
 from rest_framework.generics import GenericAPIView
 from rest_framework.viewsets import GenericViewSet
 from rest_framework import viewsets, status, mixins
 
 from api import serializers
+from api.authentication import get_identity
+from api.cache import CachedResponseMixin
+from api.databases import ReadReplicaMixin, ReadYourWritesMixin
+from api.changes import ProductChangesParamsSerializer, get_product_changes
+from api.exporters import ProductExportMixin
+from api.metrics import ORDERS_PLACED
+from api.eager_loading import EagerLoadingMixin, get_eager_loading_plan
+from api.filters import OrderShopFilter, ProductFilter, ProductSearchFilter, get_product_facets
+from api.pagination import CreatedAtCursorPagination, OrderCursorPagination
+from api.profiling import get_profile_stats, reset_profile_stats
 from api.permissions import IsBuyer, IsSeller, IsSellerHasShop, IsSellerHasNoShop
 from api.models import (
-    Category, Attribute, Shop, Order, Product,
-    ShippingNote, CartProduct, OrderShop, OrderProduct
+    Category, Attribute, Shop, Cart, Order, Product, ProductAttribute,
+    ShippingNote, CartProduct, OrderShop, OrderProduct, ProductImport,
 )
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(ReadReplicaMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """
     Retrieves product categories. It is not possible to create categories by user request.
     """
     queryset = Category.objects.all()
     serializer_class = serializers.CategorySerializer
     permission_classes = (AllowAny,)
+    throttle_scope = 'catalog'
+    cache_models = (Category,)
 
 
 class ShippingNoteViewSet(
@@ -58,6 +74,9 @@ class AttributeViewSet(
 
 
 class ProductCreateViewSet(
+    ReadYourWritesMixin,
+    ProductExportMixin,
+    EagerLoadingMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
@@ -65,31 +84,94 @@ class ProductCreateViewSet(
     GenericViewSet,
 ):
     """
-    Creates, retrieves and updates selling products. For sellers only. Seller must have shop.
+    Creates, retrieves, updates and exports selling products.
+    For sellers only. Seller must have shop.
     """
     queryset = Product.objects.all()
     serializer_class = serializers.ProductCreateSerializer
     permission_classes = (IsSeller, IsSellerHasShop)
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
-        return Product.objects.filter(shop=self.request.user.shop)
+        return Product.objects.filter(shop_id=get_identity(self.request).shop_id)
 
     def perform_create(self, serializer):
-        serializer.save(shop=self.request.user.shop)
+        serializer.save(shop_id=get_identity(self.request).shop_id)
 
 
-class ProductRetrieveViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductImportViewSet(
+    ReadYourWritesMixin,
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.ListModelMixin,
+    GenericViewSet,
+):
+    """
+    Imports products from CSV, JSON, NDJSON or YAML price lists in background
+    and reports import progress. For sellers only. Seller must have shop.
+    """
+    serializer_class = serializers.ProductImportSerializer
+    permission_classes = (IsSeller, IsSellerHasShop)
+    parser_classes = (MultiPartParser,)
+
+    def get_queryset(self):
+        return ProductImport.objects.filter(shop_id=get_identity(self.request).shop_id)
+
+    def perform_create(self, serializer):
+        serializer.save(shop_id=get_identity(self.request).shop_id)
+
+
+class ProductRetrieveViewSet(
+    ReadReplicaMixin,
+    CachedResponseMixin,
+    ProductExportMixin,
+    EagerLoadingMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
     """
-    Retrieves selling products from open shops.
+    Retrieves and exports selling products from open shops. Search results are ranked by relevance.
+    Products are filtered by categories, shops, price range and attribute values.
+    Catalog mirrors sync with the change feed of changed and deleted products.
     """
     queryset = Product.objects.filter(shop__is_open=True)
     serializer_class = serializers.ProductRetrieveSerializer
     permission_classes = (AllowAny,)
-    filter_backends = (SearchFilter,)
-    search_fields = ('name', 'description')
+    throttle_scope = 'catalog'
+    pagination_class = CreatedAtCursorPagination
+    filter_backends = (ProductSearchFilter, ProductFilter)
+    search_fields = ('name', 'description', 'product_attributes__value')
+    cache_models = (Product, ProductAttribute, Attribute, Shop, Category)
+    cache_instance_model = Product
+
+    @action(detail=False)
+    def facets(self, request):
+        """
+        Counts filtered products per category and per attribute value.
+        """
+        return self.cached_response(
+            lambda request: Response(get_product_facets(self.filter_queryset(self.get_queryset()))),
+            request,
+        )
+
+    @action(detail=False)
+    def changes(self, request):
+        """
+        Returns products changed and deleted after the position of the since token,
+        the next token continues from the last returned change.
+        """
+        params = ProductChangesParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        return Response(get_product_changes(
+            self.get_queryset(),
+            self.get_serializer_class(),
+            context=self.get_serializer_context(),
+            **params.validated_data,
+        ))
 
 
 class ShopCreateView(
+    ReadYourWritesMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
@@ -109,7 +191,7 @@ class ShopCreateView(
         return super().get_permissions()
 
     def get_object(self):
-        return self.request.user.shop
+        return Shop.objects.get(id=get_identity(self.request).shop_id)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -124,18 +206,26 @@ class ShopCreateView(
         return self.partial_update(request, *args, **kwargs)
 
 
-class ShopRetrieveViewSet(viewsets.ReadOnlyModelViewSet):
+class ShopRetrieveViewSet(
+    ReadReplicaMixin,
+    CachedResponseMixin,
+    EagerLoadingMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
     """
     Retrieves open shops.
     """
     queryset = Shop.objects.filter(is_open=True)
     serializer_class = serializers.ShopRetrieveSerializer
     permission_classes = (AllowAny,)
+    throttle_scope = 'catalog'
     filter_backends = (SearchFilter,)
     search_fields = ('name',)
+    cache_models = (Shop, Category)
 
 
 class CartProductView(
+    ReadYourWritesMixin,
     mixins.RetrieveModelMixin,
     mixins.CreateModelMixin,
     mixins.UpdateModelMixin,
@@ -149,7 +239,11 @@ class CartProductView(
     serializer_class = serializers.CartProductCreateSerializer
 
     def get_object(self):
-        return self.request.user.cart
+        if self.request.method == 'GET':
+            cart = Cart.objects.filter(user=self.request.user)
+            return get_eager_loading_plan(serializers.CartRetrieveSerializer).apply(cart).get()
+
+        return Cart.objects.get(id=get_identity(self.request).cart_id)
 
     def get_serializer(self, *args, **kwargs):
         kwargs.setdefault('context', self.get_serializer_context())
@@ -160,7 +254,7 @@ class CartProductView(
         return serializers.CartProductCreateSerializer(many=True, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(cart=self.request.user.cart)
+        serializer.save(cart_id=get_identity(self.request).cart_id)
 
     def get(self, request, *args, **kwargs):
         return self.retrieve(request, *args, **kwargs)
@@ -172,15 +266,12 @@ class CartProductView(
         return self.partial_update(request, *args, **kwargs)
 
     def delete(self, request, *args, **kwargs):
-        cart = self.get_object()
         delete_products = request.data.get('products')
 
         if delete_products:
-            for product in delete_products:
-                cart_product = CartProduct.objects.filter(cart=cart, product=product)
-
-                if cart_product:
-                    cart_product.delete()
+            CartProduct.objects.filter(
+                cart_id=get_identity(request).cart_id, product__in=delete_products,
+            ).delete()
 
             return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -191,6 +282,8 @@ class CartProductView(
 
 
 class OrderViewSet(
+    ReadYourWritesMixin,
+    EagerLoadingMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
@@ -201,39 +294,87 @@ class OrderViewSet(
     """
     queryset = Order.objects.all()
     permission_classes = (IsBuyer,)
+    pagination_class = CreatedAtCursorPagination
+    throttle_scope = None
 
     def get_queryset(self):
         return Order.objects.filter(user=self.request.user)
 
+    def get_throttles(self):
+        if self.action == 'create':
+            self.throttle_scope = 'checkout'
+        return super().get_throttles()
+
     def get_serializer_class(self):
         if self.action == 'create':
             return serializers.OrderCreateSerializer
+        if self.action == 'list':
+            return serializers.OrderSummarySerializer
         return serializers.OrderRetrieveSerializer
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+        transaction.on_commit(ORDERS_PLACED.inc)
 
 
 class OrderShopViewSet(
+    ReadYourWritesMixin,
+    EagerLoadingMixin,
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
     mixins.ListModelMixin,
     GenericViewSet,
 ):
     """
-    Creates and retrieve orders. Updates order status. For sellers only. Seller must have shop.
+    Retrieves orders. Updates order statuses one by one or in bulk.
+    For sellers only. Seller must have shop.
     """
     queryset = OrderShop.objects.all()
     serializer_class = serializers.OrderShopRetrieveSerializer
     lookup_field = 'order'
+    filter_backends = (OrderShopFilter,)
+    pagination_class = OrderCursorPagination
     permission_classes = (IsSeller, IsSellerHasShop)
 
     def get_queryset(self):
-        shop = self.request.user.shop
+        shop_id = get_identity(self.request).shop_id
 
         prefetch_positions = Prefetch(
             'order__order_products',
-            OrderProduct.objects.filter(product__shop=shop)
+            OrderProduct.objects.filter(product__shop_id=shop_id)
         )
 
-        return OrderShop.objects.filter(shop=shop).prefetch_related(prefetch_positions)
+        return OrderShop.objects.filter(shop_id=shop_id).prefetch_related(prefetch_positions)
+
+    @action(
+        detail=False, methods=['post'], serializer_class=serializers.OrderShopTransitionSerializer,
+    )
+    def transition(self, request):
+        """
+        Moves many orders from one status to another at once. Returns the result for each order:
+        transitioned, invalid_status if the order has another status, or not_found.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        return Response(OrderShop.objects.transition(
+            get_identity(request).shop_id,
+            serializer.validated_data['orders'],
+            serializer.validated_data['from_status'],
+            serializer.validated_data['to_status'],
+        ))
+
+
+class ProfilingView(APIView):
+    """
+    Retrieves and resets request profiling histograms per view. For staff only.
+    """
+    permission_classes = (IsAdminUser,)
+    schema = None
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_profile_stats())
+
+    def delete(self, request, *args, **kwargs):
+        reset_profile_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
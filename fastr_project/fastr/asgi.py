@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fastr.settings')
 
-application = get_asgi_application()
+
+def get_application():
+    django.setup(set_prefix=False)
+    from api.async_views import AsyncCatalogHandler  # pylint: disable=import-outside-toplevel
+    return AsyncCatalogHandler()
+
+
+application = get_application()
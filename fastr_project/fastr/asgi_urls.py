@@ -0,0 +1,9 @@
+"""
+URL configuration of the ASGI application: routes of fastr.urls, with the
+public catalog reads served by async views.
+"""
+from api.async_views import async_urlpatterns
+from fastr.urls import urlpatterns as sync_urlpatterns
+
+
+urlpatterns = async_urlpatterns(sync_urlpatterns)
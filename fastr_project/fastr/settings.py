@@ -23,7 +23,28 @@ env = environ.Env(
     CELERY_BROKER_URL=(str, 'redis://redis:6379/0'),
     ELERY_RESULT_BACKEND=(str, 'redis://redis:6379/1'),
     EMAIL_ORDER_NOTIFICATIONS=(bool, False),
+    PAGE_SIZE=(int, 50),
+    MAX_PAGE_SIZE=(int, 500),
+    SEARCH_CONFIG=(str, 'english'),
+    CACHE_URL=(str, 'locmemcache://'),
+    CATALOG_CACHE_TIMEOUT=(int, 300),
+    IDENTITY_CACHE_TIMEOUT=(int, 60),
+    DATABASE_REPLICA_URL=(str, ''),
+    DATABASE_CONN_MAX_AGE=(int, 60),
+    DATABASE_HEALTH_CHECKS=(bool, True),
+    READ_YOUR_WRITES_TIMEOUT=(int, 10),
+    OUTBOX_BATCH_SIZE=(int, 100),
+    OUTBOX_RELAY_INTERVAL=(float, 5),
+    PRODUCT_IMPORT_MAX_SIZE=(int, 50 * 1024 * 1024),
+    PRODUCT_IMPORT_CHUNK_SIZE=(int, 1000),
+    EXPORT_CHUNK_SIZE=(int, 2000),
+    CHANGES_SETTLE_LAG=(float, 5),
     THROTTLING=(bool, True),
+    PROFILING=(bool, False),
+    METRICS=(bool, True),
+    METRICS_FLUSH_INTERVAL=(float, 10),
+    METRICS_TOKEN=(str, ''),
+    PROFILING_SLOW_REQUEST=(int, 500),
 )
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -71,6 +92,19 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request counts, latency and query histograms exposed at /metrics, see api.metrics
+METRICS = env('METRICS')
+if METRICS:
+    MIDDLEWARE.insert(0, 'api.metrics.MetricsMiddleware')
+
+# RateLimit-* headers of rate limited requests, see api.throttling
+if env('THROTTLING'):
+    MIDDLEWARE.append('api.throttling.RateLimitMiddleware')
+
+# Per-request query and timing instrumentation, see api.profiling
+if env('PROFILING'):
+    MIDDLEWARE.insert(0, 'api.profiling.ProfilingMiddleware')
+
 ROOT_URLCONF = 'fastr.urls'
 
 TEMPLATES = [
@@ -97,7 +131,25 @@ AUTH_USER_MODEL = 'users.User'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# The replica alias falls back to the primary,
+# it is only read from when DATABASE_REPLICA_URL is set. Tests read it as a mirror of the primary.
 DATABASES = {'default': env.db()}
+DATABASES['replica'] = {
+    **(env.db('DATABASE_REPLICA_URL') if env('DATABASE_REPLICA_URL') else DATABASES['default']),
+    'TEST': {'MIRROR': 'default'},
+}
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = env('DATABASE_CONN_MAX_AGE')
+
+# Catalog and read-only task reads go to the replica, see api.databases
+DATABASE_ROUTERS = ['api.databases.ReplicaRouter']
+REPLICA_DATABASE = 'replica' if env('DATABASE_REPLICA_URL') else None
+
+# Seconds users read from the primary after their own writes
+READ_YOUR_WRITES_TIMEOUT = env('READ_YOUR_WRITES_TIMEOUT')
+
+# Persistent connections are checked before reuse by each request and task
+DATABASE_HEALTH_CHECKS = env('DATABASE_HEALTH_CHECKS')
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -133,11 +185,36 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded price lists, shared by web and Celery worker containers
+MEDIA_ROOT = env('MEDIA_ROOT', default=str(BASE_DIR / 'media'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache, Redis in production: Django's own Redis backend is used instead of django-redis
+# https://docs.djangoproject.com/en/4.0/topics/cache/#redis
+CACHE_URL = env('CACHE_URL')
+CACHE_REDIS = CACHE_URL.startswith('redis')
+CACHES = {
+    'default': env.cache_url_config(
+        CACHE_URL,
+        backend='django.core.cache.backends.redis.RedisCache' if CACHE_REDIS else None,
+    ),
+}
+# Metric samples of all processes, see api.metrics. Kept in one Redis hash next to the default
+# cache, other backends get a store of their own, so metrics never cull cached entries.
+CACHES['metrics'] = (
+    CACHES['default'] if CACHE_REDIS else {**CACHES['default'], 'LOCATION': 'metrics'}
+)
+
+# Seconds public catalog responses are cached for, changes invalidate them earlier
+CATALOG_CACHE_TIMEOUT = env('CATALOG_CACHE_TIMEOUT')
+
+# Seconds authenticated users are cached with their shop and cart ids, see api.authentication
+IDENTITY_CACHE_TIMEOUT = env('IDENTITY_CACHE_TIMEOUT')
+
 # Email SMTP server settings
 DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL')
 EMAIL_HOST = env('EMAIL_HOST')
@@ -146,12 +223,18 @@ EMAIL_PORT = env('EMAIL_PORT')
 # Email notifications settings
 EMAIL_ORDER_NOTIFICATIONS = env('EMAIL_ORDER_NOTIFICATIONS')
 
+# Largest page size clients can request from list endpoints
+MAX_PAGE_SIZE = env('MAX_PAGE_SIZE')
+
+# PostgreSQL text search configuration of the product catalog search
+SEARCH_CONFIG = env('SEARCH_CONFIG')
+
 # Django REST framework settings
 # https://www.django-rest-framework.org/api-guide/settings/
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PARSER_CLASSES': (
         'rest_framework.parsers.JSONParser',
@@ -161,17 +244,22 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.CursorPagination',
+    'PAGE_SIZE': env('PAGE_SIZE'),
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 }
 
+# Sliding window rate limits counted in the shared cache, see api.throttling.
+# Views choose a rate by throttle_scope, "anon" and "user" rates apply to the rest.
 if env('THROTTLING'):
     REST_FRAMEWORK.update(
         DEFAULT_THROTTLE_CLASSES=[
-            'rest_framework.throttling.AnonRateThrottle',
-            'rest_framework.throttling.UserRateThrottle',
+            'api.throttling.SlidingWindowThrottle',
         ],
         DEFAULT_THROTTLE_RATES={
-            'dj_rest_auth': '10/day',
+            'dj_rest_auth': '20/min',
+            'catalog': '100/min',
+            'checkout': '30/hour',
             'anon': '100/day',
             'user': '1000/day',
         },
@@ -216,3 +304,31 @@ SIMPLE_JWT = {
 # https://docs.celeryq.dev/en/stable/django/first-steps-with-django.html#using-celery-with-django
 CELERY_BROKER_URL = env('CELERY_BROKER')
 CELERY_RESULT_BACKEND = env('CELERY_BACKEND')
+CELERY_BEAT_SCHEDULE = {
+    'relay-outbox-events': {
+        'task': 'api.tasks.relay_outbox_events',
+        'schedule': env('OUTBOX_RELAY_INTERVAL'),
+        'options': {'expires': env('OUTBOX_RELAY_INTERVAL')},
+    },
+}
+
+# Outbox events published to Celery per relay transaction
+OUTBOX_BATCH_SIZE = env('OUTBOX_BATCH_SIZE')
+
+# Largest price list file in bytes and products upserted per transaction by product imports
+PRODUCT_IMPORT_MAX_SIZE = env('PRODUCT_IMPORT_MAX_SIZE')
+PRODUCT_IMPORT_CHUNK_SIZE = env('PRODUCT_IMPORT_CHUNK_SIZE')
+
+# Rows fetched per server-side cursor round trip by product exports
+EXPORT_CHUNK_SIZE = env('EXPORT_CHUNK_SIZE')
+
+# Seconds product changes are held back from the change feed until concurrent transactions commit
+CHANGES_SETTLE_LAG = env('CHANGES_SETTLE_LAG')
+
+# Milliseconds after which profiled requests are logged with their repeated SQL statements
+PROFILING_SLOW_REQUEST = env('PROFILING_SLOW_REQUEST')
+
+# Seconds metrics are counted in process memory before being added to the cache,
+# and the bearer token required by /metrics, if any
+METRICS_FLUSH_INTERVAL = env('METRICS_FLUSH_INTERVAL')
+METRICS_TOKEN = env('METRICS_TOKEN')
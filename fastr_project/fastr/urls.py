@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from api.metrics import metrics_view
+
 
 urlpatterns = [
 
@@ -15,3 +18,6 @@ urlpatterns = [
     path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
 
 ]
+
+if settings.METRICS:
+    urlpatterns.append(path('metrics', metrics_view, name='metrics'))
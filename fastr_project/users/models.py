@@ -83,3 +83,10 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.email
+
+    def refresh_from_db(self, using=None, fields=None):
+        # Users authenticated from the identity cache load the rest of their fields at once
+        deferred_fields = self.get_deferred_fields()
+        if fields is not None and deferred_fields.issuperset(fields):
+            fields = deferred_fields
+        super().refresh_from_db(using, fields)
@@ -2,13 +2,14 @@ from django.core.mail import EmailMessage
 
 from celery import shared_task
 
+from api.databases import get_or_primary
 from users.models import User
 
 
-@shared_task
+@shared_task(reads_replica=True)
 def user_registered_email(user_id):
 
-    user = User.objects.get(id=user_id)
+    user = get_or_primary(User.objects, id=user_id)
 
     msg_body = f"""
     Hello, {user.get_short_name()}!
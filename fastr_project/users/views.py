@@ -12,3 +12,4 @@ class UserCreateView(CreateAPIView):
     queryset = User.objects.all()
     serializer_class = RegisterUserSerializer
     permission_classes = (AllowAny,)
+    throttle_scope = 'dj_rest_auth'